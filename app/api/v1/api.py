@@ -1,7 +1,16 @@
 from fastapi import APIRouter
-from .endpoints import users, transactions, treasury
+from ...db import DB_ASYNC
+from .endpoints import users, transactions, treasury, ledger, system
 
 api_router = APIRouter()
-api_router.include_router(users.router, prefix="/users", tags=["users"])
-api_router.include_router(transactions.router, tags=["transactions"])
-api_router.include_router(treasury.router, prefix="/treasury", tags=["treasury"])
+if DB_ASYNC:
+    api_router.include_router(users.async_router, prefix="/users", tags=["users"])
+    api_router.include_router(transactions.async_router, tags=["transactions"])
+    api_router.include_router(treasury.async_router, prefix="/treasury", tags=["treasury"])
+    api_router.include_router(ledger.async_router, prefix="/ledger", tags=["ledger"])
+else:
+    api_router.include_router(users.router, prefix="/users", tags=["users"])
+    api_router.include_router(transactions.router, tags=["transactions"])
+    api_router.include_router(treasury.router, prefix="/treasury", tags=["treasury"])
+    api_router.include_router(ledger.router, prefix="/ledger", tags=["ledger"])
+api_router.include_router(system.router, prefix="/system", tags=["system"])
@@ -0,0 +1,83 @@
+from typing import Optional
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from ....db import AsyncSessionLocal, SessionLocal
+from ....responses import dumps
+from ....services.feed import feed_watermark, read_feed_page
+
+router = APIRouter()
+async_router = APIRouter()
+
+# Entries read per query; a consumer never has more than one page in memory.
+FEED_PAGE_SIZE = 1000
+# An idle event stream gets a comment this often, so proxies keep it open.
+KEEPALIVE_SECONDS = 15.0
+
+def load_feed_page(after: int, until: int, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        return read_feed_page(db, after, until, limit)
+    finally:
+        db.close()
+
+async def load_feed_page_async(after: int, until: int, limit: int) -> list:
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(read_feed_page, after, until, limit)
+
+async def _ndjson(load_page, after: int, limit: int, wait: float):
+    until = await feed_watermark.wait(after, wait) if wait else feed_watermark.current()
+    while limit > 0 and after < until:
+        page = await load_page(after, until, min(limit, FEED_PAGE_SIZE))
+        if not page:
+            return
+        for event in page:
+            yield dumps(event) + b"\n"
+        after = page[-1]["entryId"]
+        limit -= len(page)
+
+async def _event_stream(load_page, after: int):
+    while True:
+        until = await feed_watermark.wait(after, KEEPALIVE_SECONDS)
+        if until <= after:
+            yield b": keepalive\n\n"
+            continue
+        page = await load_page(after, until, FEED_PAGE_SIZE)
+        for event in page:
+            yield b"id: %d\ndata: %s\n\n" % (event["entryId"], dumps(event))
+        # A short page means nothing else is committed up to the watermark;
+        # the ids in between belonged to postings that rolled back.
+        after = page[-1]["entryId"] if len(page) == FEED_PAGE_SIZE else until
+
+def feed_response(request: Request, load_page, after: int, limit: int, wait: float, last_event_id: Optional[str]):
+    if "text/event-stream" in request.headers.get("accept", ""):
+        if last_event_id is not None and last_event_id.isdigit():
+            after = int(last_event_id)
+        return StreamingResponse(
+            _event_stream(load_page, after), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+        )
+    return StreamingResponse(_ndjson(load_page, after, limit, wait), media_type="application/x-ndjson")
+
+# Both routers serve the feed from async endpoints: consumers spend most of
+# their time waiting for new entries, which shouldn't hold a threadpool thread.
+@router.get("/feed")
+async def ledger_feed(
+    request: Request,
+    after: int = Query(0, ge=0),
+    limit: int = Query(10000, ge=1, le=100000),
+    wait: float = Query(0, ge=0, le=60),
+    last_event_id: Optional[str] = Header(None),
+):
+    return feed_response(
+        request, lambda *args: run_in_threadpool(load_feed_page, *args), after, limit, wait, last_event_id,
+    )
+
+@async_router.get("/feed")
+async def ledger_feed_async(
+    request: Request,
+    after: int = Query(0, ge=0),
+    limit: int = Query(10000, ge=1, le=100000),
+    wait: float = Query(0, ge=0, le=60),
+    last_event_id: Optional[str] = Header(None),
+):
+    return feed_response(request, load_feed_page_async, after, limit, wait, last_event_id)
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from ....schemas import system_schemas
+from ....services.admission import admission
+from ....services.balance_cache import user_balances
+from ....services.idempotency import completed_postings
+from ....services.refdata import reference_data
+from ....services.retry import posting_retries
+
+router = APIRouter()
+
+@router.get("/stats", response_model=system_schemas.SystemStatsResponse)
+def get_system_stats():
+    return {
+        "referenceData": reference_data.stats(),
+        "idempotency": completed_postings.stats(),
+        "userBalances": user_balances.stats(),
+        "admission": admission.stats(),
+        "postingRetries": posting_retries.stats(),
+    }
@@ -1,173 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-import logging
-import uuid
-from ....db import get_db
-from ....models import User, Account, Balance, AssetType, LedgerTransaction, LedgerEntry, TransactionType
+from ....db import get_async_db, get_db
+from ....models import TransactionType
 from ....schemas import transaction_schemas
+from ....services import ledger
+from ....services.admission import admit_posting
+from ....services.coalescer import async_posting_coalescer, posting_coalescer
+from ....services.retry import run_posting, run_posting_async
 
-logger = logging.getLogger(__name__)
 router = APIRouter()
+async_router = APIRouter()
 
-@router.post("/topup", response_model=transaction_schemas.TransactionResponse)
-def top_up_wallet(request: transaction_schemas.TopUpRequest, db: Session = Depends(get_db)):
-    scoped_key = f"user_{request.userId}:{request.idempotencyKey}"
-    existing_tx = db.query(LedgerTransaction).filter(LedgerTransaction.idempotency_key == scoped_key).first()
-    if existing_tx:
-        return {"transactionId": str(existing_tx.id), "status": "completed"}
-
-    asset = db.query(AssetType).filter(AssetType.code == request.assetCode).first()
-    if not asset:
-        raise HTTPException(status_code=400, detail="Invalid asset code")
-    
-    user_account = db.query(Account).filter(Account.user_id == request.userId, Account.asset_type_id == asset.id).first()
-    treasury_account = db.query(Account).filter(Account.system_name == "TREASURY", Account.asset_type_id == asset.id).first()
-    
-    if not user_account or not treasury_account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    account_ids = sorted([user_account.id, treasury_account.id])
-    balances = db.query(Balance).filter(Balance.account_id.in_(account_ids)).order_by(Balance.account_id).with_for_update().all()
-    if len(balances) != 2:
-        raise HTTPException(status_code=404, detail="Balance record not found")
-        
-    balance_map = {b.account_id: b for b in balances}
-    user_balance = balance_map[user_account.id]
-    treasury_balance = balance_map[treasury_account.id]
-    
-    if treasury_balance.balance < request.amount:
-        raise HTTPException(status_code=400, detail=f"Insufficient treasury funds")
-    
-    user_balance.balance += request.amount
-    treasury_balance.balance -= request.amount
-    
-    transaction_id = uuid.uuid4()
-    new_tx = LedgerTransaction(
-        id=transaction_id, type=TransactionType.TOPUP, idempotency_key=scoped_key,
-        asset_type_id=asset.id, amount=request.amount, from_account_id=treasury_account.id, to_account_id=user_account.id
+# Admission control runs as a route dependency, ahead of the session.
+admit_user = [Depends(admit_posting("userId"))]
+admit_transfer = [Depends(admit_posting("fromUserId", "toUserId"))]
+admit_batch = [Depends(admit_posting())]
+
+def post(db: Session, tx_type: TransactionType, request):
+    if posting_coalescer is not None:
+        return posting_coalescer.submit(tx_type, request)
+    return run_posting(
+        db, tx_type.value.lower(), ledger.post_user_transaction,
+        tx_type, request.userId, request.assetCode, request.amount, request.idempotencyKey,
     )
-    entries = [
-        LedgerEntry(account_id=treasury_account.id, amount=-request.amount), 
-        LedgerEntry(account_id=user_account.id, amount=request.amount)
-    ]
-    entries.sort(key=lambda e: e.account_id)
-    new_tx.entries.extend(entries)
-    
-    db.add(new_tx)
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.exception("Error during top-up")
-        raise HTTPException(status_code=500, detail=f"Transaction failed: {str(e)}")
-    
-    return {"transactionId": str(transaction_id), "status": "completed"}
-
-@router.post("/spend", response_model=transaction_schemas.TransactionResponse)
-def spend_credits(request: transaction_schemas.SpendRequest, db: Session = Depends(get_db)):
-    scoped_key = f"user_{request.userId}:{request.idempotencyKey}"
-    existing_tx = db.query(LedgerTransaction).filter(LedgerTransaction.idempotency_key == scoped_key).first()
-    if existing_tx:
-        return {"transactionId": str(existing_tx.id), "status": "completed"}
-
-    asset = db.query(AssetType).filter(AssetType.code == request.assetCode).first()
-    if not asset:
-        raise HTTPException(status_code=400, detail="Invalid asset code")
-    
-    user_account = db.query(Account).filter(Account.user_id == request.userId, Account.asset_type_id == asset.id).first()
-    treasury_account = db.query(Account).filter(Account.system_name == "TREASURY", Account.asset_type_id == asset.id).first()
-    
-    if not user_account or not treasury_account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    account_ids = sorted([user_account.id, treasury_account.id])
-    balances = db.query(Balance).filter(Balance.account_id.in_(account_ids)).order_by(Balance.account_id).with_for_update().all()
-    if len(balances) != 2:
-        raise HTTPException(status_code=404, detail="Balance record not found")
-        
-    balance_map = {b.account_id: b for b in balances}
-    user_balance = balance_map[user_account.id]
-    treasury_balance = balance_map[treasury_account.id]
-    
-    if user_balance.balance < request.amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    user_balance.balance -= request.amount
-    treasury_balance.balance += request.amount
-    
-    transaction_id = uuid.uuid4()
-    new_tx = LedgerTransaction(
-        id=transaction_id, type=TransactionType.SPEND, idempotency_key=scoped_key,
-        asset_type_id=asset.id, amount=request.amount, from_account_id=user_account.id, to_account_id=treasury_account.id
+
+async def post_async(db: AsyncSession, tx_type: TransactionType, request):
+    if async_posting_coalescer is not None:
+        return await async_posting_coalescer.submit(tx_type, request)
+    return await run_posting_async(
+        db, tx_type.value.lower(), ledger.post_user_transaction,
+        tx_type, request.userId, request.assetCode, request.amount, request.idempotencyKey,
     )
-    entries = [
-        LedgerEntry(account_id=user_account.id, amount=-request.amount), 
-        LedgerEntry(account_id=treasury_account.id, amount=request.amount)
-    ]
-    entries.sort(key=lambda e: e.account_id)
-    new_tx.entries.extend(entries)
-    
-    db.add(new_tx)
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.exception("Error during spend")
-        raise HTTPException(status_code=500, detail=f"Transaction failed: {str(e)}")
-    
-    return {"transactionId": str(transaction_id), "status": "completed"}
-
-@router.post("/bonus", response_model=transaction_schemas.TransactionResponse)
+
+def posting_response(transaction_id: str, token) -> dict:
+    return {"transactionId": transaction_id, "status": "completed", "consistencyToken": token}
+
+def batch_response(results: list) -> dict:
+    counts = {"completed": 0, "duplicate": 0, "failed": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "completed": counts["completed"], "duplicates": counts["duplicate"], "failed": counts["failed"],
+        "results": results,
+    }
+
+@router.post("/topup", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
+def top_up_wallet(request: transaction_schemas.TopUpRequest, db: Session = Depends(get_db)):
+    return posting_response(*post(db, TransactionType.TOPUP, request))
+
+@router.post("/spend", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
+def spend_credits(request: transaction_schemas.SpendRequest, db: Session = Depends(get_db)):
+    return posting_response(*post(db, TransactionType.SPEND, request))
+
+@router.post("/bonus", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
 def issue_bonus(request: transaction_schemas.BonusRequest, db: Session = Depends(get_db)):
-    scoped_key = f"user_{request.userId}:{request.idempotencyKey}"
-    existing_tx = db.query(LedgerTransaction).filter(LedgerTransaction.idempotency_key == scoped_key).first()
-    if existing_tx:
-        return {"transactionId": str(existing_tx.id), "status": "completed"}
-
-    asset = db.query(AssetType).filter(AssetType.code == request.assetCode).first()
-    if not asset:
-        raise HTTPException(status_code=400, detail="Invalid asset code")
-    
-    user_account = db.query(Account).filter(Account.user_id == request.userId, Account.asset_type_id == asset.id).first()
-    treasury_account = db.query(Account).filter(Account.system_name == "TREASURY", Account.asset_type_id == asset.id).first()
-    
-    if not user_account or not treasury_account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    account_ids = sorted([user_account.id, treasury_account.id])
-    balances = db.query(Balance).filter(Balance.account_id.in_(account_ids)).order_by(Balance.account_id).with_for_update().all()
-    if len(balances) != 2:
-        raise HTTPException(status_code=404, detail="Balance record not found")
-        
-    balance_map = {b.account_id: b for b in balances}
-    user_balance = balance_map[user_account.id]
-    treasury_balance = balance_map[treasury_account.id]
-    
-    if treasury_balance.balance < request.amount:
-        raise HTTPException(status_code=400, detail="Insufficient treasury funds")
-    
-    user_balance.balance += request.amount
-    treasury_balance.balance -= request.amount
-    
-    transaction_id = uuid.uuid4()
-    new_tx = LedgerTransaction(
-        id=transaction_id, type=TransactionType.BONUS, idempotency_key=scoped_key,
-        asset_type_id=asset.id, amount=request.amount, from_account_id=treasury_account.id, to_account_id=user_account.id
-    )
-    entries = [
-        LedgerEntry(account_id=treasury_account.id, amount=-request.amount),
-        LedgerEntry(account_id=user_account.id, amount=request.amount)
-    ]
-    entries.sort(key=lambda e: e.account_id)
-    new_tx.entries.extend(entries)
-    
-    db.add(new_tx)
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.exception("Error during bonus issuance")
-        raise HTTPException(status_code=500, detail=f"Transaction failed: {str(e)}")
-    
-    return {"transactionId": str(transaction_id), "status": "completed"}
+    return posting_response(*post(db, TransactionType.BONUS, request))
+
+@router.post("/transfer", response_model=transaction_schemas.TransactionResponse, dependencies=admit_transfer)
+def transfer(request: transaction_schemas.TransferRequest, db: Session = Depends(get_db)):
+    return posting_response(*run_posting(
+        db, "transfer", ledger.post_transfer,
+        request.fromUserId, request.toUserId, request.assetCode, request.amount, request.fee, request.idempotencyKey,
+    ))
+
+@router.post("/topup/batch", response_model=transaction_schemas.BatchResponse, dependencies=admit_batch)
+def top_up_wallet_batch(request: transaction_schemas.TopUpBatchRequest, db: Session = Depends(get_db)):
+    return batch_response(run_posting(db, "batch", ledger.post_batch, TransactionType.TOPUP, request.items))
+
+@router.post("/bonus/batch", response_model=transaction_schemas.BatchResponse, dependencies=admit_batch)
+def issue_bonus_batch(request: transaction_schemas.BonusBatchRequest, db: Session = Depends(get_db)):
+    return batch_response(run_posting(db, "batch", ledger.post_batch, TransactionType.BONUS, request.items))
+
+# The async endpoints run the same posting code on the AsyncSession's
+# connection via run_sync (or through the async coalescer), so both modes
+# share one implementation. Either way postings go through the retry runner
+# (services/retry.py).
+
+@async_router.post("/topup", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
+async def top_up_wallet_async(request: transaction_schemas.TopUpRequest, db: AsyncSession = Depends(get_async_db)):
+    return posting_response(*await post_async(db, TransactionType.TOPUP, request))
+
+@async_router.post("/spend", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
+async def spend_credits_async(request: transaction_schemas.SpendRequest, db: AsyncSession = Depends(get_async_db)):
+    return posting_response(*await post_async(db, TransactionType.SPEND, request))
+
+@async_router.post("/bonus", response_model=transaction_schemas.TransactionResponse, dependencies=admit_user)
+async def issue_bonus_async(request: transaction_schemas.BonusRequest, db: AsyncSession = Depends(get_async_db)):
+    return posting_response(*await post_async(db, TransactionType.BONUS, request))
+
+@async_router.post("/transfer", response_model=transaction_schemas.TransactionResponse, dependencies=admit_transfer)
+async def transfer_async(request: transaction_schemas.TransferRequest, db: AsyncSession = Depends(get_async_db)):
+    return posting_response(*await run_posting_async(
+        db, "transfer", ledger.post_transfer,
+        request.fromUserId, request.toUserId, request.assetCode, request.amount, request.fee, request.idempotencyKey,
+    ))
+
+@async_router.post("/topup/batch", response_model=transaction_schemas.BatchResponse, dependencies=admit_batch)
+async def top_up_wallet_batch_async(request: transaction_schemas.TopUpBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    return batch_response(await run_posting_async(db, "batch", ledger.post_batch, TransactionType.TOPUP, request.items))
+
+@async_router.post("/bonus/batch", response_model=transaction_schemas.BatchResponse, dependencies=admit_batch)
+async def issue_bonus_batch_async(request: transaction_schemas.BonusBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    return batch_response(await run_posting_async(db, "batch", ledger.post_batch, TransactionType.BONUS, request.items))
@@ -1,19 +1,31 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import BigInteger, cast, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ....db import get_db
-from ....models import Account, AssetType, Balance
+from ....models import Account, AssetType, Balance, OwnerType
 from ....schemas import system_schemas
+from ....services.replica import get_async_read_db, get_read_db
 
 router = APIRouter()
+async_router = APIRouter()
 
-@router.get("/balances", response_model=system_schemas.SystemBalancesResponse)
-def get_treasury_balances(db: Session = Depends(get_db)):
+def load_treasury_balances(db: Session):
+    # The treasury is split into shard accounts; report the total per asset.
     results = (
-        db.query(AssetType.code, Balance.balance)
+        db.query(AssetType.code, cast(func.sum(Balance.balance), BigInteger).label("balance"))
         .join(Account, Account.asset_type_id == AssetType.id)
         .join(Balance, Balance.account_id == Account.id)
-        .filter(Account.system_name == "TREASURY")
+        .filter(Account.owner_type == OwnerType.SYSTEM, Account.system_name == "TREASURY")
+        .group_by(AssetType.code)
         .all()
     )
     balances = [{"asset": row.code, "balance": row.balance} for row in results]
     return {"systemName": "TREASURY", "balances": balances}
+
+@router.get("/balances", response_model=system_schemas.SystemBalancesResponse)
+def get_treasury_balances(db: Session = Depends(get_read_db)):
+    return load_treasury_balances(db)
+
+@async_router.get("/balances", response_model=system_schemas.SystemBalancesResponse)
+async def get_treasury_balances_async(db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(load_treasury_balances)
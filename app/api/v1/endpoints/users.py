@@ -1,59 +1,237 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ....db import get_db
-from ....models import User, Account, AssetType, Balance, LedgerTransaction
+from ....models import User, Account, AssetType, Balance, OwnerType, TransactionType
+from ....responses import compact_json, dumps
 from ....schemas import user_schemas
+from ....services import history, snapshots
+from ....services.balance_cache import parse_consistency_token, user_balances
+from ....services.refdata import reference_data
+from ....services.replica import get_async_read_db, get_read_db
 
 router = APIRouter()
+async_router = APIRouter()
 
-@router.get("/{user_id}/balances", response_model=user_schemas.UserBalancesResponse)
-def get_user_balances(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+def _min_version(consistency_token: Optional[str]):
+    if consistency_token is None:
+        return None
+    try:
+        return parse_consistency_token(consistency_token)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid consistency token")
+
+def _require_user(db: Session, user_id: int):
+    if db.execute(select(User.id).where(User.id == user_id)).first() is None:
         raise HTTPException(status_code=404, detail="User not found")
+
+def load_user_balances(db: Session, user_id: int):
+    # Taken before reading, so a change committed while we read keeps the
+    # result out of the cache.
+    generation = user_balances.generation()
+    # The replica may not have replayed a change whose invalidation we
+    # already got, so what it returns isn't cached.
+    cache = not db.info.get("replica")
+    _require_user(db, user_id)
     
-    all_assets = db.query(AssetType).all()
-    user_balances = (
-        db.query(AssetType.code, Balance.balance)
+    asset_codes = reference_data.asset_codes()
+    rows = db.execute(
+        select(AssetType.code, Balance.account_id, Balance.balance, Balance.version)
         .join(Account, Account.asset_type_id == AssetType.id)
         .join(Balance, Balance.account_id == Account.id)
-        .filter(Account.user_id == user_id)
-        .all()
-    )
+        .where(Account.owner_type == OwnerType.USER, Account.user_id == user_id)
+    ).all()
     
-    balance_map = {row.code: row.balance for row in user_balances}
-    final_balances = [{"asset": a.code, "balance": balance_map.get(a.code, 0)} for a in all_assets]
+    balance_map = {code: balance for code, _, balance, _ in rows}
+    final_balances = [{"asset": code, "balance": balance_map.get(code, 0)} for code in asset_codes]
     
-    return {"userId": user_id, "balances": final_balances}
+    response = {"userId": user_id, "balances": final_balances}
+    if cache:
+        user_balances.put(user_id, response, {account_id: version for _, account_id, _, version in rows}, generation)
+    return response
 
-@router.get("/{user_id}/transactions", response_model=user_schemas.TransactionHistoryResponse)
-def get_user_transaction_history(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user_account_ids = [acc.id for acc in db.query(Account.id).filter(Account.user_id == user_id).all()]
-    if not user_account_ids:
-        return {"userId": user_id, "transactions": []}
-    
-    transactions = (
-        db.query(LedgerTransaction)
-        .join(AssetType, AssetType.id == LedgerTransaction.asset_type_id)
-        .filter(
-            (LedgerTransaction.from_account_id.in_(user_account_ids)) |
-            (LedgerTransaction.to_account_id.in_(user_account_ids))
-        )
-        .order_by(LedgerTransaction.created_at.desc())
+def _utc(moment: datetime) -> datetime:
+    # Timestamps without an offset are taken as UTC.
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+def load_user_balances_as_of(db: Session, user_id: int, as_of: datetime):
+    _require_user(db, user_id)
+
+    accounts = (
+        db.query(Account.id, AssetType.code)
+        .join(AssetType, AssetType.id == Account.asset_type_id)
+        .filter(Account.owner_type == OwnerType.USER, Account.user_id == user_id)
         .all()
     )
-    
-    history = [{
-        "id": str(tx.id),
-        "type": tx.type.value if hasattr(tx.type, 'value') else tx.type,
-        "assetCode": tx.asset_type.code,
-        "amount": tx.amount,
-        "status": "completed",
-        "createdAt": tx.created_at.isoformat()
-    } for tx in transactions]
-        
-    return {"userId": user_id, "transactions": history}
+    balances = snapshots.balances_as_of(db, [acc.id for acc in accounts], as_of) if accounts else {}
+    balance_map = {acc.code: balances[acc.id] for acc in accounts}
+    final_balances = [{"asset": code, "balance": balance_map.get(code, 0)} for code in reference_data.asset_codes()]
+    return {"userId": user_id, "balances": final_balances, "asOf": as_of.isoformat()}
+
+# The read endpoints below keep their response_model for the OpenAPI schema,
+# but return compact_json responses, which FastAPI sends as they are.
+@router.get("/{user_id}/balances", response_model=user_schemas.UserBalancesResponse)
+def get_user_balances(request: Request, user_id: int,
+                      consistency_token: Optional[str] = Query(None, alias="consistencyToken"),
+                      as_of: Optional[datetime] = Query(None, alias="asOf"), db: Session = Depends(get_read_db)):
+    if as_of is not None:
+        return compact_json(request, load_user_balances_as_of(db, user_id, _utc(as_of)))
+    cached = user_balances.get(user_id, _min_version(consistency_token))
+    if cached is not None:
+        return compact_json(request, cached)
+    return compact_json(request, load_user_balances(db, user_id))
+
+@async_router.get("/{user_id}/balances", response_model=user_schemas.UserBalancesResponse)
+async def get_user_balances_async(request: Request, user_id: int,
+                                  consistency_token: Optional[str] = Query(None, alias="consistencyToken"),
+                                  as_of: Optional[datetime] = Query(None, alias="asOf"),
+                                  db: AsyncSession = Depends(get_async_read_db)):
+    if as_of is not None:
+        return compact_json(request, await db.run_sync(load_user_balances_as_of, user_id, _utc(as_of)))
+    cached = user_balances.get(user_id, _min_version(consistency_token))
+    if cached is not None:
+        return compact_json(request, cached)
+    return compact_json(request, await db.run_sync(load_user_balances, user_id))
+
+def _statement_period(month: str):
+    try:
+        start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month, expected YYYY-MM")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start, end
+
+def load_statement(db: Session, user_id: int, asset: str, month: str):
+    start, end = _statement_period(month)
+    # One snapshot of the database for the opening balance and the entries.
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    asset_type_id = reference_data.asset_id(asset)
+    if asset_type_id is None:
+        raise HTTPException(status_code=400, detail="Invalid asset code")
+    account = (
+        db.query(Account.id)
+        .filter(Account.owner_type == OwnerType.USER, Account.user_id == user_id, Account.asset_type_id == asset_type_id)
+        .first()
+    )
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    statement = snapshots.account_statement(db, account.id, start, end)
+    return {
+        "userId": user_id, "asset": asset, "periodStart": start.isoformat(), "periodEnd": end.isoformat(),
+        **statement,
+    }
+
+@router.get("/{user_id}/statement", response_model=user_schemas.StatementResponse)
+def get_user_statement(request: Request, user_id: int, asset: str,
+                       month: str = Query(..., description="YYYY-MM (UTC)"), db: Session = Depends(get_read_db)):
+    return compact_json(request, load_statement(db, user_id, asset, month))
+
+@async_router.get("/{user_id}/statement", response_model=user_schemas.StatementResponse)
+async def get_user_statement_async(request: Request, user_id: int, asset: str,
+                                   month: str = Query(..., description="YYYY-MM (UTC)"),
+                                   db: AsyncSession = Depends(get_async_read_db)):
+    return compact_json(request, await db.run_sync(load_statement, user_id, asset, month))
+
+def _history_account_ids(db: Session, user_id: int, asset: Optional[str]):
+    _require_user(db, user_id)
+
+    query = db.query(Account.id).filter(Account.owner_type == OwnerType.USER, Account.user_id == user_id)
+    if asset is not None:
+        asset_type_id = reference_data.asset_id(asset)
+        if asset_type_id is None:
+            raise HTTPException(status_code=400, detail="Invalid asset code")
+        query = query.filter(Account.asset_type_id == asset_type_id)
+    return [acc.id for acc in query.all()]
+
+def load_transaction_history(db: Session, user_id: int, limit: int, cursor: Optional[str],
+                             asset: Optional[str], tx_type: Optional[TransactionType]):
+    user_account_ids = _history_account_ids(db, user_id, asset)
+    if not user_account_ids:
+        return {"userId": user_id, "transactions": [], "nextCursor": None}
+
+    after = history.decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to know whether there is another page.
+    rows = db.execute(history.history_query(user_account_ids, tx_type, after, limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = history.encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return {"userId": user_id, "transactions": [history.to_detail(row) for row in rows], "nextCursor": next_cursor}
+
+@router.get("/{user_id}/transactions", response_model=user_schemas.TransactionHistoryResponse)
+def get_user_transaction_history(
+    request: Request,
+    user_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    asset: Optional[str] = None,
+    tx_type: Optional[TransactionType] = Query(None, alias="type"),
+    db: Session = Depends(get_read_db),
+):
+    return compact_json(request, load_transaction_history(db, user_id, limit, cursor, asset, tx_type))
+
+@async_router.get("/{user_id}/transactions", response_model=user_schemas.TransactionHistoryResponse)
+async def get_user_transaction_history_async(
+    request: Request,
+    user_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    asset: Optional[str] = None,
+    tx_type: Optional[TransactionType] = Query(None, alias="type"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return compact_json(request, await db.run_sync(load_transaction_history, user_id, limit, cursor, asset, tx_type))
+
+@router.get("/{user_id}/transactions/export")
+def export_user_transaction_history(
+    user_id: int,
+    asset: Optional[str] = None,
+    tx_type: Optional[TransactionType] = Query(None, alias="type"),
+    db: Session = Depends(get_read_db),
+):
+    user_account_ids = _history_account_ids(db, user_id, asset)
+    query = history.history_query(user_account_ids, tx_type) if user_account_ids else None
+    bind = db.get_bind()
+
+    def rows():
+        if query is None:
+            return
+        # The request session is closed once the response starts, so the
+        # stream gets its own session, on the same database, and a
+        # server-side cursor.
+        export_db = Session(bind=bind)
+        try:
+            result = export_db.execute(query, execution_options={"stream_results": True, "yield_per": 1000})
+            for row in result:
+                yield dumps(history.to_detail(row)) + b"\n"
+        finally:
+            export_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@async_router.get("/{user_id}/transactions/export")
+async def export_user_transaction_history_async(
+    user_id: int,
+    asset: Optional[str] = None,
+    tx_type: Optional[TransactionType] = Query(None, alias="type"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    user_account_ids = await db.run_sync(_history_account_ids, user_id, asset)
+    query = history.history_query(user_account_ids, tx_type) if user_account_ids else None
+    bind = db.bind
+
+    async def rows():
+        if query is None:
+            return
+        async with AsyncSession(bind) as export_db:
+            result = await export_db.stream(query, execution_options={"yield_per": 1000})
+            async for row in result:
+                yield dumps(history.to_detail(row)) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
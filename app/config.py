@@ -0,0 +1,100 @@
+import os
+
+# Number of TREASURY sub-accounts per asset. Postings are spread across the
+# shards so that concurrent writes don't all queue behind one balance row lock.
+TREASURY_SHARDS = max(1, int(os.getenv("TREASURY_SHARDS", "1")))
+
+# Asset types and system accounts are cached in-process and reloaded after
+# this many seconds, or sooner when Postgres sends a change notification.
+REFERENCE_DATA_TTL_SECONDS = float(os.getenv("REFERENCE_DATA_TTL_SECONDS", "300"))
+
+# Start a LISTEN connection for cross-worker cache invalidation.
+LISTEN_NOTIFY_ENABLED = os.getenv("LISTEN_NOTIFY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# How many recently completed idempotency keys each worker remembers, so that
+# client retries are answered without a database round trip.
+IDEMPOTENCY_CACHE_SIZE = max(0, int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")))
+
+# Per-worker cache of user balances. Entries are dropped on change
+# notifications; the TTL only bounds staleness if a notification is missed.
+BALANCE_CACHE_SIZE = max(0, int(os.getenv("BALANCE_CACHE_SIZE", "100000")))
+BALANCE_CACHE_TTL_SECONDS = float(os.getenv("BALANCE_CACHE_TTL_SECONDS", "30"))
+
+# Opt-in coalescing of single topup/spend/bonus requests: requests of the same
+# type arriving within this many milliseconds are posted as one batch, with
+# one lock acquisition and one commit. 0 disables it.
+COALESCE_WINDOW_MS = max(0.0, float(os.getenv("COALESCE_WINDOW_MS", "0")))
+COALESCE_MAX_ITEMS = max(1, int(os.getenv("COALESCE_MAX_ITEMS", "500")))
+
+# The ledger tables are partitioned by month. Each worker creates partitions
+# this many months ahead on startup and then every
+# LEDGER_PARTITION_CHECK_SECONDS.
+LEDGER_PARTITION_MONTHS_AHEAD = max(1, int(os.getenv("LEDGER_PARTITION_MONTHS_AHEAD", "3")))
+LEDGER_PARTITION_CHECK_SECONDS = float(os.getenv("LEDGER_PARTITION_CHECK_SECONDS", "86400"))
+
+# Balance snapshots are taken this many seconds in the past, so that postings
+# still in flight when the snapshot job runs can't commit entries dated
+# before it.
+BALANCE_SNAPSHOT_SAFETY_SECONDS = float(os.getenv("BALANCE_SNAPSHOT_SAFETY_SECONDS", "60"))
+
+# Reads go to the replica (READ_DATABASE_URL) only while its replication lag
+# is at most this many seconds, measured every REPLICA_CHECK_SECONDS; a
+# consistency token from a posting the replica hasn't replayed yet sends the
+# read to the primary regardless.
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "1"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "0.5"))
+
+# The ledger feed serves entries up to a watermark that each worker advances
+# on every ledger_entries_added notification, and at least this often.
+LEDGER_FEED_POLL_SECONDS = float(os.getenv("LEDGER_FEED_POLL_SECONDS", "1"))
+
+# Admission control in front of the posting endpoints, per worker; 0 turns a
+# limit off. Over a token bucket, a request gets 429: each user has one per
+# route (refilling at RATE_LIMIT_USER_PER_SECOND up to RATE_LIMIT_USER_BURST)
+# and each route one for all users. At most ADMISSION_MAX_IN_FLIGHT_PER_USER
+# postings per user run at once; up to ADMISSION_MAX_QUEUED_PER_USER more wait
+# for up to ADMISSION_QUEUE_TIMEOUT_SECONDS, without holding a connection, and
+# the rest get 503.
+RATE_LIMIT_USER_PER_SECOND = max(0.0, float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "0")))
+RATE_LIMIT_USER_BURST = max(1.0, float(os.getenv("RATE_LIMIT_USER_BURST", "20")))
+RATE_LIMIT_ROUTE_PER_SECOND = max(0.0, float(os.getenv("RATE_LIMIT_ROUTE_PER_SECOND", "0")))
+RATE_LIMIT_MAX_KEYS = max(1, int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+ADMISSION_MAX_IN_FLIGHT_PER_USER = max(0, int(os.getenv("ADMISSION_MAX_IN_FLIGHT_PER_USER", "0")))
+ADMISSION_MAX_QUEUED_PER_USER = max(0, int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "16")))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "1"))
+
+# JSON bodies from the read endpoints of at least this many bytes are
+# compressed (br or gzip, as the client's Accept-Encoding allows); 0 turns
+# compression off.
+RESPONSE_COMPRESS_MIN_BYTES = max(0, int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024")))
+
+# Postings that fail with a deadlock (40P01), a serialization failure (40001)
+# or a lock timeout (55P03) are run again, up to POSTING_MAX_ATTEMPTS times in
+# all, after a random backoff of up to POSTING_RETRY_BASE_MS doubling per
+# attempt (capped at POSTING_RETRY_MAX_MS). Idempotency keys make this safe.
+POSTING_MAX_ATTEMPTS = max(1, int(os.getenv("POSTING_MAX_ATTEMPTS", "3")))
+POSTING_RETRY_BASE_MS = max(0.0, float(os.getenv("POSTING_RETRY_BASE_MS", "5")))
+POSTING_RETRY_MAX_MS = max(0.0, float(os.getenv("POSTING_RETRY_MAX_MS", "100")))
+
+# lock_timeout and statement_timeout for every transaction a posting runs, in
+# milliseconds; 0 leaves the server's setting alone. A route overrides either
+# with a suffix: POSTING_LOCK_TIMEOUT_MS_TRANSFER=500.
+POSTING_ROUTES = ("topup", "spend", "bonus", "transfer", "batch")
+POSTING_LOCK_TIMEOUT_MS = {
+    route: max(0, int(os.getenv(f"POSTING_LOCK_TIMEOUT_MS_{route.upper()}", os.getenv("POSTING_LOCK_TIMEOUT_MS", "0"))))
+    for route in POSTING_ROUTES
+}
+POSTING_STATEMENT_TIMEOUT_MS = {
+    route: max(0, int(os.getenv(f"POSTING_STATEMENT_TIMEOUT_MS_{route.upper()}", os.getenv("POSTING_STATEMENT_TIMEOUT_MS", "0"))))
+    for route in POSTING_ROUTES
+}
+
+# Run postings under SERIALIZABLE instead of READ COMMITTED. Postings lock
+# their rows either way; this adds Postgres' own conflict detection, at the
+# cost of more retries under contention.
+POSTING_SERIALIZABLE = os.getenv("POSTING_SERIALIZABLE", "false").lower() in ("1", "true", "yes")
+
+# With several treasury shards, a topup, bonus or spend whose own shard is
+# locked by another posting takes any unlocked shard that can cover it
+# (SELECT ... FOR UPDATE SKIP LOCKED) instead of queuing.
+TREASURY_SKIP_LOCKED = os.getenv("TREASURY_SKIP_LOCKED", "false").lower() in ("1", "true", "yes")
@@ -1,20 +1,56 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .metrics import TimedAsyncQueuePool, TimedQueuePool, instrument_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:pass@db:5432/db")
 
+# "sync" serves requests from FastAPI's threadpool with psycopg2; "async" uses
+# async endpoints on top of asyncpg, so a request waiting on a row lock
+# doesn't tie up a thread.
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+DB_ASYNC = DB_MODE == "async"
+
+# Optional streaming replica for the read-only endpoints (balances, history,
+# treasury). Unset, every read goes to the primary.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+
 # In a high concurrency environment, we need a larger connection pool
 # default is pool_size=5, max_overflow=10. For locust we use much higher limits.
+# In async mode requests use the async engines below, and the sync ones only
+# serve background threads (feed watermark, reference data refresh, replica
+# checks) and startup work, so they get a few connections.
+_sync_pool_size, _sync_max_overflow = (2, 3) if DB_ASYNC else (50, 100)
 engine = create_engine(
-    DATABASE_URL, 
-    pool_size=50, 
-    max_overflow=100,
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_logging_name="primary",
+    pool_size=_sync_pool_size,
+    max_overflow=_sync_max_overflow,
     pool_timeout=30
 )
+instrument_engine(engine, "primary", capacity=_sync_pool_size + _sync_max_overflow)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The replica gets its own pool, so reads never wait behind postings for a
+# primary connection.
+read_engine = None
+ReadSessionLocal = SessionLocal
+if READ_DATABASE_URL:
+    read_engine = create_engine(
+        READ_DATABASE_URL,
+        poolclass=TimedQueuePool,
+        pool_logging_name="replica",
+        pool_size=_sync_pool_size,
+        max_overflow=_sync_max_overflow,
+        pool_timeout=30
+    )
+    instrument_engine(read_engine, "replica", capacity=_sync_pool_size + _sync_max_overflow)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -23,3 +59,52 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def _async_url(url: str):
+    # asyncpg takes `ssl` rather than libpq's `sslmode`.
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    if "sslmode" in async_url.query:
+        connect_args["ssl"] = async_url.query["sslmode"]
+        async_url = async_url.difference_update_query(["sslmode"])
+    return async_url, connect_args
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    _url, _connect_args = _async_url(DATABASE_URL)
+    # Requests no longer hold a thread while they wait, so far fewer
+    # connections are needed for the same number of requests in flight.
+    _async_pool_size = int(os.getenv("ASYNC_POOL_SIZE", "20"))
+    _async_max_overflow = int(os.getenv("ASYNC_MAX_OVERFLOW", "20"))
+    async_engine = create_async_engine(
+        _url,
+        connect_args=_connect_args,
+        poolclass=TimedAsyncQueuePool,
+        pool_logging_name="async",
+        pool_size=_async_pool_size,
+        max_overflow=_async_max_overflow,
+        pool_timeout=30
+    )
+    instrument_engine(async_engine.sync_engine, "async", capacity=_async_pool_size + _async_max_overflow)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async_read_engine = None
+AsyncReadSessionLocal = AsyncSessionLocal
+if DB_ASYNC and READ_DATABASE_URL:
+    _url, _connect_args = _async_url(READ_DATABASE_URL)
+    async_read_engine = create_async_engine(
+        _url,
+        connect_args=_connect_args,
+        poolclass=TimedAsyncQueuePool,
+        pool_logging_name="async_replica",
+        pool_size=_async_pool_size,
+        max_overflow=_async_max_overflow,
+        pool_timeout=30
+    )
+    instrument_engine(async_read_engine.sync_engine, "async_replica", capacity=_async_pool_size + _async_max_overflow)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,10 +1,43 @@
-from fastapi import FastAPI, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from .db import get_db
 from .api.v1.api import api_router
+from .config import LISTEN_NOTIFY_ENABLED
+from .metrics import MetricsMiddleware, metrics_response
+from .services.balance_cache import BALANCES_CHANNEL, user_balances
+from .services.feed import FEED_CHANNEL, feed_watermark
+from .services.ledger import LedgerError
+from .services.notifications import listener
+from .services.partitions import partition_maintainer
+from .services.replica import replica_monitor
+from .services.refdata import REFERENCE_DATA_CHANNEL, reference_data, warm_reference_data
 
-app = FastAPI(title="Wallet Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_reference_data()
+    partition_maintainer.start()
+    replica_monitor.start()
+    feed_watermark.start()
+    if LISTEN_NOTIFY_ENABLED:
+        listener.subscribe(REFERENCE_DATA_CHANNEL, reference_data.invalidate)
+        listener.subscribe(BALANCES_CHANNEL, user_balances.handle_notification)
+        listener.subscribe(FEED_CHANNEL, feed_watermark.handle_notification)
+        listener.start()
+    yield
+    listener.stop()
+    feed_watermark.stop()
+    replica_monitor.stop()
+    partition_maintainer.stop()
+
+app = FastAPI(title="Wallet Service", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(LedgerError)
+def ledger_error_handler(request: Request, exc: LedgerError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
 
 @app.get("/")
 def welcome():
@@ -15,12 +48,20 @@ def welcome():
         "endpoints": {
             "/": "Overview of all available routes.",
             "/health": "Check API and Database status.",
-            "/v1/users/{id}/balances": "Get current balances for a user.",
-            "/v1/users/{id}/transactions": "Get transaction history for a user.",
+            "/metrics": "Prometheus metrics.",
+            "/v1/users/{id}/balances": "Get current balances for a user (or as of a time with ?asOf=).",
+            "/v1/users/{id}/statement": "Monthly account statement for one asset.",
+            "/v1/users/{id}/transactions": "Get transaction history for a user (paginated).",
+            "/v1/users/{id}/transactions/export": "Stream a user's full transaction history as NDJSON.",
             "/v1/topup": "Add funds to a user wallet.",
             "/v1/spend": "Deduct funds from a user wallet.",
             "/v1/bonus": "Issue bonus funds to a user.",
-            "/v1/treasury/balances": "Check system treasury status."
+            "/v1/transfer": "Send funds to another user, with an optional fee.",
+            "/v1/topup/batch": "Top up many wallets in one call.",
+            "/v1/bonus/batch": "Issue bonuses to many users in one call.",
+            "/v1/treasury/balances": "Check system treasury status.",
+            "/v1/ledger/feed": "Tail ledger entries as NDJSON, or as server-sent events.",
+            "/v1/system/stats": "In-process cache statistics."
         },
         "rationale": "Built with a double-entry ledger and pessimistic locking for high-concurrency safety."
     }
@@ -33,4 +74,8 @@ def health_check(db: Session = Depends(get_db)):
     except Exception as e:
         return {"status": "error", "details": str(e)}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
 app.include_router(api_router, prefix="/v1")
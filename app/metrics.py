@@ -0,0 +1,187 @@
+import time
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.responses import Response
+
+# Metrics are per process; run one scrape target per uvicorn worker.
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.",
+    ["method", "route", "status"],
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL statements per request.",
+    ["method", "route"],
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "SQL statements executed per request.",
+    ["method", "route"], buckets=(1, 2, 3, 4, 5, 8, 13, 21, 50, 100),
+)
+LOCK_STATEMENT_TIME = Histogram(
+    "db_lock_statement_seconds",
+    "Duration of SELECT ... FOR UPDATE statements, which is mostly time spent waiting for row locks.",
+    ["engine"],
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool.",
+    ["engine"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POOL_IN_USE = Gauge("db_pool_connections_in_use", "Connections currently checked out.", ["engine"])
+POOL_CAPACITY = Gauge("db_pool_connections_max", "pool_size + max_overflow.", ["engine"])
+POOL_SATURATION = Gauge("db_pool_saturation_ratio", "Checked-out connections over pool capacity.", ["engine"])
+COALESCED_BATCH_SIZE = Histogram(
+    "ledger_coalesced_batch_items", "Requests posted together by the request coalescer.",
+    ["type"], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+READS_ROUTED = Counter(
+    "db_reads_routed_total", "Read-only requests by the database that served them.", ["target"],
+)
+REPLICA_LAG = Gauge("db_replica_lag_seconds", "Replication lag of the read replica at the last check.")
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Postings turned away by admission control, by route and limit.",
+    ["route", "reason"],
+)
+POSTING_FAILURES = Counter(
+    "ledger_posting_failures_total", "Postings that were rejected or failed to commit, by reason.",
+    ["reason"],
+)
+POSTING_RETRIES = Counter(
+    "ledger_posting_retries_total", "Postings run again after a transient conflict, by route and reason.",
+    ["route", "reason"],
+)
+
+class RequestStats:
+    __slots__ = ("db_time", "statements")
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.statements = 0
+
+# Set by the middleware for the duration of a request. FastAPI copies the
+# context into the threadpool for sync endpoints, so engine events fired there
+# still update the request's stats.
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+class _TimedPoolMixin:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.logging_name or "default").observe(time.perf_counter() - start)
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def instrument_engine(engine, name: str, capacity: int):
+    """Attach statement timing and pool gauges to a (sync) Engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_time += elapsed
+            stats.statements += 1
+        if "FOR UPDATE" in statement:
+            LOCK_STATEMENT_TIME.labels(name).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # Statements that failed never reach after_cursor_execute.
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    POOL_CAPACITY.labels(name).set(capacity)
+    POOL_IN_USE.labels(name).set_function(lambda: engine.pool.checkedout())
+    POOL_SATURATION.labels(name).set_function(lambda: engine.pool.checkedout() / capacity)
+
+def failure_reason(exc: Exception) -> str:
+    """Label for a failed posting's underlying database error."""
+    if not isinstance(exc, DBAPIError):
+        return "other"
+    orig = exc.orig
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None) or ""
+    if sqlstate == "40P01":
+        return "deadlock"
+    if sqlstate == "40001":
+        return "serialization_failure"
+    if sqlstate == "55P03":
+        return "lock_not_available"
+    if sqlstate == "57014":
+        return "statement_timeout"
+    # P0001 is a plpgsql RAISE; the only ones on the write path are the
+    # ledger integrity triggers.
+    if sqlstate.startswith("23") or sqlstate == "P0001":
+        return "integrity_violation"
+    return "other"
+
+def record_posting_failure(reason: str):
+    POSTING_FAILURES.labels(reason).inc()
+
+def record_posting_retry(route: str, reason: str):
+    POSTING_RETRIES.labels(route, reason).inc()
+
+def record_admission_rejection(route: str, reason: str):
+    ADMISSION_REJECTIONS.labels(route, reason).inc()
+
+def record_read_route(target: str):
+    READS_ROUTED.labels(target).inc()
+
+def record_replica_lag(seconds: float):
+    REPLICA_LAG.set(seconds)
+
+def record_coalesced_batch(tx_type: str, size: int):
+    COALESCED_BATCH_SIZE.labels(tx_type).observe(size)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, DB time and statement count per route.
+
+    Routes are labelled by their template (`/v1/users/{user_id}/balances`), so
+    label cardinality stays bounded; requests that match no route share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_label = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method, route_label, str(status)).observe(elapsed)
+            REQUEST_DB_TIME.labels(method, route_label).observe(stats.db_time)
+            REQUEST_DB_STATEMENTS.labels(method, route_label).observe(stats.statements)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, Enum as SQLEnum, CheckConstraint, UniqueConstraint, DateTime, text
+from sqlalchemy import Column, Integer, SmallInteger, String, ForeignKey, BigInteger, Enum as SQLEnum, CheckConstraint, Index, DateTime, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -13,6 +13,8 @@ class TransactionType(str, enum.Enum):
     TOPUP = "TOPUP"
     BONUS = "BONUS"
     SPEND = "SPEND"
+    REBALANCE = "REBALANCE"
+    TRANSFER = "TRANSFER"
 
 class AssetType(Base):
     __tablename__ = "asset_types"
@@ -30,10 +32,11 @@ class User(Base):
 class Account(Base):
     __tablename__ = "accounts"
     id = Column(Integer, primary_key=True, index=True)
-    owner_type = Column(SQLEnum(OwnerType), nullable=False)
+    owner_type = Column(SQLEnum(OwnerType, name="owner_type"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     system_name = Column(String(64), nullable=True)
     asset_type_id = Column(Integer, ForeignKey("asset_types.id"), nullable=False)
+    shard = Column(SmallInteger, nullable=False, default=0, server_default=text("0"))
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
 
     __table_args__ = (
@@ -42,23 +45,32 @@ class Account(Base):
             "(owner_type = 'SYSTEM' AND system_name IS NOT NULL AND user_id IS NULL)",
             name="owner_check"
         ),
-        UniqueConstraint("owner_type", "user_id", "system_name", "asset_type_id", name="uq_owner_asset"),
+        Index("uq_user_account", "user_id", "asset_type_id", unique=True, postgresql_where=text("owner_type = 'USER'")),
+        Index(
+            "uq_system_account", "system_name", "asset_type_id", "shard",
+            unique=True, postgresql_where=text("owner_type = 'SYSTEM'"),
+        ),
     )
 
 class Balance(Base):
     __tablename__ = "balances"
     account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
     balance = Column(BigInteger, nullable=False, default=0)
+    version = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
 
     __table_args__ = (
         CheckConstraint("balance >= 0", name="balance_positive"),
     )
+    # ORM updates (treasury rebalancing) bump the version like the raw SQL postings do.
+    __mapper_args__ = {"version_id_col": version}
 
+# The ledger tables are partitioned by created_at, so their database primary
+# keys are (id, created_at); the ORM identifies rows by id alone.
 class LedgerTransaction(Base):
     __tablename__ = "ledger_transactions"
     id = Column(UUID(as_uuid=True), primary_key=True)
-    type = Column(SQLEnum(TransactionType), nullable=False)
-    idempotency_key = Column(String(64), unique=True, nullable=False)
+    type = Column(SQLEnum(TransactionType, name="transaction_type"), nullable=False)
+    idempotency_key = Column(String(64), nullable=False)
     asset_type_id = Column(Integer, ForeignKey("asset_types.id"), nullable=False)
     amount = Column(BigInteger, nullable=False)
     from_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
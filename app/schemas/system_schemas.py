@@ -1,7 +1,36 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
 from .user_schemas import BalanceResponse
 
 class SystemBalancesResponse(BaseModel):
     systemName: str
     balances: List[BalanceResponse]
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    reloads: int
+
+class LruCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    capacity: int
+
+class AdmissionStats(BaseModel):
+    admitted: int
+    rejected: Dict[str, int]
+    trackedUsers: int
+    usersInFlight: int
+
+class PostingRetryStats(BaseModel):
+    retried: Dict[str, int]
+    exhausted: int
+
+class SystemStatsResponse(BaseModel):
+    referenceData: CacheStats
+    idempotency: LruCacheStats
+    userBalances: LruCacheStats
+    admission: AdmissionStats
+    postingRetries: PostingRetryStats
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class TopUpRequest(BaseModel):
     userId: int
@@ -18,6 +19,40 @@ class BonusRequest(BaseModel):
     amount: int = Field(gt=0)
     idempotencyKey: str
 
+class TransferRequest(BaseModel):
+    fromUserId: int
+    toUserId: int
+    assetCode: str
+    amount: int = Field(gt=0)
+    # Paid by the sender to REVENUE on top of `amount`.
+    fee: int = Field(0, ge=0)
+    idempotencyKey: str
+
 class TransactionResponse(BaseModel):
     transactionId: str
     status: str
+    # Pass to GET /users/{id}/balances to read this write back. Not set for duplicates.
+    consistencyToken: Optional[str] = None
+
+# Upper bound on items per batch call, keeping lock sets and statements bounded.
+MAX_BATCH_ITEMS = 10000
+
+class TopUpBatchRequest(BaseModel):
+    items: List[TopUpRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class BonusBatchRequest(BaseModel):
+    items: List[BonusRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class BatchItemResult(BaseModel):
+    idempotencyKey: str
+    userId: int
+    transactionId: Optional[str] = None
+    status: str
+    detail: Optional[str] = None
+    consistencyToken: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    completed: int
+    duplicates: int
+    failed: int
+    results: List[BatchItemResult]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class BalanceResponse(BaseModel):
     asset: str
@@ -8,6 +8,7 @@ class BalanceResponse(BaseModel):
 class UserBalancesResponse(BaseModel):
     userId: int
     balances: List[BalanceResponse]
+    asOf: Optional[str] = None
 
 class TransactionDetail(BaseModel):
     id: str
@@ -20,3 +21,20 @@ class TransactionDetail(BaseModel):
 class TransactionHistoryResponse(BaseModel):
     userId: int
     transactions: List[TransactionDetail]
+    nextCursor: Optional[str] = None
+
+class StatementEntry(BaseModel):
+    transactionId: str
+    type: str
+    amount: int
+    balance: int
+    createdAt: str
+
+class StatementResponse(BaseModel):
+    userId: int
+    asset: str
+    periodStart: str
+    periodEnd: str
+    openingBalance: int
+    closingBalance: int
+    entries: List[StatementEntry]
@@ -0,0 +1,220 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from ..config import (
+    ADMISSION_MAX_IN_FLIGHT_PER_USER, ADMISSION_MAX_QUEUED_PER_USER, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_ROUTE_PER_SECOND, RATE_LIMIT_USER_BURST, RATE_LIMIT_USER_PER_SECOND,
+)
+from ..metrics import record_admission_rejection
+
+class TokenBuckets:
+    """Token buckets by key, refilling at `rate` per second up to `burst`.
+
+    Holds at most `max_keys` buckets; the least recently used is dropped,
+    which only ever forgives a key that has been quiet the longest.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key) -> float:
+        """Take a token for `key`: 0 if there was one, else seconds until there will be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+class UserSlots:
+    """At most `max_in_flight` postings per user, with a bounded wait queue.
+
+    Waiting happens on the event loop, before the request has a database
+    connection, so a flood for one user queues here instead of on the
+    user's row lock, where every waiter would hold a pooled connection.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._in_flight = {}
+        self._queues = {}
+
+    async def acquire(self, user_ids) -> bool:
+        """Take a slot for every user, in id order; False (holding none) if any is full."""
+        held = []
+        for user_id in sorted(user_ids):
+            if not await self._acquire_one(user_id):
+                self.release(held)
+                return False
+            held.append(user_id)
+        return True
+
+    async def _acquire_one(self, user_id) -> bool:
+        if self._in_flight.get(user_id, 0) < self.max_in_flight:
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+            return True
+        queue = self._queues.setdefault(user_id, deque())
+        if len(queue) >= self.max_queued:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            # release() hands its slot straight to the first waiter.
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # Handed a slot just as the wait ran out: pass it on.
+                self.release([user_id])
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+            if not queue:
+                self._queues.pop(user_id, None)
+
+    def release(self, user_ids):
+        for user_id in user_ids:
+            queue = self._queues.get(user_id)
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+            else:
+                count = self._in_flight.get(user_id, 0) - 1
+                if count > 0:
+                    self._in_flight[user_id] = count
+                else:
+                    self._in_flight.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._in_flight)
+
+class AdmissionControl:
+    """Rejects postings a worker shouldn't take on, before they touch the database.
+
+    A request over its user's or its route's token bucket gets 429; one that
+    can't get a slot for every user it posts for gets 503. Both carry
+    Retry-After. Every limit is per worker and off at 0.
+    """
+
+    def __init__(self, user_rate: float, user_burst: float, route_rate: float, max_in_flight: int,
+                 max_queued: int, queue_timeout: float, max_keys: int):
+        self.user_buckets = TokenBuckets(user_rate, user_burst, max_keys) if user_rate > 0 else None
+        self.route_buckets = TokenBuckets(route_rate, route_rate, max_keys) if route_rate > 0 else None
+        self.slots = UserSlots(max_in_flight, max_queued, queue_timeout) if max_in_flight > 0 else None
+        self.admitted = 0
+        self.rejected = {"userRate": 0, "routeRate": 0, "inFlight": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit is not None for limit in (self.user_buckets, self.route_buckets, self.slots))
+
+    def _reject(self, route: str, reason: str, status_code: int, retry_after: float):
+        self.rejected[reason] += 1
+        record_admission_rejection(route, reason)
+        detail = "Too many requests" if status_code == 429 else "Too many requests in flight, try again later"
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    async def admit(self, route: str, user_ids):
+        """Admit a posting or raise; the caller must release(user_ids) once done."""
+        if self.route_buckets is not None:
+            wait = self.route_buckets.take(route)
+            if wait:
+                self._reject(route, "routeRate", 429, wait)
+        if self.user_buckets is not None:
+            for user_id in user_ids:
+                wait = self.user_buckets.take((route, user_id))
+                if wait:
+                    self._reject(route, "userRate", 429, wait)
+        if self.slots is not None and not await self.slots.acquire(user_ids):
+            self._reject(route, "inFlight", 503, self.slots.timeout)
+        self.admitted += 1
+
+    def release(self, user_ids):
+        if self.slots is not None:
+            self.slots.release(user_ids)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "trackedUsers": len(self.user_buckets) if self.user_buckets is not None else 0,
+            "usersInFlight": len(self.slots) if self.slots is not None else 0,
+        }
+
+admission = AdmissionControl(
+    RATE_LIMIT_USER_PER_SECOND, RATE_LIMIT_USER_BURST, RATE_LIMIT_ROUTE_PER_SECOND,
+    ADMISSION_MAX_IN_FLIGHT_PER_USER, ADMISSION_MAX_QUEUED_PER_USER, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    RATE_LIMIT_MAX_KEYS,
+)
+
+_user_id = TypeAdapter(int)
+
+def _body_user_ids(body, user_fields) -> list:
+    # Coerced as the request schemas do (so "1" is user 1, not a way around
+    # the per-user limits); a value the schema would reject is a 422 here.
+    if not isinstance(body, dict):
+        return []
+    user_ids = set()
+    for field in user_fields:
+        if body.get(field) is None:
+            continue
+        try:
+            user_ids.add(_user_id.validate_python(body[field]))
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", field, *error["loc"])} for error in e.errors()]
+            ) from e
+    return sorted(user_ids)
+
+def admit_posting(*user_fields: str):
+    """Route dependency running admission control for a posting endpoint.
+
+    `user_fields` name the JSON body fields holding the users the posting is
+    for; batch endpoints pass none and only count against their route. It
+    runs on the event loop before the endpoint gets a session, so a rejected
+    request never holds a thread or a database connection, and its slots are
+    released once the response has been sent.
+    """
+    async def dependency(request: Request):
+        if not admission.enabled:
+            yield
+            return
+        user_ids = []
+        if user_fields:
+            # FastAPI has already read and cached the body.
+            user_ids = _body_user_ids(await request.json(), user_fields)
+        await admission.admit(request.scope["route"].path, user_ids)
+        try:
+            yield
+        finally:
+            admission.release(user_ids)
+    return dependency
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from ..config import BALANCE_CACHE_SIZE, BALANCE_CACHE_TTL_SECONDS
+
+BALANCES_CHANNEL = "balances_changed"
+
+def consistency_token(account_id: int, version: int, lsn=None) -> str:
+    # With a read replica configured, the token also carries the primary's
+    # WAL position after the commit, so reads can tell whether the replica
+    # has it yet.
+    token = f"{account_id}.{version}"
+    return token if lsn is None else f"{token}.{lsn}"
+
+def parse_consistency_token(token: str):
+    # Raises ValueError on a malformed token.
+    account_id, version, *lsn = token.split(".")
+    if len(lsn) > 1:
+        raise ValueError(token)
+    return int(account_id), int(version)
+
+def consistency_token_lsn(token: str):
+    """The commit WAL position in `token`, or None; raises ValueError on a malformed token."""
+    parse_consistency_token(token)
+    parts = token.split(".")
+    return int(parts[2]) if len(parts) == 3 else None
+
+class BalanceCache:
+    """Bounded LRU of user_id -> balances response, plus the account versions it was built from.
+
+    The posting code invalidates a user right after committing a change and
+    other workers hear about it through NOTIFY on BALANCES_CHANNEL. A read
+    that started before an invalidation may not store its (possibly stale)
+    result, which is tracked with a counter bumped on every invalidation.
+    """
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self) -> int:
+        return self._invalidations
+
+    def get(self, user_id: int, min_version=None):
+        """Cached balances for `user_id`, or None.
+
+        `min_version` is a parsed consistency token: the entry only counts as
+        a hit if it already reflects that account version.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[2] > self._ttl:
+                del self._entries[user_id]
+                entry = None
+            if entry is not None and min_version is not None:
+                account_id, version = min_version
+                if entry[1].get(account_id, 0) < version:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id: int, response: dict, versions: dict, generation: int):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            if generation != self._invalidations:
+                return
+            self._entries[user_id] = (response, versions, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_users(self, user_ids):
+        with self._lock:
+            self._invalidations += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def handle_notification(self, payload):
+        # None (listener reconnected) or "" (too many users) drop everything.
+        if not payload:
+            self.clear()
+            return
+        self.invalidate_users(int(user_id) for user_id in payload.split(","))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries), "capacity": self.capacity,
+            }
+
+user_balances = BalanceCache(BALANCE_CACHE_SIZE, BALANCE_CACHE_TTL_SECONDS)
@@ -0,0 +1,181 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from ..config import COALESCE_MAX_ITEMS, COALESCE_WINDOW_MS
+from ..db import AsyncSessionLocal, SessionLocal
+from ..metrics import record_coalesced_batch
+from ..models import TransactionType
+from .ledger import AccountNotFound, InsufficientFunds, InvalidAsset, PostingFailed, post_batch, post_user_transaction
+from .retry import run_posting, run_posting_async
+
+# post_batch reports per-item failures by detail; requests get the same
+# errors the single posting path would raise.
+_ITEM_ERRORS = {
+    "Invalid asset code": InvalidAsset,
+    "Account not found": AccountNotFound,
+    "Insufficient funds": InsufficientFunds,
+    "Insufficient treasury funds": InsufficientFunds,
+}
+
+def _outcome(result: dict):
+    if result["status"] == "failed":
+        raise _ITEM_ERRORS.get(result["detail"], PostingFailed)(result["detail"])
+    return result["transactionId"], result["consistencyToken"]
+
+def _post_one(db, tx_type: TransactionType, item):
+    return post_user_transaction(db, tx_type, item.userId, item.assetCode, item.amount, item.idempotencyKey)
+
+def _settle(future, fn, *args):
+    # An async request that went away has already cancelled its future.
+    if future.done():
+        return
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.futures = []
+        self.full = threading.Event()
+
+class PostingCoalescer:
+    """Posts concurrent single requests of one type together through post_batch.
+
+    The first request to arrive opens a batch and waits up to `window`
+    seconds (or until `max_items` have joined), then posts the whole batch in
+    one transaction and hands every request its own result. A batch of one
+    goes through the regular single posting path, and if the batch as a
+    whole fails (a key used concurrently elsewhere, or conflicts beyond what
+    the retry runner absorbs) its items are retried one by one, so a request
+    never fails because of a neighbour.
+    """
+
+    def __init__(self, window: float, max_items: int):
+        self.window = window
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def submit(self, tx_type: TransactionType, item):
+        future = Future()
+        with self._lock:
+            batch = self._open.get(tx_type)
+            leader = batch is None
+            if leader:
+                batch = self._open[tx_type] = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_items:
+                del self._open[tx_type]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(tx_type) is batch:
+                    del self._open[tx_type]
+            self._flush(tx_type, batch)
+        return future.result()
+
+    def _flush(self, tx_type: TransactionType, batch: _Batch):
+        record_coalesced_batch(tx_type.value, len(batch.items))
+        results = None
+        if len(batch.items) > 1:
+            db = SessionLocal()
+            try:
+                results = run_posting(db, tx_type.value.lower(), post_batch, tx_type, batch.items)
+            except Exception:
+                results = None
+            finally:
+                db.close()
+
+        if results is not None:
+            for result, future in zip(results, batch.futures):
+                _settle(future, _outcome, result)
+            return
+
+        for item, future in zip(batch.items, batch.futures):
+            db = SessionLocal()
+            try:
+                _settle(future, run_posting, db, tx_type.value.lower(), _post_one, tx_type, item)
+            finally:
+                db.close()
+
+class _AsyncBatch:
+    def __init__(self):
+        self.items = []
+        self.futures = []
+        self.full = asyncio.Event()
+
+class AsyncPostingCoalescer:
+    """PostingCoalescer for the async endpoints.
+
+    Runs on the event loop, so no locking is needed; each batch is flushed
+    by its own task rather than by the first request, so a disconnecting
+    client can't cancel everyone else's postings.
+    """
+
+    def __init__(self, window: float, max_items: int):
+        self.window = window
+        self.max_items = max_items
+        self._open = {}
+        self._tasks = set()
+
+    async def submit(self, tx_type: TransactionType, item):
+        future = asyncio.get_running_loop().create_future()
+        batch = self._open.get(tx_type)
+        if batch is None:
+            batch = self._open[tx_type] = _AsyncBatch()
+            task = asyncio.ensure_future(self._run(tx_type, batch))
+            # The loop only keeps weak references to tasks.
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_items:
+            del self._open[tx_type]
+            batch.full.set()
+        return await future
+
+    async def _run(self, tx_type: TransactionType, batch: _AsyncBatch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self._open.get(tx_type) is batch:
+            del self._open[tx_type]
+
+        record_coalesced_batch(tx_type.value, len(batch.items))
+        results = None
+        if len(batch.items) > 1:
+            try:
+                async with AsyncSessionLocal() as db:
+                    results = await run_posting_async(db, tx_type.value.lower(), post_batch, tx_type, batch.items)
+            except Exception:
+                results = None
+
+        if results is not None:
+            for result, future in zip(results, batch.futures):
+                _settle(future, _outcome, result)
+            return
+
+        for item, future in zip(batch.items, batch.futures):
+            if future.done():
+                continue
+            try:
+                async with AsyncSessionLocal() as db:
+                    outcome = await run_posting_async(db, tx_type.value.lower(), _post_one, tx_type, item)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(outcome)
+
+posting_coalescer = None
+async_posting_coalescer = None
+if COALESCE_WINDOW_MS > 0:
+    posting_coalescer = PostingCoalescer(COALESCE_WINDOW_MS / 1000, COALESCE_MAX_ITEMS)
+    async_posting_coalescer = AsyncPostingCoalescer(COALESCE_WINDOW_MS / 1000, COALESCE_MAX_ITEMS)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from ..config import LEDGER_FEED_POLL_SECONDS
+from ..db import engine
+from .refdata import reference_data
+
+logger = logging.getLogger(__name__)
+
+FEED_CHANNEL = "ledger_entries_added"
+
+# Caps how often a busy worker re-reads the watermark, however many
+# notifications arrive.
+MIN_CHECK_SECONDS = 0.01
+
+SEQUENCE_VALUE_SQL = text("SELECT COALESCE(pg_sequence_last_value(pg_get_serial_sequence('ledger_entries', 'id')), 0)")
+
+# Transactions holding an xid, in any database. Read from the backends'
+# shared state, so unlike a snapshot's xmax it includes transactions that got
+# their xid after the last commit.
+RUNNING_XIDS_SQL = text("""
+    SELECT COALESCE(array_agg(CAST(CAST(backend_xid AS text) AS bigint)), '{}')
+    FROM pg_stat_activity WHERE backend_xid IS NOT NULL
+""")
+
+FEED_PAGE_SQL = text("""
+    SELECT e.id, e.transaction_id, t.type, t.asset_type_id, e.account_id, e.amount, e.created_at
+    FROM ledger_entries e
+    JOIN ledger_transactions t ON t.id = e.transaction_id AND t.created_at = e.created_at
+    WHERE e.id > :after AND e.id <= :until
+    ORDER BY e.id
+    LIMIT :limit
+""")
+
+class FeedWatermark:
+    """Background thread tracking how far the ledger feed may read.
+
+    Entry ids are drawn when a posting inserts its entries, but become
+    visible only when it commits, so ids don't commit in order: reading past
+    the highest visible id could skip a lower one that commits a moment
+    later. The watermark is the highest id below which every entry is
+    committed or never will be. Each check reads the id sequence and then
+    the xids of the running transactions; that sequence value becomes safe
+    once none of those transactions is running any more. Postings lock their
+    balance rows before inserting entries, so they already have an xid when
+    they draw ids. A transaction that writes and then stays open holds the
+    watermark back until it ends.
+
+    Checks run on each ledger_entries_added notification and every
+    `interval` seconds without one. Consumers wait on the watermark from the
+    event loop, so an idle consumer doesn't hold a thread.
+    """
+
+    def __init__(self, engine, interval: float):
+        self._engine = engine
+        self._interval = interval
+        self._value = 0
+        self._pending = deque()
+        self._waiters = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ledger-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def current(self) -> int:
+        return self._value
+
+    def handle_notification(self, payload):
+        self._wake.set()
+
+    async def wait(self, after: int, timeout: float) -> int:
+        """Wait up to `timeout` seconds for the watermark to pass `after`; returns the watermark."""
+        if self._value > after:
+            return self._value
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            if self._value <= after:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+        return self._value
+
+    def check(self):
+        with self._engine.connect() as conn:
+            last_id = conn.execute(SEQUENCE_VALUE_SQL).scalar()
+            running = frozenset(conn.execute(RUNNING_XIDS_SQL).scalar())
+        if last_id > (self._pending[-1][0] if self._pending else self._value):
+            self._pending.append((last_id, running))
+        safe = self._value
+        while self._pending and not self._pending[0][1] & running:
+            safe = self._pending.popleft()[0]
+        if safe > self._value:
+            self._advance(safe)
+
+    def _advance(self, value: int):
+        with self._lock:
+            self._value = value
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's event loop has shut down.
+                pass
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Could not advance the ledger feed watermark")
+            # Transactions still in flight: look again soon even if they roll
+            # back and never notify.
+            self._wake.wait(min(self._interval, 0.1) if self._pending else self._interval)
+            self._wake.clear()
+            if self._stop.wait(MIN_CHECK_SECONDS):
+                return
+
+feed_watermark = FeedWatermark(engine, LEDGER_FEED_POLL_SECONDS)
+
+def read_feed_page(db: Session, after: int, until: int, limit: int) -> list:
+    """Up to `limit` entries with after < id <= until, oldest first, as feed events."""
+    rows = db.execute(FEED_PAGE_SQL, {"after": after, "until": until, "limit": limit})
+    return [to_event(row) for row in rows]
+
+def to_event(row) -> dict:
+    """A FEED_PAGE_SQL row as a feed event, for responses.dumps (see history.to_detail)."""
+    entry_id, transaction_id, tx_type, asset_type_id, account_id, amount, created_at = row
+    return {
+        "entryId": entry_id,
+        "transactionId": transaction_id,
+        "type": tx_type.value if hasattr(tx_type, 'value') else tx_type,
+        "assetCode": reference_data.asset_code(asset_type_id),
+        "accountId": account_id,
+        "amount": amount,
+        "createdAt": created_at,
+    }
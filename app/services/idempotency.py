@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+from ..config import IDEMPOTENCY_CACHE_SIZE
+
+class CompletedPostingCache:
+    """Bounded LRU of scoped idempotency key -> transaction id.
+
+    Only keys whose transaction is known to be committed are stored, so a hit
+    is always the right answer for a retry. A miss says nothing: the key may
+    have been evicted or used through another worker, and the
+    idempotency_keys table remains the source of truth.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, scoped_key: str):
+        with self._lock:
+            transaction_id = self._entries.get(scoped_key)
+            if transaction_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(scoped_key)
+            self.hits += 1
+            return transaction_id
+
+    def put(self, scoped_key: str, transaction_id):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            self._entries[scoped_key] = str(transaction_id)
+            self._entries.move_to_end(scoped_key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries), "capacity": self.capacity,
+            }
+
+completed_postings = CompletedPostingCache(IDEMPOTENCY_CACHE_SIZE)
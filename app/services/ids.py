@@ -0,0 +1,34 @@
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_timestamp = 0
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (RFC 9562 version 7) for ledger transaction ids.
+
+    The top 48 bits are the Unix time in milliseconds and the next 12 bits a
+    fraction of the millisecond, so new ids land at the right-hand edge of
+    the btree indexes instead of on random pages. Ids from one process are
+    strictly increasing; the remaining 62 bits are random.
+    """
+    global _last_timestamp
+    now = time.time_ns()
+    # 60-bit timestamp: milliseconds, then the sub-millisecond part in 1/4096 ms.
+    timestamp = (now // 1_000_000) << 12 | (now % 1_000_000) * 4096 // 1_000_000
+    with _lock:
+        if timestamp <= _last_timestamp:
+            timestamp = _last_timestamp + 1
+        _last_timestamp = timestamp
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & 0x3FFF_FFFF_FFFF_FFFF
+    value = (
+        (timestamp >> 12) << 80
+        | 0x7 << 76
+        | (timestamp & 0xFFF) << 64
+        | 0b10 << 62
+        | rand_b
+    )
+    return uuid.UUID(int=value)
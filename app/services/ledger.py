@@ -0,0 +1,690 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..config import TREASURY_SKIP_LOCKED
+from ..metrics import failure_reason, record_posting_failure
+from ..models import TransactionType
+from .balance_cache import consistency_token, user_balances
+from .idempotency import completed_postings
+from .ids import uuid7
+from .refdata import reference_data
+from .replica import commit_lsn
+from .treasury import TREASURY, revenue_account_id, treasury_account_id, treasury_shard_ids, rebalance_treasury_shard
+
+logger = logging.getLogger(__name__)
+
+class LedgerError(Exception):
+    status_code = 400
+    headers = None
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+class InvalidAsset(LedgerError):
+    status_code = 400
+
+class AccountNotFound(LedgerError):
+    status_code = 404
+
+class InsufficientFunds(LedgerError):
+    status_code = 400
+
+class PostingFailed(LedgerError):
+    status_code = 500
+
+class InvalidTransfer(LedgerError):
+    status_code = 400
+
+# Failures that say nothing about the posting itself, only about what ran
+# next to it: running it again can succeed.
+RETRYABLE_FAILURES = {"deadlock", "serialization_failure", "lock_not_available"}
+
+# A posting that kept losing to concurrent ones; see services/retry.py.
+class PostingConflict(PostingFailed):
+    status_code = 503
+    headers = {"Retry-After": "1"}
+
+    def __init__(self, reason: str):
+        super().__init__(f"Transaction conflicted with concurrent postings ({reason.replace('_', ' ')}), try again")
+        self.reason = reason
+
+# Transactions the treasury pays out; the rest (SPEND) it collects.
+TREASURY_DEBITS = {TransactionType.TOPUP, TransactionType.BONUS}
+
+# Round trip 1: lock the user's and the treasury shard's balance rows in
+# account id order. Asset and treasury account ids come from the reference
+# data cache. The idempotency key isn't checked up front: a reused key makes
+# the insert into idempotency_keys in round trip 2 fail instead.
+LOCK_ACCOUNTS_SQL = text("""
+    SELECT b.account_id, b.balance
+    FROM balances b
+    WHERE b.account_id IN (
+        :treasury_account_id,
+        (SELECT a.id FROM accounts a
+         WHERE a.owner_type = 'USER' AND a.user_id = :user_id AND a.asset_type_id = :asset_type_id)
+    )
+    ORDER BY b.account_id
+    FOR UPDATE
+""")
+
+# LOCK_ACCOUNTS_SQL with TREASURY_SKIP_LOCKED: the treasury side is any
+# shard in :treasury_ids that no other posting has locked and that holds at
+# least :min_balance, the user's own shard first. The user's row is locked
+# first (the shard CTE depends on it, so it runs after), and the shard is
+# only ever taken with SKIP LOCKED. The one wait is on the user's row, with
+# nothing held yet, so this can't close a deadlock with postings that lock in
+# account id order. Returns only the user's row when there is no such shard.
+LOCK_ACCOUNTS_SKIP_LOCKED_SQL = text("""
+    WITH account AS MATERIALIZED (
+        SELECT b.account_id, b.balance
+        FROM balances b
+        WHERE b.account_id = (
+            SELECT a.id FROM accounts a
+            WHERE a.owner_type = 'USER' AND a.user_id = :user_id AND a.asset_type_id = :asset_type_id
+        )
+        FOR UPDATE
+    ),
+    shard AS MATERIALIZED (
+        SELECT account_id, balance FROM balances
+        WHERE EXISTS (SELECT 1 FROM account)
+          AND account_id = ANY(CAST(:treasury_ids AS integer[])) AND balance >= :min_balance
+        ORDER BY account_id = :treasury_account_id DESC, balance DESC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    SELECT account_id, balance FROM account
+    UNION ALL
+    SELECT account_id, balance FROM shard
+""")
+
+# A user's account in an asset is created by their first credit in it, in
+# the posting's own transaction. A concurrent first posting waits on
+# uq_user_account, then finds the account the other one created (or creates
+# it, if the other rolled back). Unknown users get no account.
+PROVISION_ACCOUNT_SQL = text("""
+    WITH account AS (
+        INSERT INTO accounts (owner_type, user_id, asset_type_id)
+        SELECT 'USER', id, :asset_type_id FROM users WHERE id = :user_id
+        ON CONFLICT (user_id, asset_type_id) WHERE owner_type = 'USER' DO NOTHING
+        RETURNING id
+    )
+    INSERT INTO balances (account_id, balance) SELECT id, 0 FROM account
+""")
+
+# Round trip 2: apply every leg to its (already locked) balance and write the
+# transaction, its idempotency key and its entries. The rows all default
+# created_at to the database transaction's NOW(), so the entries land in their
+# transaction's ledger partition. The `balance + amount >= 0` guard means a
+# leg that would overdraw simply isn't updated, which the caller detects by
+# the number of (account, new version) rows returned.
+APPLY_POSTING_SQL = text("""
+    WITH legs AS (
+        SELECT * FROM unnest(CAST(:leg_accounts AS integer[]), CAST(:leg_amounts AS bigint[])) AS l(account_id, amount)
+    ),
+    updated AS (
+        UPDATE balances b
+        SET balance = b.balance + legs.amount, version = b.version + 1
+        FROM legs
+        WHERE b.account_id = legs.account_id AND b.balance + legs.amount >= 0
+        RETURNING b.account_id, b.version
+    ),
+    tx AS (
+        INSERT INTO ledger_transactions (id, type, idempotency_key, asset_type_id, amount, from_account_id, to_account_id)
+        VALUES (:id, CAST(:type AS transaction_type), :scoped_key, :asset_type_id, :amount, :from_account_id, :to_account_id)
+        RETURNING id
+    ),
+    idempotency AS (
+        INSERT INTO idempotency_keys (idempotency_key, transaction_id)
+        SELECT :scoped_key, tx.id FROM tx
+        RETURNING idempotency_key
+    ),
+    entries AS (
+        INSERT INTO ledger_entries (transaction_id, account_id, amount)
+        SELECT tx.id, legs.account_id, legs.amount FROM tx, legs
+        ORDER BY legs.account_id
+        RETURNING id
+    )
+    SELECT account_id, version FROM updated
+""")
+
+# APPLY_POSTING_SQL for postings that haven't locked anything yet. `locked`
+# takes every leg's balance row in account id order, and a row is only
+# updated once `locked` has returned it, so postings over overlapping
+# accounts queue up instead of deadlocking. The locks are held for just this
+# statement and the commit, which keeps a hot account (a popular recipient,
+# REVENUE) busy for as short a time as possible.
+LOCK_AND_APPLY_POSTING_SQL = text("""
+    WITH legs AS (
+        SELECT * FROM unnest(CAST(:leg_accounts AS integer[]), CAST(:leg_amounts AS bigint[])) AS l(account_id, amount)
+    ),
+    locked AS MATERIALIZED (
+        SELECT account_id FROM balances
+        WHERE account_id = ANY(CAST(:leg_accounts AS integer[]))
+        ORDER BY account_id
+        FOR UPDATE
+    ),
+    updated AS (
+        UPDATE balances b
+        SET balance = b.balance + legs.amount, version = b.version + 1
+        FROM legs JOIN locked ON locked.account_id = legs.account_id
+        WHERE b.account_id = legs.account_id AND b.balance + legs.amount >= 0
+        RETURNING b.account_id, b.version
+    ),
+    tx AS (
+        INSERT INTO ledger_transactions (id, type, idempotency_key, asset_type_id, amount, from_account_id, to_account_id)
+        VALUES (:id, CAST(:type AS transaction_type), :scoped_key, :asset_type_id, :amount, :from_account_id, :to_account_id)
+        RETURNING id
+    ),
+    idempotency AS (
+        INSERT INTO idempotency_keys (idempotency_key, transaction_id)
+        SELECT :scoped_key, tx.id FROM tx
+        RETURNING idempotency_key
+    ),
+    entries AS (
+        INSERT INTO ledger_entries (transaction_id, account_id, amount)
+        SELECT tx.id, legs.account_id, legs.amount FROM tx, legs
+        ORDER BY legs.account_id
+        RETURNING id
+    )
+    SELECT account_id, version FROM updated
+""")
+
+EXISTING_TRANSACTION_SQL = text("""
+    SELECT transaction_id FROM idempotency_keys WHERE idempotency_key = :scoped_key
+""")
+
+BATCH_EXISTING_KEYS_SQL = text("""
+    SELECT idempotency_key, transaction_id FROM idempotency_keys WHERE idempotency_key = ANY(CAST(:keys AS varchar[]))
+""")
+
+BATCH_USER_ACCOUNTS_SQL = text("""
+    SELECT a.id, a.user_id, a.asset_type_id
+    FROM unnest(CAST(:user_ids AS integer[]), CAST(:asset_type_ids AS integer[])) AS r(user_id, asset_type_id)
+    JOIN accounts a ON a.owner_type = 'USER' AND a.user_id = r.user_id AND a.asset_type_id = r.asset_type_id
+""")
+
+# PROVISION_ACCOUNT_SQL for a whole batch. Rows go in sorted, so concurrent
+# batches creating the same accounts wait on each other instead of
+# deadlocking.
+PROVISION_ACCOUNTS_SQL = text("""
+    WITH account AS (
+        INSERT INTO accounts (owner_type, user_id, asset_type_id)
+        SELECT 'USER', r.user_id, r.asset_type_id
+        FROM unnest(CAST(:user_ids AS integer[]), CAST(:asset_type_ids AS integer[])) AS r(user_id, asset_type_id)
+        JOIN users u ON u.id = r.user_id
+        ORDER BY r.user_id, r.asset_type_id
+        ON CONFLICT (user_id, asset_type_id) WHERE owner_type = 'USER' DO NOTHING
+        RETURNING id
+    )
+    INSERT INTO balances (account_id, balance) SELECT id, 0 FROM account
+""")
+
+# A batch settles against one treasury shard per asset: the richest one.
+BATCH_TREASURY_SQL = text("""
+    SELECT DISTINCT ON (a.asset_type_id) a.asset_type_id, a.id
+    FROM accounts a
+    JOIN balances b ON b.account_id = a.id
+    WHERE a.owner_type = 'SYSTEM' AND a.system_name = :treasury AND a.asset_type_id = ANY(CAST(:asset_type_ids AS integer[]))
+    ORDER BY a.asset_type_id, b.balance DESC
+""")
+
+BATCH_LOCK_SQL = text("""
+    SELECT account_id, balance FROM balances
+    WHERE account_id = ANY(CAST(:account_ids AS integer[]))
+    ORDER BY account_id
+    FOR UPDATE
+""")
+
+# Applies the net change per account once, then writes every transaction and
+# entry of the batch with one multi-row insert each.
+BATCH_APPLY_SQL = text("""
+    WITH deltas AS (
+        SELECT * FROM unnest(CAST(:delta_accounts AS integer[]), CAST(:delta_amounts AS bigint[])) AS d(account_id, amount)
+    ),
+    updated AS (
+        UPDATE balances b
+        SET balance = b.balance + deltas.amount, version = b.version + 1
+        FROM deltas
+        WHERE b.account_id = deltas.account_id AND b.balance + deltas.amount >= 0
+        RETURNING b.account_id, b.version
+    ),
+    txs AS (
+        INSERT INTO ledger_transactions (id, type, idempotency_key, asset_type_id, amount, from_account_id, to_account_id)
+        SELECT t.id, CAST(:type AS transaction_type), t.idempotency_key, t.asset_type_id, t.amount, t.from_account_id, t.to_account_id
+        FROM unnest(
+            CAST(:tx_ids AS uuid[]), CAST(:tx_keys AS varchar[]), CAST(:tx_assets AS integer[]),
+            CAST(:tx_amounts AS bigint[]), CAST(:tx_from AS integer[]), CAST(:tx_to AS integer[])
+        ) AS t(id, idempotency_key, asset_type_id, amount, from_account_id, to_account_id)
+        RETURNING id, idempotency_key
+    ),
+    idempotency AS (
+        INSERT INTO idempotency_keys (idempotency_key, transaction_id)
+        SELECT idempotency_key, id FROM txs
+        RETURNING idempotency_key
+    ),
+    entries AS (
+        INSERT INTO ledger_entries (transaction_id, account_id, amount)
+        SELECT e.transaction_id, e.account_id, e.amount
+        FROM unnest(CAST(:entry_txs AS uuid[]), CAST(:entry_accounts AS integer[]), CAST(:entry_amounts AS bigint[]))
+            AS e(transaction_id, account_id, amount)
+        WHERE EXISTS (SELECT 1 FROM txs)
+        ORDER BY e.account_id
+        RETURNING id
+    )
+    SELECT account_id, version FROM updated
+""")
+
+def scoped_idempotency_key(user_id: int, idempotency_key: str) -> str:
+    return f"user_{user_id}:{idempotency_key}"
+
+def _lock_accounts(db: Session, user_id: int, asset_type_id: int, treasury_id: int, provision: bool):
+    params = {"user_id": user_id, "asset_type_id": asset_type_id, "treasury_account_id": treasury_id}
+    rows = db.execute(LOCK_ACCOUNTS_SQL, params).all()
+    if provision and len(rows) == 1:
+        # Only the treasury shard: the user has no account in this asset yet.
+        db.execute(PROVISION_ACCOUNT_SQL, params)
+        rows = db.execute(LOCK_ACCOUNTS_SQL, params).all()
+
+    if len(rows) != 2:
+        db.rollback()
+        raise AccountNotFound("Account not found")
+
+    user_row = next(r for r in rows if r.account_id != treasury_id)
+    treasury_row = next(r for r in rows if r.account_id == treasury_id)
+    return user_row, treasury_row
+
+def _lock_free_treasury_shard(db: Session, user_id: int, asset_type_id: int, treasury_id: int, min_balance: int):
+    """Lock the user's account and whichever treasury shard is free, or return None.
+
+    None when every shard that could cover `min_balance` is locked, or the
+    user has no account in the asset yet; the caller then falls back to
+    _lock_accounts on the user's own shard.
+    """
+    shard_ids = treasury_shard_ids(asset_type_id)
+    if len(shard_ids) < 2:
+        return None
+    rows = db.execute(LOCK_ACCOUNTS_SKIP_LOCKED_SQL, {
+        "treasury_ids": shard_ids, "min_balance": min_balance, "treasury_account_id": treasury_id,
+        "user_id": user_id, "asset_type_id": asset_type_id,
+    }).all()
+    if len(rows) != 2:
+        db.rollback()
+        return None
+    shard_set = set(shard_ids)
+    user_row = next(r for r in rows if r.account_id not in shard_set)
+    treasury_row = next(r for r in rows if r.account_id in shard_set)
+    return user_row, treasury_row
+
+def existing_transaction_id(db: Session, scoped_key: str):
+    """Id of the committed transaction that used `scoped_key`, if any.
+
+    Rolls back whatever the session was doing first, so it can be called
+    straight after a failed posting.
+    """
+    db.rollback()
+    existing_id = db.execute(EXISTING_TRANSACTION_SQL, {"scoped_key": scoped_key}).scalar()
+    db.rollback()
+    if existing_id is not None:
+        completed_postings.put(scoped_key, existing_id)
+    return existing_id
+
+def _reject(db: Session, scoped_key: str, error: LedgerError):
+    # A retry of a posting that already went through gets the original id
+    # back even if balances have moved since, so only the rare failure path
+    # pays for the idempotency lookup.
+    existing_id = existing_transaction_id(db, scoped_key)
+    if existing_id is None:
+        record_posting_failure("insufficient_funds")
+        raise error
+    return str(existing_id), None
+
+def apply_posting(db: Session, tx_type: TransactionType, scoped_key: str, asset_type_id: int, amount: int,
+                  from_account_id: int, to_account_id: int, legs, lock: bool = False):
+    """Write a posting whose balance rows are already locked by the caller.
+
+    With `lock`, the posting takes the locks itself, in account id order, in
+    the same statement. `legs` is a list of (account_id, signed amount) pairs,
+    one per account, that must net to zero. Returns the transaction id and
+    {account_id: new balance version}. Raises InsufficientFunds if any leg
+    would overdraw its account; the caller is responsible for rolling back in
+    that case.
+    """
+    legs = sorted(legs)
+    transaction_id = uuid7()
+    versions = dict(db.execute(LOCK_AND_APPLY_POSTING_SQL if lock else APPLY_POSTING_SQL, {
+        "leg_accounts": [account_id for account_id, _ in legs],
+        "leg_amounts": [leg_amount for _, leg_amount in legs],
+        "id": transaction_id, "type": tx_type.value, "scoped_key": scoped_key,
+        "asset_type_id": asset_type_id, "amount": amount,
+        "from_account_id": from_account_id, "to_account_id": to_account_id,
+    }).all())
+    if len(versions) != len(legs):
+        raise InsufficientFunds("Insufficient funds")
+    return transaction_id, versions
+
+def posting_failed(description: str, e: Exception) -> PostingFailed:
+    reason = failure_reason(e)
+    if reason in RETRYABLE_FAILURES:
+        # Logged and counted by the retry runner if it gives up.
+        return PostingConflict(reason)
+    logger.exception("Error during %s", description)
+    record_posting_failure(reason)
+    # The database error names statements, parameters and keys: it goes to
+    # the log above, the client only gets its category.
+    return PostingFailed(f"Transaction failed ({reason.replace('_', ' ')})")
+
+def commit_posting(db: Session, description: str):
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise posting_failed(description, e)
+
+def post_user_transaction(db: Session, tx_type: TransactionType, user_id: int, asset_code: str,
+                          amount: int, idempotency_key: str):
+    """Move `amount` between a user's account and their treasury shard.
+
+    TOPUP and BONUS pay the user out of the treasury, creating the user's
+    account in the asset on first use; SPEND pays the treasury.
+    Returns (transaction id, consistency token for the user's new balance).
+    If the idempotency key has already been used, returns the id of the
+    earlier transaction and no token.
+    """
+    scoped_key = scoped_idempotency_key(user_id, idempotency_key)
+    cached_id = completed_postings.get(scoped_key)
+    if cached_id is not None:
+        return cached_id, None
+
+    asset_type_id = reference_data.asset_id(asset_code)
+    if asset_type_id is None:
+        raise InvalidAsset("Invalid asset code")
+    treasury_id = treasury_account_id(asset_type_id, user_id)
+    if treasury_id is None:
+        raise AccountNotFound("Account not found")
+
+    locked = None
+    if TREASURY_SKIP_LOCKED:
+        min_balance = amount if tx_type in TREASURY_DEBITS else 0
+        locked = _lock_free_treasury_shard(db, user_id, asset_type_id, treasury_id, min_balance)
+    if locked is None:
+        locked = _lock_accounts(db, user_id, asset_type_id, treasury_id, tx_type in TREASURY_DEBITS)
+    user_row, treasury_row = locked
+
+    if tx_type in TREASURY_DEBITS and treasury_row.balance < amount:
+        # This shard is running low: release our locks, refill it from a
+        # sibling shard in a separate transaction and lock again. A retry
+        # doesn't need the refill, so check the key before moving money.
+        existing_id = existing_transaction_id(db, scoped_key)
+        if existing_id is not None:
+            return str(existing_id), None
+        if not rebalance_treasury_shard(db, asset_type_id, treasury_id, amount):
+            return _reject(db, scoped_key, InsufficientFunds("Insufficient treasury funds"))
+        user_row, treasury_row = _lock_accounts(db, user_id, asset_type_id, treasury_id, tx_type in TREASURY_DEBITS)
+        if treasury_row.balance < amount:
+            return _reject(db, scoped_key, InsufficientFunds("Insufficient treasury funds"))
+
+    if tx_type in TREASURY_DEBITS:
+        from_row, to_row = treasury_row, user_row
+    else:
+        from_row, to_row = user_row, treasury_row
+        if user_row.balance < amount:
+            return _reject(db, scoped_key, InsufficientFunds("Insufficient funds"))
+
+    try:
+        transaction_id, versions = apply_posting(
+            db, tx_type, scoped_key, asset_type_id, amount,
+            from_row.account_id, to_row.account_id,
+            [(from_row.account_id, -amount), (to_row.account_id, amount)],
+        )
+    except InsufficientFunds:
+        db.rollback()
+        record_posting_failure("insufficient_funds")
+        raise
+    except IntegrityError as e:
+        # The key was already used, or is being used by a concurrent request
+        # that has since committed: the unique index made us wait for it.
+        existing_id = existing_transaction_id(db, scoped_key)
+        if existing_id is None:
+            raise posting_failed(tx_type.value.lower(), e)
+        return str(existing_id), None
+    except Exception as e:
+        db.rollback()
+        raise posting_failed(tx_type.value.lower(), e)
+
+    commit_posting(db, tx_type.value.lower())
+    completed_postings.put(scoped_key, transaction_id)
+    user_balances.invalidate_users((user_id,))
+    lsn = commit_lsn(db)
+    return str(transaction_id), consistency_token(user_row.account_id, versions[user_row.account_id], lsn)
+
+def post_transfer(db: Session, from_user_id: int, to_user_id: int, asset_code: str, amount: int, fee: int,
+                  idempotency_key: str):
+    """Move `amount` from one user to another, plus `fee` from the sender to REVENUE.
+
+    The recipient's account in the asset is created if needed. Returns
+    (transaction id, consistency token for the sender's new balance), or the
+    earlier transaction's id and no token if the sender already used the key.
+    """
+    if from_user_id == to_user_id:
+        raise InvalidTransfer("Sender and recipient must differ")
+    scoped_key = scoped_idempotency_key(from_user_id, idempotency_key)
+    cached_id = completed_postings.get(scoped_key)
+    if cached_id is not None:
+        return cached_id, None
+
+    asset_type_id = reference_data.asset_id(asset_code)
+    if asset_type_id is None:
+        raise InvalidAsset("Invalid asset code")
+    revenue_id = revenue_account_id(asset_type_id, from_user_id) if fee else None
+    if fee and revenue_id is None:
+        raise AccountNotFound("Account not found")
+
+    # Looked up without locks; apply_posting locks everything at once.
+    sender_key, recipient_key = (from_user_id, asset_type_id), (to_user_id, asset_type_id)
+    accounts = _user_accounts(db, [sender_key, recipient_key])
+    if sender_key in accounts and recipient_key not in accounts:
+        db.execute(PROVISION_ACCOUNT_SQL, {"user_id": to_user_id, "asset_type_id": asset_type_id})
+        accounts.update(_user_accounts(db, [recipient_key]))
+    if sender_key not in accounts or recipient_key not in accounts:
+        db.rollback()
+        raise AccountNotFound("Account not found")
+    sender_id, recipient_id = accounts[sender_key], accounts[recipient_key]
+
+    legs = [(sender_id, -(amount + fee)), (recipient_id, amount)]
+    if fee:
+        legs.append((revenue_id, fee))
+    try:
+        transaction_id, versions = apply_posting(
+            db, TransactionType.TRANSFER, scoped_key, asset_type_id, amount, sender_id, recipient_id, legs, lock=True,
+        )
+    except InsufficientFunds as e:
+        return _reject(db, scoped_key, e)
+    except IntegrityError as e:
+        existing_id = existing_transaction_id(db, scoped_key)
+        if existing_id is None:
+            raise posting_failed("transfer", e)
+        return str(existing_id), None
+    except Exception as e:
+        db.rollback()
+        raise posting_failed("transfer", e)
+
+    commit_posting(db, "transfer")
+    completed_postings.put(scoped_key, transaction_id)
+    user_balances.invalidate_users((from_user_id, to_user_id))
+    lsn = commit_lsn(db)
+    return str(transaction_id), consistency_token(sender_id, versions[sender_id], lsn)
+
+def _batch_result(item, status: str, transaction_id=None, detail=None) -> dict:
+    return {
+        "idempotencyKey": item.idempotencyKey, "userId": item.userId,
+        "transactionId": str(transaction_id) if transaction_id is not None else None,
+        "status": status, "detail": detail, "consistencyToken": None,
+    }
+
+def post_batch(db: Session, tx_type: TransactionType, items) -> list:
+    """Post many treasury<->user transactions in one database transaction.
+
+    `items` are request objects with userId, assetCode, amount and
+    idempotencyKey. All balance rows involved are locked once, in account id
+    order; items are then checked for funds in request order, and everything
+    accepted is written with a fixed number of statements. Returns one result
+    per item: completed, duplicate (with the earlier transaction id) or failed.
+    """
+    results = [None] * len(items)
+    scoped_keys = [scoped_idempotency_key(item.userId, item.idempotencyKey) for item in items]
+
+    # Repeats of a key within the batch resolve to whatever the first one did.
+    first_index = {}
+    pending = []
+    for i, item in enumerate(items):
+        if scoped_keys[i] in first_index:
+            continue
+        first_index[scoped_keys[i]] = i
+        asset_type_id = reference_data.asset_id(item.assetCode)
+        if asset_type_id is None:
+            results[i] = _batch_result(item, "failed", detail="Invalid asset code")
+        else:
+            pending.append((i, asset_type_id))
+
+    uncached = []
+    for i, asset_type_id in pending:
+        cached_id = completed_postings.get(scoped_keys[i])
+        if cached_id is not None:
+            results[i] = _batch_result(items[i], "duplicate", cached_id)
+        else:
+            uncached.append((i, asset_type_id))
+
+    conflict = None
+    while uncached:
+        existing = dict(db.execute(BATCH_EXISTING_KEYS_SQL, {"keys": [scoped_keys[i] for i, _ in uncached]}).all())
+        candidates = []
+        for i, asset_type_id in uncached:
+            if scoped_keys[i] in existing:
+                completed_postings.put(scoped_keys[i], existing[scoped_keys[i]])
+                results[i] = _batch_result(items[i], "duplicate", existing[scoped_keys[i]])
+            else:
+                candidates.append((i, asset_type_id))
+        if not candidates:
+            db.rollback()
+            break
+        if conflict is not None and len(candidates) == len(uncached):
+            # No key turned out to be taken, so the violation was something else.
+            raise posting_failed(f"batch {tx_type.value.lower()}", conflict)
+        try:
+            _post_batch_candidates(db, tx_type, items, scoped_keys, candidates, results)
+            break
+        except IntegrityError as e:
+            # A concurrent request committed one of the keys since the lookup
+            # above (the unique index made us wait for it). Nothing of the
+            # batch was written: look the keys up again and post the rest.
+            db.rollback()
+            conflict = e
+            for i, _ in candidates:
+                results[i] = None
+            uncached = candidates
+
+    for i, item in enumerate(items):
+        if results[i] is None:
+            first = results[first_index[scoped_keys[i]]]
+            status = "duplicate" if first["status"] != "failed" else "failed"
+            results[i] = _batch_result(item, status, first["transactionId"], first["detail"])
+    return results
+
+def _user_accounts(db: Session, pairs) -> dict:
+    return {
+        (row.user_id, row.asset_type_id): row.id
+        for row in db.execute(BATCH_USER_ACCOUNTS_SQL, {
+            "user_ids": [user_id for user_id, _ in pairs],
+            "asset_type_ids": [asset_type_id for _, asset_type_id in pairs],
+        })
+    }
+
+def _post_batch_candidates(db: Session, tx_type: TransactionType, items, scoped_keys, candidates, results):
+    wanted = {(items[i].userId, asset_type_id) for i, asset_type_id in candidates}
+    user_accounts = _user_accounts(db, wanted)
+    missing = sorted(wanted - user_accounts.keys())
+    if missing and tx_type in TREASURY_DEBITS:
+        db.execute(PROVISION_ACCOUNTS_SQL, {
+            "user_ids": [user_id for user_id, _ in missing],
+            "asset_type_ids": [asset_type_id for _, asset_type_id in missing],
+        })
+        user_accounts.update(_user_accounts(db, missing))
+    treasury_accounts = dict(db.execute(BATCH_TREASURY_SQL, {
+        "treasury": TREASURY, "asset_type_ids": sorted({asset_type_id for _, asset_type_id in candidates}),
+    }).all())
+
+    postable = []
+    for i, asset_type_id in candidates:
+        user_account_id = user_accounts.get((items[i].userId, asset_type_id))
+        treasury_id = treasury_accounts.get(asset_type_id)
+        if user_account_id is None or treasury_id is None:
+            results[i] = _batch_result(items[i], "failed", detail="Account not found")
+        else:
+            postable.append((i, asset_type_id, user_account_id, treasury_id))
+    if not postable:
+        db.rollback()
+        return
+
+    account_ids = sorted({acc for _, _, user_acc, treasury_acc in postable for acc in (user_acc, treasury_acc)})
+    balances = dict(db.execute(BATCH_LOCK_SQL, {"account_ids": account_ids}).all())
+
+    deltas = {}
+    txs, entries = [], []
+    for i, asset_type_id, user_account_id, treasury_id in postable:
+        item = items[i]
+        if tx_type in TREASURY_DEBITS:
+            from_id, to_id, shortfall = treasury_id, user_account_id, "Insufficient treasury funds"
+        else:
+            from_id, to_id, shortfall = user_account_id, treasury_id, "Insufficient funds"
+        if balances[from_id] < item.amount:
+            record_posting_failure("insufficient_funds")
+            results[i] = _batch_result(item, "failed", detail=shortfall)
+            continue
+
+        balances[from_id] -= item.amount
+        balances[to_id] += item.amount
+        deltas[from_id] = deltas.get(from_id, 0) - item.amount
+        deltas[to_id] = deltas.get(to_id, 0) + item.amount
+
+        transaction_id = uuid7()
+        txs.append((str(transaction_id), scoped_keys[i], asset_type_id, item.amount, from_id, to_id))
+        entries.append((str(transaction_id), from_id, -item.amount))
+        entries.append((str(transaction_id), to_id, item.amount))
+        results[i] = _batch_result(item, "completed", transaction_id)
+
+    if not txs:
+        db.rollback()
+        return
+
+    touched = sorted(account_id for account_id, delta in deltas.items() if delta != 0)
+    try:
+        versions = dict(db.execute(BATCH_APPLY_SQL, {
+            "delta_accounts": touched, "delta_amounts": [deltas[a] for a in touched],
+            "type": tx_type.value,
+            "tx_ids": [t[0] for t in txs], "tx_keys": [t[1] for t in txs], "tx_assets": [t[2] for t in txs],
+            "tx_amounts": [t[3] for t in txs], "tx_from": [t[4] for t in txs], "tx_to": [t[5] for t in txs],
+            "entry_txs": [e[0] for e in entries], "entry_accounts": [e[1] for e in entries],
+            "entry_amounts": [e[2] for e in entries],
+        }).all())
+    except IntegrityError:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise posting_failed(f"batch {tx_type.value.lower()}", e)
+    if len(versions) != len(touched):
+        # Every balance was locked and checked above, so this means the
+        # checks and the guard in BATCH_APPLY_SQL disagree; nothing is written.
+        db.rollback()
+        record_posting_failure("insufficient_funds")
+        raise InsufficientFunds("Insufficient funds")
+
+    commit_posting(db, f"batch {tx_type.value.lower()}")
+    for transaction_id, scoped_key, *_ in txs:
+        completed_postings.put(scoped_key, transaction_id)
+    user_balances.invalidate_users({items[i].userId for i, *_ in postable})
+    lsn = commit_lsn(db)
+    for i, _, user_account_id, _ in postable:
+        if results[i]["status"] == "completed":
+            results[i]["consistencyToken"] = consistency_token(user_account_id, versions[user_account_id], lsn)
@@ -0,0 +1,89 @@
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from ..db import engine
+
+logger = logging.getLogger(__name__)
+
+class PgListener:
+    """Background thread that LISTENs on Postgres channels and runs callbacks.
+
+    Uses its own connection outside the pool. Callbacks get the notification
+    payload, or None after a reconnect, meaning notifications may have been
+    missed and subscribers should drop whatever they cached.
+    """
+
+    def __init__(self, engine, poll_interval: float = 5.0):
+        self._engine = engine
+        self._poll_interval = poll_interval
+        self._callbacks = defaultdict(list)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, channel: str, callback):
+        self._callbacks[channel].append(callback)
+
+    def start(self):
+        if self._thread is not None or not self._callbacks:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._poll_interval + 1)
+            self._thread = None
+
+    def _connect(self):
+        cargs, cparams = self._engine.dialect.create_connect_args(self._engine.url)
+        conn = self._engine.dialect.dbapi.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for channel in self._callbacks:
+                cursor.execute(f'LISTEN "{channel}"')
+        return conn
+
+    def _dispatch(self, channel: str, payload):
+        for callback in self._callbacks.get(channel, []):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Notification callback for %s failed", channel)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                conn = self._connect()
+            except Exception:
+                logger.exception("Could not connect notification listener, retrying in %.0fs", backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            backoff = 1.0
+            # Anything could have changed while we weren't listening.
+            for channel in list(self._callbacks):
+                self._dispatch(channel, None)
+            try:
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self._poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception:
+                logger.exception("Notification listener connection lost")
+                time.sleep(backoff)
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+listener = PgListener(engine)
@@ -0,0 +1,54 @@
+import logging
+import threading
+from sqlalchemy import text
+from ..config import LEDGER_PARTITION_CHECK_SECONDS, LEDGER_PARTITION_MONTHS_AHEAD
+from ..db import engine
+
+logger = logging.getLogger(__name__)
+
+ENSURE_PARTITIONS_SQL = text("SELECT ensure_ledger_partitions(:months_ahead)")
+
+def ensure_ledger_partitions(months_ahead: int = LEDGER_PARTITION_MONTHS_AHEAD) -> int:
+    """Create any missing monthly ledger partitions; returns how many were created."""
+    with engine.begin() as conn:
+        created = conn.execute(ENSURE_PARTITIONS_SQL, {"months_ahead": months_ahead}).scalar()
+    if created:
+        logger.info("Created %d ledger partitions", created)
+    return created
+
+class PartitionMaintainer:
+    """Background thread keeping ledger partitions created ahead of time.
+
+    Inserts into a month without a partition fail, so every worker checks on
+    startup and then periodically; ensure_ledger_partitions takes an advisory
+    lock, so workers doing it at the same time don't collide.
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ledger-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                ensure_ledger_partitions()
+            except Exception:
+                logger.exception("Could not create ledger partitions")
+            if self._stop.wait(self._interval):
+                return
+
+partition_maintainer = PartitionMaintainer(LEDGER_PARTITION_CHECK_SECONDS)
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from ..config import REFERENCE_DATA_TTL_SECONDS
+from ..db import DB_ASYNC, SessionLocal
+from ..models import Account, AssetType, OwnerType
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_CHANNEL = "reference_data_changed"
+
+class ReferenceDataCache:
+    """Asset codes and system account ids, which almost never change.
+
+    Lookups are served from memory. The whole set is reloaded when it is older
+    than the TTL, when a change notification arrives, or on a miss (at most
+    once per `miss_reload_interval`, so bad asset codes can't force a reload
+    on every request).
+
+    With `background`, those reloads run on a thread and lookups keep serving
+    the loaded set meanwhile (a miss stays a miss until the reload lands).
+    Async mode needs this: lookups run on the event loop, where a blocking
+    query would stall every request. Only the very first load, normally done
+    at startup, is made in place.
+    """
+
+    def __init__(self, ttl: float, miss_reload_interval: float = 1.0, background: bool = False):
+        self._ttl = ttl
+        self._miss_reload_interval = miss_reload_interval
+        self._background = background
+        self._lock = threading.Lock()
+        self._asset_ids = {}
+        self._asset_codes = {}
+        self._system_accounts = {}
+        self._loaded_at = None
+        self._invalidated = False
+        self._refreshing = False
+        self._refresh_started = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def reload(self):
+        with self._lock:
+            # A change notified while this load runs makes the next lookup reload again.
+            self._invalidated = False
+        db = SessionLocal()
+        try:
+            assets = db.query(AssetType.id, AssetType.code).order_by(AssetType.id).all()
+            system_accounts = (
+                db.query(Account.id, Account.system_name, Account.asset_type_id, Account.shard)
+                .filter(Account.owner_type == OwnerType.SYSTEM)
+                .all()
+            )
+        except Exception:
+            with self._lock:
+                self._invalidated = True
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self._asset_ids = {a.code: a.id for a in assets}
+            self._asset_codes = {a.id: a.code for a in assets}
+            self._system_accounts = {(acc.system_name, acc.asset_type_id, acc.shard): acc.id for acc in system_accounts}
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+            return self._loaded_at
+
+    def invalidate(self, payload=None):
+        with self._lock:
+            self._invalidated = True
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            return self.reload()
+        if self._invalidated or time.monotonic() - loaded_at > self._ttl:
+            return self._refresh()
+        return loaded_at
+
+    def _refresh(self):
+        """Reload, or with `background` start a reload on a thread; returns the current load time."""
+        if not self._background:
+            return self.reload()
+        with self._lock:
+            now = time.monotonic()
+            if self._refreshing or now - self._refresh_started < self._miss_reload_interval:
+                return self._loaded_at
+            self._refreshing = True
+            self._refresh_started = now
+        threading.Thread(target=self._reload_in_background, name="reference-data-refresh", daemon=True).start()
+        return self._loaded_at
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception:
+            logger.exception("Could not refresh the reference data cache")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _lookup(self, mapping_name: str, key):
+        loaded_at = self._ensure_loaded()
+        value = getattr(self, mapping_name).get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        if time.monotonic() - loaded_at > self._miss_reload_interval:
+            self._refresh()
+            value = getattr(self, mapping_name).get(key)
+        return value
+
+    def asset_id(self, code: str):
+        return self._lookup("_asset_ids", code)
+
+    def asset_code(self, asset_type_id: int):
+        return self._lookup("_asset_codes", asset_type_id)
+
+    def asset_codes(self):
+        self._ensure_loaded()
+        self.hits += 1
+        return list(self._asset_codes.values())
+
+    def system_account_id(self, system_name: str, asset_type_id: int, shard: int = 0):
+        return self._lookup("_system_accounts", (system_name, asset_type_id, shard))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "reloads": self.reloads}
+
+reference_data = ReferenceDataCache(REFERENCE_DATA_TTL_SECONDS, background=DB_ASYNC)
+
+def warm_reference_data():
+    try:
+        reference_data.reload()
+    except Exception:
+        # Not fatal: the cache loads lazily on the first request instead.
+        logger.exception("Could not warm the reference data cache")
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from typing import Optional
+from fastapi import Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from ..config import REPLICA_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS
+from ..db import AsyncReadSessionLocal, AsyncSessionLocal, ReadSessionLocal, SessionLocal, read_engine
+from ..metrics import record_read_route, record_replica_lag
+from .balance_cache import consistency_token_lsn
+
+logger = logging.getLogger(__name__)
+
+CURRENT_LSN_SQL = text("SELECT pg_current_wal_lsn() - '0/0'")
+
+# Replayed WAL position and lag. A standby that has replayed everything it
+# received counts as caught up; pg_last_xact_replay_timestamp alone would
+# report a growing lag while the primary is idle. A server that isn't in
+# recovery (READ_DATABASE_URL pointing at a primary) is never behind.
+REPLICA_STATUS_SQL = text("""
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END - '0/0',
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()) END
+""")
+
+def commit_lsn(db: Session) -> Optional[int]:
+    """The primary's WAL position, read after a commit, for consistency tokens.
+
+    None when no replica is configured, which saves the round trip, and when
+    the read fails: the posting has committed by then, so it shouldn't fail
+    the request. A token without a position sends reads to the primary.
+    """
+    if read_engine is None:
+        return None
+    try:
+        return int(db.execute(CURRENT_LSN_SQL).scalar())
+    except Exception:
+        logger.warning("Could not read the WAL position after a commit", exc_info=True)
+        db.rollback()
+        return None
+
+class ReplicaMonitor:
+    """Background thread tracking how far the read replica has replayed.
+
+    Routing decisions use the last measurement, so they cost nothing per
+    request; a measurement older than a few intervals (replica unreachable)
+    counts as unusable, and reads fall back to the primary.
+    """
+
+    def __init__(self, engine, interval: float, max_lag: float):
+        self._engine = engine
+        self._interval = interval
+        self._max_lag = max_lag
+        self._status = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None or self._engine is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def usable(self, min_lsn: Optional[int] = None) -> bool:
+        """Whether the replica is within the lag tolerance and has replayed `min_lsn`."""
+        status = self._status
+        if status is None:
+            return False
+        replay_lsn, lag, checked_at = status
+        if time.monotonic() - checked_at > 3 * self._interval:
+            return False
+        if lag is None or lag > self._max_lag:
+            return False
+        return min_lsn is None or replay_lsn >= min_lsn
+
+    def check(self):
+        with self._engine.connect() as conn:
+            replay_lsn, lag = conn.execute(REPLICA_STATUS_SQL).one()
+        lag = float(lag) if lag is not None else None
+        self._status = (int(replay_lsn or 0), lag, time.monotonic())
+        if lag is not None:
+            record_replica_lag(lag)
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                self._status = None
+                logger.exception("Could not check the read replica")
+            if self._stop.wait(self._interval):
+                return
+
+replica_monitor = ReplicaMonitor(read_engine, REPLICA_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS)
+
+def use_replica(token: Optional[str]) -> bool:
+    """Route a read to the replica?
+
+    A consistency token without a WAL position (a duplicate posting, or one
+    made before the replica was configured) can't be checked, so it goes to
+    the primary; so does a malformed one, which the endpoint then rejects.
+    """
+    if read_engine is None:
+        return False
+    if token is None:
+        return replica_monitor.usable()
+    try:
+        lsn = consistency_token_lsn(token)
+    except ValueError:
+        return False
+    return lsn is not None and replica_monitor.usable(lsn)
+
+def get_read_db(consistency_token: Optional[str] = Query(None, alias="consistencyToken")):
+    replica = use_replica(consistency_token)
+    record_read_route("replica" if replica else "primary")
+    db = (ReadSessionLocal if replica else SessionLocal)()
+    db.info["replica"] = replica
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(consistency_token: Optional[str] = Query(None, alias="consistencyToken")):
+    replica = use_replica(consistency_token)
+    record_read_route("replica" if replica else "primary")
+    async with (AsyncReadSessionLocal if replica else AsyncSessionLocal)() as db:
+        db.info["replica"] = replica
+        yield db
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import (
+    POSTING_LOCK_TIMEOUT_MS, POSTING_MAX_ATTEMPTS, POSTING_RETRY_BASE_MS, POSTING_RETRY_MAX_MS, POSTING_ROUTES,
+    POSTING_SERIALIZABLE, POSTING_STATEMENT_TIMEOUT_MS,
+)
+from ..metrics import failure_reason, record_posting_failure, record_posting_retry
+from .ledger import RETRYABLE_FAILURES, PostingConflict, posting_failed
+
+logger = logging.getLogger(__name__)
+
+def _transaction_settings(route: str) -> list:
+    """Statements that start each transaction of a posting on `route`."""
+    statements = []
+    if POSTING_SERIALIZABLE:
+        statements.append(text("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"))
+    timeouts = [
+        f"set_config('{name}', '{milliseconds}', true)"
+        for name, milliseconds in (
+            ("lock_timeout", POSTING_LOCK_TIMEOUT_MS[route]),
+            ("statement_timeout", POSTING_STATEMENT_TIMEOUT_MS[route]),
+        )
+        if milliseconds
+    ]
+    if timeouts:
+        statements.append(text(f"SELECT {', '.join(timeouts)}"))
+    return statements
+
+TRANSACTION_SETTINGS = {route: _transaction_settings(route) for route in POSTING_ROUTES}
+
+@event.listens_for(Session, "after_begin")
+def _apply_transaction_settings(session, transaction, connection):
+    # Every transaction a posting begins, not just its first: the posting
+    # code commits or rolls back along the way (treasury refills, rejected
+    # postings), and SET LOCAL only lasts until then.
+    for statement in session.info.get("transaction_settings", ()):
+        connection.execute(statement)
+
+def _retry_reason(exc: Exception):
+    if isinstance(exc, PostingConflict):
+        return exc.reason
+    if isinstance(exc, DBAPIError):
+        reason = failure_reason(exc)
+        if reason in RETRYABLE_FAILURES:
+            return reason
+    return None
+
+class PostingRetries:
+    """Counts of postings run again, and of those that ran out of attempts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retried = {reason: 0 for reason in sorted(RETRYABLE_FAILURES)}
+        self.exhausted = 0
+
+    def next_delay(self, route: str, attempt: int, exc: Exception) -> float:
+        """Seconds to wait before attempt `attempt + 1`, or raise if `exc` ends the posting.
+
+        Backoff is "full jitter": uniform between 0 and the exponential
+        bound, so postings that collided once don't collide again in lockstep.
+        """
+        reason = _retry_reason(exc)
+        if reason is None:
+            if isinstance(exc, DBAPIError):
+                # From a statement the posting code doesn't wrap itself, such
+                # as its lock statement hitting statement_timeout.
+                raise posting_failed(route, exc) from exc
+            raise exc
+        if attempt >= POSTING_MAX_ATTEMPTS:
+            with self._lock:
+                self.exhausted += 1
+            logger.warning("Giving up on a %s posting after %d attempts: %s", route, attempt, exc)
+            record_posting_failure(reason)
+            if isinstance(exc, PostingConflict):
+                raise exc
+            raise PostingConflict(reason) from exc
+        with self._lock:
+            self.retried[reason] += 1
+        record_posting_retry(route, reason)
+        bound = min(POSTING_RETRY_MAX_MS, POSTING_RETRY_BASE_MS * 2 ** (attempt - 1))
+        return random.uniform(0, bound) / 1000
+
+    def stats(self) -> dict:
+        return {"retried": dict(self.retried), "exhausted": self.exhausted}
+
+posting_retries = PostingRetries()
+
+def run_posting(db: Session, route: str, fn, *args):
+    """fn(db, *args) with `route`'s transaction settings, run again on transient conflicts.
+
+    A deadlock, serialization failure or lock timeout means the posting lost
+    to concurrent ones and nothing of it was committed, so it runs again from
+    the start; its idempotency key still applies if an earlier attempt did
+    get through after all. Out of attempts, it raises PostingConflict (503).
+    """
+    db.info["transaction_settings"] = TRANSACTION_SETTINGS[route]
+    try:
+        attempt = 1
+        while True:
+            try:
+                return fn(db, *args)
+            except Exception as e:
+                db.rollback()
+                time.sleep(posting_retries.next_delay(route, attempt, e))
+                attempt += 1
+    finally:
+        db.info.pop("transaction_settings", None)
+
+async def run_posting_async(db: AsyncSession, route: str, fn, *args):
+    """run_posting for the async endpoints: fn runs through run_sync, and waits don't block the loop."""
+    db.info["transaction_settings"] = TRANSACTION_SETTINGS[route]
+    try:
+        attempt = 1
+        while True:
+            try:
+                return await db.run_sync(fn, *args)
+            except Exception as e:
+                await db.rollback()
+                await asyncio.sleep(posting_retries.next_delay(route, attempt, e))
+                attempt += 1
+    finally:
+        db.info.pop("transaction_settings", None)
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from ..config import BALANCE_SNAPSHOT_SAFETY_SECONDS
+from .ledger import LedgerError
+
+class HistoryArchived(LedgerError):
+    status_code = 400
+
+# A snapshot time no posting can still commit entries at or before: the
+# safety margin in the past, or earlier if some transaction has been open
+# longer. Entries default created_at to their transaction's NOW(), which is
+# its xact_start, so the bound must be strictly before the oldest one.
+SNAPSHOT_TIME_SQL = text("""
+    SELECT LEAST(
+        NOW() - make_interval(secs => :safety_seconds),
+        (SELECT MIN(xact_start) - interval '1 microsecond' FROM pg_stat_activity
+         WHERE datname = current_database() AND pid <> pg_backend_pid())
+    ),
+    (SELECT MAX(as_of) FROM balance_snapshots)
+""")
+
+# Checkpoints every account with entries since the last run (every account
+# on the first run). A checkpoint is the current balance minus the entries
+# dated after it, so it also covers funds put in outside the ledger and
+# history that has since been archived.
+TAKE_SNAPSHOTS_SQL = text("""
+    INSERT INTO balance_snapshots (account_id, as_of, balance)
+    SELECT b.account_id, :as_of, b.balance - COALESCE(later.total, 0)
+    FROM balances b
+    LEFT JOIN (
+        SELECT account_id, SUM(amount) AS total FROM ledger_entries WHERE created_at > :as_of GROUP BY account_id
+    ) later ON later.account_id = b.account_id
+    WHERE CAST(:previous AS timestamptz) IS NULL OR b.account_id IN (
+        SELECT account_id FROM ledger_entries WHERE created_at > :previous AND created_at <= :as_of
+    )
+    ON CONFLICT (account_id, as_of) DO NOTHING
+""")
+
+ARCHIVED_UNTIL_SQL = text("SELECT MAX(range_end) FROM ledger_archives")
+
+# Balance of each account as of :as_of (entries with created_at <= :as_of
+# included), starting from whichever is closest in time: the last checkpoint
+# before, the first one after, or the current balance. Only the entries
+# between the anchor and :as_of are summed. One statement, so the current
+# balance and the entries come from the same snapshot of the database.
+BALANCES_AS_OF_SQL = text("""
+    WITH anchors AS (
+        SELECT a.account_id, b.balance AS current_balance,
+               before.as_of AS before_at, before.balance AS before_balance,
+               after.as_of AS after_at, after.balance AS after_balance
+        FROM unnest(CAST(:account_ids AS integer[])) AS a(account_id)
+        JOIN balances b ON b.account_id = a.account_id
+        LEFT JOIN LATERAL (
+            SELECT as_of, balance FROM balance_snapshots s
+            WHERE s.account_id = a.account_id AND s.as_of <= :as_of
+              AND s.as_of >= COALESCE(CAST(:floor AS timestamptz), '-infinity')
+            ORDER BY s.as_of DESC LIMIT 1
+        ) before ON true
+        LEFT JOIN LATERAL (
+            SELECT as_of, balance FROM balance_snapshots s
+            WHERE s.account_id = a.account_id AND s.as_of > :as_of
+            ORDER BY s.as_of LIMIT 1
+        ) after ON true
+    ),
+    chosen AS (
+        SELECT account_id,
+               CASE WHEN forward THEN before_balance ELSE COALESCE(after_balance, current_balance) END AS anchor_balance,
+               CASE WHEN forward THEN before_at ELSE CAST(:as_of AS timestamptz) END AS range_start,
+               CASE WHEN forward THEN CAST(:as_of AS timestamptz) ELSE after_at END AS range_end,
+               CASE WHEN forward THEN 1 ELSE -1 END AS direction
+        FROM (
+            SELECT *, before_at IS NOT NULL
+                      AND CAST(:as_of AS timestamptz) - before_at <= COALESCE(after_at, NOW()) - CAST(:as_of AS timestamptz)
+                      AS forward
+            FROM anchors
+        ) a
+    )
+    SELECT c.account_id, CAST(c.anchor_balance + c.direction * COALESCE(delta.total, 0) AS bigint) AS balance
+    FROM chosen c
+    LEFT JOIN LATERAL (
+        SELECT SUM(e.amount) AS total FROM ledger_entries e
+        WHERE e.account_id = c.account_id AND e.created_at > c.range_start
+          AND (c.range_end IS NULL OR e.created_at <= c.range_end)
+    ) delta ON true
+""")
+
+STATEMENT_ENTRIES_SQL = text("""
+    SELECT e.transaction_id, t.type, e.amount, e.created_at
+    FROM ledger_entries e
+    JOIN ledger_transactions t ON t.id = e.transaction_id AND t.created_at = e.created_at
+    WHERE e.account_id = :account_id AND e.created_at >= :start AND e.created_at < :end
+    ORDER BY e.created_at, e.id
+""")
+
+def take_balance_snapshots(db: Session, safety_seconds: float = BALANCE_SNAPSHOT_SAFETY_SECONDS):
+    """Write a checkpoint for every account that changed since the last run.
+
+    Returns (snapshot time, accounts checkpointed); the count is 0 if no time
+    has passed since the previous snapshot. The caller commits.
+    """
+    as_of, previous = db.execute(SNAPSHOT_TIME_SQL, {"safety_seconds": safety_seconds}).one()
+    if previous is not None and as_of <= previous:
+        return previous, 0
+    written = db.execute(TAKE_SNAPSHOTS_SQL, {"as_of": as_of, "previous": previous}).rowcount
+    return as_of, written
+
+def balances_as_of(db: Session, account_ids, as_of: datetime) -> dict:
+    """{account_id: balance} as of `as_of`, inclusive.
+
+    Raises HistoryArchived if `as_of` falls in an archived ledger month, whose
+    entries are no longer in the database.
+    """
+    floor = db.execute(ARCHIVED_UNTIL_SQL).scalar()
+    if floor is not None and as_of < floor:
+        raise HistoryArchived(f"Ledger history before {floor.isoformat()} is archived")
+    rows = db.execute(BALANCES_AS_OF_SQL, {
+        "account_ids": list(account_ids), "as_of": as_of, "floor": floor,
+    })
+    return {row.account_id: row.balance for row in rows}
+
+def account_statement(db: Session, account_id: int, start: datetime, end: datetime) -> dict:
+    """Opening balance, entries with running balance and closing balance for [start, end)."""
+    opening = balances_as_of(db, [account_id], start - timedelta(microseconds=1))[account_id]
+    balance = opening
+    entries = []
+    for row in db.execute(STATEMENT_ENTRIES_SQL, {"account_id": account_id, "start": start, "end": end}):
+        balance += row.amount
+        entries.append({
+            "transactionId": str(row.transaction_id),
+            "type": row.type,
+            "amount": row.amount,
+            "balance": balance,
+            "createdAt": row.created_at.isoformat(),
+        })
+    return {"openingBalance": opening, "closingBalance": balance, "entries": entries}
@@ -0,0 +1,98 @@
+from sqlalchemy.orm import Session
+from ..config import TREASURY_SHARDS
+from ..models import Account, Balance, LedgerTransaction, LedgerEntry, OwnerType, TransactionType
+from .ids import uuid7
+from .refdata import reference_data
+
+TREASURY = "TREASURY"
+REVENUE = "REVENUE"
+
+def shard_for_user(user_id: int) -> int:
+    # Deterministic, so all of a user's postings for an asset hit the same shard.
+    return user_id % TREASURY_SHARDS
+
+def _system_account_id(system_name: str, asset_type_id: int, user_id: int):
+    shard = shard_for_user(user_id)
+    if shard:
+        account_id = reference_data.system_account_id(system_name, asset_type_id, shard)
+        if account_id is not None:
+            return account_id
+    return reference_data.system_account_id(system_name, asset_type_id, 0)
+
+def treasury_account_id(asset_type_id: int, user_id: int):
+    # The user's shard, or shard 0 while that shard hasn't been provisioned
+    # yet, served from the reference data cache.
+    return _system_account_id(TREASURY, asset_type_id, user_id)
+
+def treasury_shard_ids(asset_type_id: int) -> list:
+    # Every provisioned treasury shard of the asset, from the reference data cache.
+    shard_ids = (reference_data.system_account_id(TREASURY, asset_type_id, shard) for shard in range(TREASURY_SHARDS))
+    return [account_id for account_id in shard_ids if account_id is not None]
+
+def revenue_account_id(asset_type_id: int, user_id: int):
+    # REVENUE is sharded like the treasury when its shards are provisioned, so
+    # fee-paying transfers don't all queue on one row.
+    return _system_account_id(REVENUE, asset_type_id, user_id)
+
+def lock_treasury_balances(db: Session, asset_type_id: int):
+    return (
+        db.query(Balance)
+        .join(Account, Account.id == Balance.account_id)
+        .filter(Account.owner_type == OwnerType.SYSTEM, Account.system_name == TREASURY, Account.asset_type_id == asset_type_id)
+        .order_by(Balance.account_id)
+        .with_for_update(of=Balance)
+        .all()
+    )
+
+def move_between_shards(db: Session, asset_type_id: int, source: Balance, target: Balance, amount: int):
+    # Both balance rows must already be locked by the caller.
+    source.balance -= amount
+    target.balance += amount
+
+    transaction_id = uuid7()
+    new_tx = LedgerTransaction(
+        id=transaction_id, type=TransactionType.REBALANCE, idempotency_key=f"rebalance:{transaction_id.hex}",
+        asset_type_id=asset_type_id, amount=amount, from_account_id=source.account_id, to_account_id=target.account_id
+    )
+    entries = [
+        LedgerEntry(account_id=source.account_id, amount=-amount),
+        LedgerEntry(account_id=target.account_id, amount=amount)
+    ]
+    entries.sort(key=lambda e: e.account_id)
+    new_tx.entries.extend(entries)
+    db.add(new_tx)
+
+def rebalance_treasury_shard(db: Session, asset_type_id: int, account_id: int, needed: int) -> bool:
+    """Refill a treasury shard from its richest sibling so it can cover `needed`.
+
+    Runs in its own transaction, so the caller must not be holding any balance
+    locks. Returns True if the shard can now cover the amount.
+    """
+    shard_balances = lock_treasury_balances(db, asset_type_id)
+    balance_map = {b.account_id: b for b in shard_balances}
+    target = balance_map.get(account_id)
+    donors = [b for b in shard_balances if b.account_id != account_id]
+
+    if target is not None and target.balance >= needed:
+        # A concurrent request already refilled it.
+        db.rollback()
+        return True
+    if target is None or not donors:
+        db.rollback()
+        return False
+
+    donor = max(donors, key=lambda b: b.balance)
+    # Move at least the shortfall, and otherwise half the gap between the two
+    # shards, so the next posting doesn't immediately need another rebalance.
+    amount = min(donor.balance, max(needed - target.balance, (donor.balance - target.balance) // 2))
+    if amount <= 0 or target.balance + amount < needed:
+        db.rollback()
+        return False
+
+    move_between_shards(db, asset_type_id, donor, target, amount)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
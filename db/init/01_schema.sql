@@ -2,7 +2,7 @@
 
 -- Types
 CREATE TYPE owner_type AS ENUM ('USER', 'SYSTEM');
-CREATE TYPE transaction_type AS ENUM ('TOPUP', 'BONUS', 'SPEND');
+CREATE TYPE transaction_type AS ENUM ('TOPUP', 'BONUS', 'SPEND', 'REBALANCE', 'TRANSFER');
 
 -- Asset Types Table
 CREATE TABLE asset_types (
@@ -26,6 +26,7 @@ CREATE TABLE accounts (
     user_id INTEGER NULL REFERENCES users(id),
     system_name VARCHAR(64) NULL,
     asset_type_id INTEGER NOT NULL REFERENCES asset_types(id),
+    shard SMALLINT NOT NULL DEFAULT 0, -- sub-account number, only > 0 for sharded system accounts
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     
     -- Constraints
@@ -35,67 +36,287 @@ CREATE TABLE accounts (
     )
 );
 
--- Unique constraint using functional index to handle NULLs
-CREATE UNIQUE INDEX uq_owner_asset ON accounts (
-    owner_type, 
-    COALESCE(user_id, 0), 
-    COALESCE(system_name, ''), 
-    asset_type_id
-);
+-- One account per owner and asset. Partial indexes, one per owner type, so
+-- that the plain equality lookups (owner_type = 'USER' AND user_id = ? AND
+-- asset_type_id = ?) are a single index probe, and so ON CONFLICT can name
+-- them when user accounts are created on first use.
+CREATE UNIQUE INDEX uq_user_account ON accounts (user_id, asset_type_id) WHERE owner_type = 'USER';
+CREATE UNIQUE INDEX uq_system_account ON accounts (system_name, asset_type_id, shard) WHERE owner_type = 'SYSTEM';
 
 -- Balances Cache Table
 CREATE TABLE balances (
     account_id INTEGER PRIMARY KEY REFERENCES accounts(id),
     balance BIGINT NOT NULL DEFAULT 0,
+    -- Bumped on every change; the API hands it out as a read-your-writes token.
+    version BIGINT NOT NULL DEFAULT 0,
     CONSTRAINT balance_positive CHECK (balance >= 0)
 );
 
 -- Ledger Transactions Table
+-- The ledger tables are range-partitioned by month on created_at (see
+-- ensure_ledger_partitions below), so old months can be detached and archived
+-- whole. Primary and foreign keys therefore include created_at; a posting's
+-- transaction and entries are written in one database transaction and share
+-- its NOW().
 CREATE TABLE ledger_transactions (
-    id UUID PRIMARY KEY,
+    id UUID NOT NULL,
     type transaction_type NOT NULL,
-    idempotency_key VARCHAR(64) NOT NULL UNIQUE,
+    idempotency_key VARCHAR(64) NOT NULL,
     asset_type_id INTEGER NOT NULL REFERENCES asset_types(id),
     amount BIGINT NOT NULL CHECK (amount > 0),
     from_account_id INTEGER NULL REFERENCES accounts(id),
     to_account_id INTEGER NULL REFERENCES accounts(id),
     metadata JSONB NULL,
-    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
 -- Ledger Entries Table
 CREATE TABLE ledger_entries (
-    id BIGSERIAL PRIMARY KEY,
-    transaction_id UUID NOT NULL REFERENCES ledger_transactions(id) ON DELETE CASCADE,
+    id BIGSERIAL NOT NULL,
+    transaction_id UUID NOT NULL,
     account_id INTEGER NOT NULL REFERENCES accounts(id),
     amount BIGINT NOT NULL, -- positive = credit, negative = debit
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (transaction_id, created_at) REFERENCES ledger_transactions(id, created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+-- Idempotency Keys Table
+-- A unique index on a partitioned table has to include the partition key, so
+-- key uniqueness lives here. Keys outlive archived partitions: a late retry
+-- still gets the original transaction id back.
+CREATE TABLE idempotency_keys (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    transaction_id UUID NOT NULL,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Archived Ledger Months
+-- One row per month detached by scripts/archive_ledger_partitions.py, with
+-- the per-account sum of its entries, so reconciliation can still compare
+-- balances with archived totals plus live entries.
+CREATE TABLE ledger_archives (
+    id SERIAL PRIMARY KEY,
+    range_start TIMESTAMPTZ NOT NULL UNIQUE,
+    range_end TIMESTAMPTZ NOT NULL,
+    transactions BIGINT NOT NULL,
+    entries BIGINT NOT NULL,
+    location TEXT NULL, -- set once the detached partitions are exported
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    exported_at TIMESTAMPTZ NULL
+);
+
+CREATE TABLE ledger_archive_totals (
+    archive_id INTEGER NOT NULL REFERENCES ledger_archives(id),
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    amount BIGINT NOT NULL,
+    PRIMARY KEY (archive_id, account_id)
+);
+
+-- Balance Snapshots Table
+-- Checkpoints of each account's balance written by scripts/snapshot_balances.py,
+-- so a balance as of any time is its nearest checkpoint plus or minus the
+-- entries in between rather than a sum over the account's whole history.
+CREATE TABLE balance_snapshots (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    as_of TIMESTAMPTZ NOT NULL,
+    balance BIGINT NOT NULL,
+    PRIMARY KEY (account_id, as_of)
+);
+
+-- Reconciliation
+-- scripts/reconcile.py keeps each account's entry total up to the last
+-- reconciled ledger_entries.id, so a run only sums the entries added since.
+CREATE TABLE reconciliation_runs (
+    id SERIAL PRIMARY KEY,
+    from_entry_id BIGINT NOT NULL,
+    to_entry_id BIGINT NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ NULL,
+    report JSONB NULL
+);
+
+CREATE TABLE reconciliation_totals (
+    account_id INTEGER PRIMARY KEY REFERENCES accounts(id),
+    entry_total BIGINT NOT NULL DEFAULT 0,
+    -- Known difference between balance and entries (funds minted outside the ledger)
+    accepted_drift BIGINT NOT NULL DEFAULT 0
+);
+
+-- Per-run partial sums from the reconcile workers; scratch data, so unlogged.
+CREATE UNLOGGED TABLE reconciliation_staging (
+    run_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    amount BIGINT NOT NULL
+);
+CREATE INDEX idx_reconciliation_staging_run ON reconciliation_staging(run_id, account_id);
+
 -- Indexes
-CREATE INDEX idx_ledger_entries_account_id ON ledger_entries(account_id);
+-- An account's entries in a time range: statements and balance deltas
+CREATE INDEX idx_ledger_entries_account_created ON ledger_entries(account_id, created_at);
 CREATE INDEX idx_ledger_entries_transaction_id ON ledger_entries(transaction_id);
+-- Entries are appended in created_at order, so a BRIN index finds a time range cheaply
+CREATE INDEX idx_ledger_entries_created_brin ON ledger_entries USING brin (created_at);
+-- Keyset pagination of a user's history, newest first, per side of the transfer
+CREATE INDEX idx_ledger_tx_from_created ON ledger_transactions(from_account_id, created_at, id);
+CREATE INDEX idx_ledger_tx_to_created ON ledger_transactions(to_account_id, created_at, id);
+
+-- Ledger Partitions
+-- Creates the monthly partitions (UTC months) of both ledger tables from the
+-- month of `since` through `months_ahead` months past now. The API calls it
+-- on startup and daily, so inserts always have a partition to land in.
+CREATE OR REPLACE FUNCTION ensure_ledger_partitions(months_ahead INTEGER DEFAULT 3, since TIMESTAMPTZ DEFAULT NOW())
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', since AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead);
+    parent TEXT;
+    partition TEXT;
+    created INTEGER := 0;
+BEGIN
+    -- Serialize workers starting up together.
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_ledger_partitions'));
+    WHILE month_start <= last_month LOOP
+        FOREACH parent IN ARRAY ARRAY['ledger_transactions', 'ledger_entries'] LOOP
+            partition := parent || '_' || to_char(month_start, 'YYYY_MM');
+            IF to_regclass(partition) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition, parent,
+                    month_start AT TIME ZONE 'UTC', (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+                );
+                created := created + 1;
+            END IF;
+        END LOOP;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_ledger_partitions();
 
--- Deferred Ledger Integrity Trigger
+-- Ledger Integrity Triggers
+-- Statement-level with transition tables: each INSERT/UPDATE on ledger_entries
+-- is checked once, by aggregating only the rows it wrote, instead of summing
+-- every entry of the transaction once per inserted row at commit. Defined on
+-- the partitioned parent, so they see the rows written to every partition.
 CREATE OR REPLACE FUNCTION check_ledger_integrity()
 RETURNS TRIGGER AS $$
 DECLARE
-    total_amount BIGINT;
+    bad_transaction_id UUID;
+    bad_amount NUMERIC;
 BEGIN
-    SELECT SUM(amount) INTO total_amount
-    FROM ledger_entries
-    WHERE transaction_id = NEW.transaction_id;
+    -- Every statement must leave each transaction it touches balanced, so a
+    -- ledger transaction's entries net to zero once they are all written.
+    IF TG_OP = 'INSERT' THEN
+        SELECT transaction_id, SUM(amount) INTO bad_transaction_id, bad_amount
+        FROM new_entries
+        GROUP BY transaction_id
+        HAVING SUM(amount) != 0
+        LIMIT 1;
+    ELSE
+        SELECT transaction_id, SUM(amount) INTO bad_transaction_id, bad_amount
+        FROM (
+            SELECT transaction_id, amount FROM new_entries
+            UNION ALL
+            SELECT transaction_id, -amount FROM old_entries
+        ) changes
+        GROUP BY transaction_id
+        HAVING SUM(amount) != 0
+        LIMIT 1;
+    END IF;
 
-    IF COALESCE(total_amount, 0) != 0 THEN
-        RAISE EXCEPTION 'Ledger integrity violation: transaction % has non-zero sum (%)', NEW.transaction_id, total_amount;
+    IF bad_transaction_id IS NOT NULL THEN
+        RAISE EXCEPTION 'Ledger integrity violation: transaction % has non-zero sum (%)', bad_transaction_id, bad_amount;
     END IF;
 
-    RETURN NEW;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
-CREATE CONSTRAINT TRIGGER ensure_ledger_balance
-AFTER INSERT OR UPDATE ON ledger_entries
-DEFERRABLE INITIALLY DEFERRED
-FOR EACH ROW
+CREATE TRIGGER ensure_ledger_balance_insert
+AFTER INSERT ON ledger_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION check_ledger_integrity();
+
+CREATE TRIGGER ensure_ledger_balance_update
+AFTER UPDATE ON ledger_entries
+REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+FOR EACH STATEMENT
 EXECUTE FUNCTION check_ledger_integrity();
+
+-- Reference Data Change Notifications
+-- The API caches asset types and system accounts in memory; tell every worker
+-- to reload when they change.
+CREATE OR REPLACE FUNCTION notify_reference_data_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER asset_types_changed
+AFTER INSERT OR UPDATE OR DELETE ON asset_types
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_reference_data_change();
+
+CREATE TRIGGER system_accounts_changed
+AFTER INSERT OR UPDATE ON accounts
+FOR EACH ROW
+WHEN (NEW.owner_type = 'SYSTEM')
+EXECUTE FUNCTION notify_reference_data_change();
+
+CREATE TRIGGER system_accounts_deleted
+AFTER DELETE ON accounts
+FOR EACH ROW
+WHEN (OLD.owner_type = 'SYSTEM')
+EXECUTE FUNCTION notify_reference_data_change();
+
+-- User Balance Change Notifications
+-- Workers cache user balances; tell them which users' balances changed. An
+-- empty payload (too many users for one notification) means "drop everything".
+CREATE OR REPLACE FUNCTION notify_balances_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids TEXT;
+BEGIN
+    SELECT string_agg(DISTINCT a.user_id::text, ',') INTO user_ids
+    FROM new_balances nb
+    JOIN accounts a ON a.id = nb.account_id
+    WHERE a.owner_type = 'USER';
+
+    IF user_ids IS NOT NULL THEN
+        IF length(user_ids) > 7900 THEN
+            user_ids := '';
+        END IF;
+        PERFORM pg_notify('balances_changed', user_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER balances_changed
+AFTER UPDATE ON balances
+REFERENCING NEW TABLE AS new_balances
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_balances_change();
+
+-- Ledger Feed Notifications
+-- /v1/ledger/feed consumers wait for new entries; the notification goes out
+-- when the posting commits, once per transaction.
+CREATE OR REPLACE FUNCTION notify_ledger_entries_added()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('ledger_entries_added', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ledger_entries_added
+AFTER INSERT ON ledger_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_ledger_entries_added();
@@ -24,6 +24,14 @@ SELECT 'USER', u.id, a.id
 FROM users u, asset_types a 
 WHERE u.username IN ('alice', 'bob') AND a.code = 'GOLD';
 
+-- Seed Accounts (System, other assets)
+-- User accounts for these are created on a user's first posting in the asset.
+INSERT INTO accounts (owner_type, system_name, asset_type_id)
+SELECT 'SYSTEM', s.name, a.id
+FROM asset_types a, (VALUES ('TREASURY'), ('REVENUE')) AS s(name)
+WHERE a.code <> 'GOLD'
+ORDER BY a.id, s.name DESC;
+
 -- Initialize Balances for all accounts
 INSERT INTO balances (account_id, balance)
 SELECT id, 0 FROM accounts;
@@ -57,3 +65,12 @@ WHERE account_id = (
     JOIN asset_types at ON acc.asset_type_id = at.id 
     WHERE acc.system_name = 'TREASURY' AND at.code = 'GOLD'
 );
+
+-- Treasury DIAMOND and POINT (1,000,000 each)
+UPDATE balances 
+SET balance = 1000000 
+WHERE account_id IN (
+    SELECT acc.id FROM accounts acc 
+    JOIN asset_types at ON acc.asset_type_id = at.id 
+    WHERE acc.system_name = 'TREASURY' AND at.code IN ('DIAMOND', 'POINT')
+);
@@ -0,0 +1,21 @@
+-- 001_treasury_shards.sql
+-- Allow several TREASURY sub-accounts per asset and record transfers between them.
+
+ALTER TYPE transaction_type ADD VALUE IF NOT EXISTS 'REBALANCE';
+
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0;
+
+-- 009 replaces this index; don't bring it back on databases past that.
+DO $$
+BEGIN
+    IF to_regclass('uq_user_account') IS NULL THEN
+        DROP INDEX IF EXISTS uq_owner_asset;
+        CREATE UNIQUE INDEX uq_owner_asset ON accounts (
+            owner_type,
+            COALESCE(user_id, 0),
+            COALESCE(system_name, ''),
+            asset_type_id,
+            shard
+        );
+    END IF;
+END $$;
@@ -0,0 +1,30 @@
+-- 002_reference_data_notify.sql
+-- Notify API workers when asset types or system accounts change.
+
+CREATE OR REPLACE FUNCTION notify_reference_data_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS asset_types_changed ON asset_types;
+CREATE TRIGGER asset_types_changed
+AFTER INSERT OR UPDATE OR DELETE ON asset_types
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_reference_data_change();
+
+DROP TRIGGER IF EXISTS system_accounts_changed ON accounts;
+CREATE TRIGGER system_accounts_changed
+AFTER INSERT OR UPDATE ON accounts
+FOR EACH ROW
+WHEN (NEW.owner_type = 'SYSTEM')
+EXECUTE FUNCTION notify_reference_data_change();
+
+DROP TRIGGER IF EXISTS system_accounts_deleted ON accounts;
+CREATE TRIGGER system_accounts_deleted
+AFTER DELETE ON accounts
+FOR EACH ROW
+WHEN (OLD.owner_type = 'SYSTEM')
+EXECUTE FUNCTION notify_reference_data_change();
@@ -0,0 +1,5 @@
+-- 003_history_indexes.sql
+-- Keyset pagination of a user's history, newest first, per side of the transfer.
+
+CREATE INDEX IF NOT EXISTS idx_ledger_tx_from_created ON ledger_transactions(from_account_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_ledger_tx_to_created ON ledger_transactions(to_account_id, created_at, id);
@@ -0,0 +1,53 @@
+-- 004_statement_level_integrity.sql
+-- Replace the per-row deferred ledger integrity trigger with statement-level
+-- triggers that check each statement's entries once via transition tables.
+
+DROP TRIGGER IF EXISTS ensure_ledger_balance ON ledger_entries;
+DROP TRIGGER IF EXISTS ensure_ledger_balance_insert ON ledger_entries;
+DROP TRIGGER IF EXISTS ensure_ledger_balance_update ON ledger_entries;
+
+CREATE OR REPLACE FUNCTION check_ledger_integrity()
+RETURNS TRIGGER AS $$
+DECLARE
+    bad_transaction_id UUID;
+    bad_amount NUMERIC;
+BEGIN
+    -- Every statement must leave each transaction it touches balanced, so a
+    -- ledger transaction's entries net to zero once they are all written.
+    IF TG_OP = 'INSERT' THEN
+        SELECT transaction_id, SUM(amount) INTO bad_transaction_id, bad_amount
+        FROM new_entries
+        GROUP BY transaction_id
+        HAVING SUM(amount) != 0
+        LIMIT 1;
+    ELSE
+        SELECT transaction_id, SUM(amount) INTO bad_transaction_id, bad_amount
+        FROM (
+            SELECT transaction_id, amount FROM new_entries
+            UNION ALL
+            SELECT transaction_id, -amount FROM old_entries
+        ) changes
+        GROUP BY transaction_id
+        HAVING SUM(amount) != 0
+        LIMIT 1;
+    END IF;
+
+    IF bad_transaction_id IS NOT NULL THEN
+        RAISE EXCEPTION 'Ledger integrity violation: transaction % has non-zero sum (%)', bad_transaction_id, bad_amount;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ensure_ledger_balance_insert
+AFTER INSERT ON ledger_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION check_ledger_integrity();
+
+CREATE TRIGGER ensure_ledger_balance_update
+AFTER UPDATE ON ledger_entries
+REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION check_ledger_integrity();
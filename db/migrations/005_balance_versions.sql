@@ -0,0 +1,32 @@
+-- 005_balance_versions.sql
+-- Version balance rows and notify API workers when user balances change, so
+-- the balances endpoint can be served from an in-process cache.
+
+ALTER TABLE balances ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION notify_balances_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids TEXT;
+BEGIN
+    SELECT string_agg(DISTINCT a.user_id::text, ',') INTO user_ids
+    FROM new_balances nb
+    JOIN accounts a ON a.id = nb.account_id
+    WHERE a.owner_type = 'USER';
+
+    IF user_ids IS NOT NULL THEN
+        IF length(user_ids) > 7900 THEN
+            user_ids := '';
+        END IF;
+        PERFORM pg_notify('balances_changed', user_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS balances_changed ON balances;
+CREATE TRIGGER balances_changed
+AFTER UPDATE ON balances
+REFERENCING NEW TABLE AS new_balances
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_balances_change();
@@ -0,0 +1,140 @@
+-- 006_partitioned_ledger.sql
+-- Range-partition ledger_transactions and ledger_entries by month on
+-- created_at, move idempotency key uniqueness to its own table and add the
+-- archive bookkeeping tables. Existing rows are copied into the new
+-- partitioned tables, so this rewrites the whole ledger once; run it in a
+-- maintenance window on a large database.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    transaction_id UUID NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS ledger_archives (
+    id SERIAL PRIMARY KEY,
+    range_start TIMESTAMPTZ NOT NULL UNIQUE,
+    range_end TIMESTAMPTZ NOT NULL,
+    transactions BIGINT NOT NULL,
+    entries BIGINT NOT NULL,
+    location TEXT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    exported_at TIMESTAMPTZ NULL
+);
+
+CREATE TABLE IF NOT EXISTS ledger_archive_totals (
+    archive_id INTEGER NOT NULL REFERENCES ledger_archives(id),
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    amount BIGINT NOT NULL,
+    PRIMARY KEY (archive_id, account_id)
+);
+
+CREATE OR REPLACE FUNCTION ensure_ledger_partitions(months_ahead INTEGER DEFAULT 3, since TIMESTAMPTZ DEFAULT NOW())
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', since AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead);
+    parent TEXT;
+    partition TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_ledger_partitions'));
+    WHILE month_start <= last_month LOOP
+        FOREACH parent IN ARRAY ARRAY['ledger_transactions', 'ledger_entries'] LOOP
+            partition := parent || '_' || to_char(month_start, 'YYYY_MM');
+            IF to_regclass(partition) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition, parent,
+                    month_start AT TIME ZONE 'UTC', (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+                );
+                created := created + 1;
+            END IF;
+        END LOOP;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    oldest TIMESTAMPTZ;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ledger_transactions'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    -- Keep the old tables aside under new names until the copy is done.
+    ALTER TABLE ledger_entries RENAME TO ledger_entries_unpartitioned;
+    ALTER SEQUENCE ledger_entries_id_seq RENAME TO ledger_entries_unpartitioned_id_seq;
+    ALTER TABLE ledger_entries_unpartitioned RENAME CONSTRAINT ledger_entries_pkey TO ledger_entries_unpartitioned_pkey;
+    ALTER TABLE ledger_transactions RENAME TO ledger_transactions_unpartitioned;
+    ALTER TABLE ledger_transactions_unpartitioned RENAME CONSTRAINT ledger_transactions_pkey TO ledger_transactions_unpartitioned_pkey;
+    DROP INDEX idx_ledger_entries_account_id, idx_ledger_entries_transaction_id,
+        idx_ledger_tx_from_created, idx_ledger_tx_to_created;
+
+    CREATE TABLE ledger_transactions (
+        id UUID NOT NULL,
+        type transaction_type NOT NULL,
+        idempotency_key VARCHAR(64) NOT NULL,
+        asset_type_id INTEGER NOT NULL REFERENCES asset_types(id),
+        amount BIGINT NOT NULL CHECK (amount > 0),
+        from_account_id INTEGER NULL REFERENCES accounts(id),
+        to_account_id INTEGER NULL REFERENCES accounts(id),
+        metadata JSONB NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE TABLE ledger_entries (
+        id BIGSERIAL NOT NULL,
+        transaction_id UUID NOT NULL,
+        account_id INTEGER NOT NULL REFERENCES accounts(id),
+        amount BIGINT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at),
+        FOREIGN KEY (transaction_id, created_at) REFERENCES ledger_transactions(id, created_at) ON DELETE CASCADE
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE INDEX idx_ledger_entries_account_id ON ledger_entries(account_id);
+    CREATE INDEX idx_ledger_entries_transaction_id ON ledger_entries(transaction_id);
+    CREATE INDEX idx_ledger_tx_from_created ON ledger_transactions(from_account_id, created_at, id);
+    CREATE INDEX idx_ledger_tx_to_created ON ledger_transactions(to_account_id, created_at, id);
+
+    SELECT MIN(created_at) INTO oldest FROM ledger_transactions_unpartitioned;
+    PERFORM ensure_ledger_partitions(3, COALESCE(oldest, NOW()));
+
+    -- Entries used to default their own NOW(); line them up with their
+    -- transaction's timestamp, which the composite foreign key requires.
+    INSERT INTO ledger_transactions SELECT * FROM ledger_transactions_unpartitioned;
+    INSERT INTO ledger_entries (id, transaction_id, account_id, amount, created_at)
+    SELECT e.id, e.transaction_id, e.account_id, e.amount, t.created_at
+    FROM ledger_entries_unpartitioned e
+    JOIN ledger_transactions_unpartitioned t ON t.id = e.transaction_id;
+    PERFORM setval(pg_get_serial_sequence('ledger_entries', 'id'),
+                   GREATEST((SELECT MAX(id) FROM ledger_entries_unpartitioned), 1));
+
+    INSERT INTO idempotency_keys (idempotency_key, transaction_id, created_at)
+    SELECT idempotency_key, id, created_at FROM ledger_transactions_unpartitioned
+    ON CONFLICT (idempotency_key) DO NOTHING;
+
+    DROP TABLE ledger_entries_unpartitioned;
+    DROP TABLE ledger_transactions_unpartitioned;
+
+    -- Created after the copy: the copied entries were already checked.
+    CREATE TRIGGER ensure_ledger_balance_insert
+    AFTER INSERT ON ledger_entries
+    REFERENCING NEW TABLE AS new_entries
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION check_ledger_integrity();
+
+    CREATE TRIGGER ensure_ledger_balance_update
+    AFTER UPDATE ON ledger_entries
+    REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION check_ledger_integrity();
+END;
+$$;
+
+SELECT ensure_ledger_partitions();
@@ -0,0 +1,15 @@
+-- 007_balance_snapshots.sql
+-- Balance checkpoints for as-of balance and statement queries, plus the
+-- indexes those queries use. (account_id, created_at) replaces the plain
+-- account_id index.
+
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    as_of TIMESTAMPTZ NOT NULL,
+    balance BIGINT NOT NULL,
+    PRIMARY KEY (account_id, as_of)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_account_created ON ledger_entries(account_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_created_brin ON ledger_entries USING brin (created_at);
+DROP INDEX IF EXISTS idx_ledger_entries_account_id;
@@ -0,0 +1,24 @@
+-- 008_reconciliation.sql
+-- Bookkeeping for scripts/reconcile.py.
+
+CREATE TABLE IF NOT EXISTS reconciliation_runs (
+    id SERIAL PRIMARY KEY,
+    from_entry_id BIGINT NOT NULL,
+    to_entry_id BIGINT NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ NULL,
+    report JSONB NULL
+);
+
+CREATE TABLE IF NOT EXISTS reconciliation_totals (
+    account_id INTEGER PRIMARY KEY REFERENCES accounts(id),
+    entry_total BIGINT NOT NULL DEFAULT 0,
+    accepted_drift BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS reconciliation_staging (
+    run_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    amount BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reconciliation_staging_run ON reconciliation_staging(run_id, account_id);
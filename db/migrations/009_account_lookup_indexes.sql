@@ -0,0 +1,9 @@
+-- 009_account_lookup_indexes.sql
+-- Replace the functional uq_owner_asset index, which equality lookups on
+-- user_id / system_name can't use, with one partial unique index per owner
+-- type. uq_owner_asset already guaranteed the same uniqueness, so the new
+-- indexes build without conflicts.
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_account ON accounts (user_id, asset_type_id) WHERE owner_type = 'USER';
+CREATE UNIQUE INDEX IF NOT EXISTS uq_system_account ON accounts (system_name, asset_type_id, shard) WHERE owner_type = 'SYSTEM';
+DROP INDEX IF EXISTS uq_owner_asset;
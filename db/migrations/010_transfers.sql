@@ -0,0 +1,4 @@
+-- 010_transfers.sql
+-- User-to-user transfers.
+
+ALTER TYPE transaction_type ADD VALUE IF NOT EXISTS 'TRANSFER';
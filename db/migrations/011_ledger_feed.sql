@@ -0,0 +1,16 @@
+-- 011_ledger_feed.sql
+-- Notify API workers when ledger entries are committed, for the change feed.
+
+CREATE OR REPLACE FUNCTION notify_ledger_entries_added()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('ledger_entries_added', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ledger_entries_added ON ledger_entries;
+CREATE TRIGGER ledger_entries_added
+AFTER INSERT ON ledger_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_ledger_entries_added();
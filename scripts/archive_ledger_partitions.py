@@ -0,0 +1,208 @@
+"""Detach old monthly ledger partitions and export them to Parquet.
+
+Every month before `--before` (YYYY-MM, at most the current month) is
+archived in two steps:
+
+1. In one transaction: check that every transaction in the month nets to
+   zero, record the month and its per-account entry totals in
+   ledger_archives / ledger_archive_totals, and detach the month's
+   ledger_entries and ledger_transactions partitions. Balances then still
+   equal archived totals plus live entries.
+2. Stream both detached tables into zstd-compressed Parquet files under
+   `--out-dir`, check the row counts and drop the tables.
+
+If the export fails, the detached tables stay in place and the next run picks
+them up again.
+
+    DATABASE_URL=postgresql://... python scripts/archive_ledger_partitions.py --before 2025-01 --out-dir /mnt/archive
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db import DATABASE_URL
+
+PARTITION_NAME = re.compile(r"^ledger_transactions_(\d{4})_(\d{2})$")
+CHUNK_ROWS = 100000
+
+TRANSACTIONS_EXPORT = (
+    "SELECT id::text, type::text, idempotency_key, asset_type_id, amount, from_account_id, to_account_id, "
+    "metadata::text, created_at FROM {table}",
+    pa.schema([
+        ("id", pa.string()), ("type", pa.string()), ("idempotency_key", pa.string()),
+        ("asset_type_id", pa.int32()), ("amount", pa.int64()),
+        ("from_account_id", pa.int32()), ("to_account_id", pa.int32()),
+        ("metadata", pa.string()), ("created_at", pa.timestamp("us", tz="UTC")),
+    ]),
+)
+ENTRIES_EXPORT = (
+    "SELECT id, transaction_id::text, account_id, amount, created_at FROM {table}",
+    pa.schema([
+        ("id", pa.int64()), ("transaction_id", pa.string()), ("account_id", pa.int32()),
+        ("amount", pa.int64()), ("created_at", pa.timestamp("us", tz="UTC")),
+    ]),
+)
+
+def month_start(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m").replace(tzinfo=timezone.utc)
+
+def next_month(start: datetime) -> datetime:
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+def suffix(start: datetime) -> str:
+    return start.strftime("%Y_%m")
+
+def attached_months(cursor):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'ledger_transactions'::regclass
+    """)
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc))
+    return sorted(months)
+
+def detach_month(cursor, start: datetime) -> int:
+    """Record and detach one month; returns its ledger_archives id. Runs in the caller's transaction."""
+    transactions_table = f"ledger_transactions_{suffix(start)}"
+    entries_table = f"ledger_entries_{suffix(start)}"
+
+    cursor.execute(f"""
+        SELECT transaction_id FROM {entries_table}
+        GROUP BY transaction_id HAVING SUM(amount) != 0 LIMIT 1
+    """)
+    unbalanced = cursor.fetchone()
+    if unbalanced is not None:
+        raise RuntimeError(f"Transaction {unbalanced[0]} in {entries_table} does not net to zero")
+
+    cursor.execute(f"SELECT COUNT(*) FROM {transactions_table}")
+    transactions = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM {entries_table}")
+    entries = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO ledger_archives (range_start, range_end, transactions, entries) "
+        "VALUES (%s, %s, %s, %s) RETURNING id",
+        (start, next_month(start), transactions, entries),
+    )
+    archive_id = cursor.fetchone()[0]
+    cursor.execute(f"""
+        INSERT INTO ledger_archive_totals (archive_id, account_id, amount)
+        SELECT %s, account_id, SUM(amount) FROM {entries_table} GROUP BY account_id
+    """, (archive_id,))
+
+    # Entries first: a detached entries table keeps its foreign key to
+    # ledger_transactions, which has to go before the transactions partition
+    # it points into can be detached.
+    cursor.execute(f"ALTER TABLE ledger_entries DETACH PARTITION {entries_table}")
+    cursor.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND confrelid = 'ledger_transactions'::regclass AND contype = 'f'
+    """, (entries_table,))
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {entries_table} DROP CONSTRAINT "{constraint}"')
+    cursor.execute(f"ALTER TABLE ledger_transactions DETACH PARTITION {transactions_table}")
+    return archive_id
+
+def export_table(raw, table: str, export, path: str) -> int:
+    query, schema = export
+    tmp_path = path + ".tmp"
+    rows = 0
+    cursor = raw.cursor(name=f"export_{table}")
+    cursor.itersize = CHUNK_ROWS
+    cursor.execute(query.format(table=table))
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        while True:
+            chunk = cursor.fetchmany(CHUNK_ROWS)
+            if not chunk:
+                break
+            columns = list(zip(*chunk))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema,
+            ))
+            rows += len(chunk)
+    cursor.close()
+    raw.rollback()
+    if pq.ParquetFile(tmp_path).metadata.num_rows != rows:
+        raise RuntimeError(f"Row count mismatch writing {path}")
+    os.replace(tmp_path, path)
+    return rows
+
+def export_month(raw, archive_id: int, start: datetime, out_dir: str, keep_detached: bool):
+    cursor = raw.cursor()
+    cursor.execute("SELECT transactions, entries FROM ledger_archives WHERE id = %s", (archive_id,))
+    expected = cursor.fetchone()
+    raw.rollback()
+
+    counts = []
+    for table, export in (
+        (f"ledger_transactions_{suffix(start)}", TRANSACTIONS_EXPORT),
+        (f"ledger_entries_{suffix(start)}", ENTRIES_EXPORT),
+    ):
+        counts.append(export_table(raw, table, export, os.path.join(out_dir, f"{table}.parquet")))
+    if tuple(counts) != tuple(expected):
+        raise RuntimeError(f"Exported {counts} rows for {suffix(start)}, expected {list(expected)}")
+
+    cursor.execute(
+        "UPDATE ledger_archives SET location = %s, exported_at = NOW() WHERE id = %s",
+        (os.path.abspath(out_dir), archive_id),
+    )
+    if not keep_detached:
+        cursor.execute(f"DROP TABLE ledger_entries_{suffix(start)}, ledger_transactions_{suffix(start)}")
+    raw.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--before", required=True, help="first month to keep, YYYY-MM")
+    parser.add_argument("--out-dir", required=True)
+    parser.add_argument("--keep-detached", action="store_true", help="don't drop the tables after exporting")
+    parser.add_argument("--dry-run", action="store_true", help="only list the months that would be archived")
+    args = parser.parse_args()
+
+    cutoff = month_start(args.before)
+    now = datetime.now(timezone.utc)
+    if cutoff > datetime(now.year, now.month, 1, tzinfo=timezone.utc):
+        parser.error("--before can't be later than the current month")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    engine = create_engine(DATABASE_URL)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # Months detached by an earlier run whose export didn't finish.
+        cursor.execute("SELECT id, range_start FROM ledger_archives WHERE exported_at IS NULL ORDER BY range_start")
+        pending = [(archive_id, start.astimezone(timezone.utc)) for archive_id, start in cursor.fetchall()]
+        months = [start for start in attached_months(cursor) if next_month(start) <= cutoff]
+        raw.rollback()
+
+        if args.dry_run:
+            for archive_id, start in pending:
+                print(f"  {suffix(start)} (detached, not exported yet)")
+            for start in months:
+                print(f"  {suffix(start)}")
+            return
+
+        for start in months:
+            archive_id = detach_month(cursor, start)
+            raw.commit()
+            print(f"Detached {suffix(start)}")
+            pending.append((archive_id, start))
+
+        for archive_id, start in pending:
+            export_month(raw, archive_id, start, args.out_dir, args.keep_detached)
+            print(f"Exported {suffix(start)} to {args.out_dir}")
+    finally:
+        raw.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/bin/bash
 set -e
-echo "Starting Database Initialization..."
-python scripts/init_db.py
+echo "Migrating the database..."
+python scripts/migrate.py ${SEED_USERS:+--seed-users "$SEED_USERS"}
+python scripts/provision_treasury_shards.py
 echo "Starting FastAPI Application..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000
@@ -0,0 +1,167 @@
+"""Bring the database schema up to date.
+
+A fresh database gets db/init/01_schema.sql and 02_seed.sql, which always
+describe the current schema, and every migration is recorded as applied.
+Otherwise each migration in db/migrations not yet in schema_version is
+applied in its own transaction, in version order (the number the file name
+starts with). A database set up before schema_version existed has none
+recorded, so it gets all of them; they are written to be idempotent.
+
+Replicas starting together serialize on an advisory lock, and when every
+migration is already recorded the run ends after two catalog reads without taking
+it. Statements are run one at a time, so a failure names the file and line;
+any failure rolls that file back and exits non-zero, so the API never starts
+on a half-built schema.
+
+    DATABASE_URL=postgresql://... python scripts/migrate.py [--seed-users 1000000]
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+load_dotenv()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from app.db import DATABASE_URL
+from sql_statements import MigrationError, split_statements
+
+INIT_DIR = os.path.join(ROOT, "db", "init")
+MIGRATIONS_DIR = os.path.join(ROOT, "db", "migrations")
+BASELINE_FILES = ("01_schema.sql", "02_seed.sql")
+
+# Any value will do as long as nothing else takes it.
+MIGRATE_LOCK_KEY = 0x6D69677261746500
+
+SCHEMA_VERSION_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+INITIALIZED_SQL = "SELECT to_regclass('asset_types') IS NOT NULL, to_regclass('schema_version') IS NOT NULL"
+
+def read_sql(path: str):
+    with open(path, "r") as f:
+        sql = f.read()
+    return sql, hashlib.sha256(sql.encode()).hexdigest()
+
+def migrations():
+    """[(version, file name, path)] in version order."""
+    found = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"(\d+)_.+\.sql$", name)
+        if match:
+            found.append((int(match.group(1)), name, os.path.join(MIGRATIONS_DIR, name)))
+    found.sort()
+    versions = [version for version, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Two migrations share a version number")
+    return found
+
+def run_script(cursor, name: str, sql: str):
+    for line, statement in split_statements(sql):
+        try:
+            cursor.execute(statement)
+        except Exception as e:
+            raise MigrationError(f"{name}, line {line}: {str(e).strip()}") from e
+
+def applied_versions(cursor):
+    """(whether the schema exists, {version: checksum} of recorded migrations)."""
+    cursor.execute(INITIALIZED_SQL)
+    initialized, versioned = cursor.fetchone()
+    if not versioned:
+        return initialized, {}
+    cursor.execute("SELECT version, checksum FROM schema_version")
+    return initialized, dict(cursor.fetchall())
+
+def record(cursor, version: int, name: str, checksum: str):
+    cursor.execute(
+        "INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+        (version, name, checksum),
+    )
+
+def warn_changed(pending, applied: dict):
+    for version, name, path in pending:
+        if version in applied and applied[version] != read_sql(path)[1]:
+            print(f"Warning: {name} has changed since it was applied")
+
+def migrate(seed_users: int = 0) -> bool:
+    """Apply what's missing; returns whether the database was created from scratch."""
+    started = time.monotonic()
+    pending = migrations()
+    engine = create_engine(DATABASE_URL, poolclass=NullPool)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        initialized, applied = applied_versions(cursor)
+        raw.commit()
+        if initialized and all(version in applied for version, _, _ in pending):
+            warn_changed(pending, applied)
+            print(f"Schema is current (version {max(applied, default=0)})")
+            return False
+
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATE_LOCK_KEY,))
+        raw.commit()
+        # Whoever held the lock before us may have done the work already.
+        initialized, applied = applied_versions(cursor)
+        cursor.execute(SCHEMA_VERSION_SQL)
+        raw.commit()
+
+        created = not initialized
+        if created:
+            print("Empty database, creating the schema...")
+            for name in BASELINE_FILES:
+                sql, _ = read_sql(os.path.join(INIT_DIR, name))
+                run_script(cursor, name, sql)
+            # The baseline already includes every migration.
+            for version, name, path in pending:
+                record(cursor, version, name, read_sql(path)[1])
+            raw.commit()
+        else:
+            warn_changed(pending, applied)
+            for version, name, path in pending:
+                if version in applied:
+                    continue
+                sql, checksum = read_sql(path)
+                print(f"Applying {name}...")
+                run_script(cursor, name, sql)
+                record(cursor, version, name, checksum)
+                raw.commit()
+
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATE_LOCK_KEY,))
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    print(f"Schema is at version {max((version for version, _, _ in pending), default=0)} "
+          f"({time.monotonic() - started:.1f}s)")
+    if created and seed_users:
+        from seed_population import seed
+        seed(seed_users)
+    return created
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed-users", type=int, default=0,
+                        help="if the database was empty, bulk-load this many benchmark users with COPY")
+    args = parser.parse_args()
+    try:
+        migrate(args.seed_users)
+    except MigrationError as e:
+        sys.exit(f"Migration failed: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import TREASURY_SHARDS
+from app.db import SessionLocal
+from app.models import Account, Balance, OwnerType
+from app.services.treasury import REVENUE, TREASURY, lock_treasury_balances, move_between_shards
+
+def provision_shards(db, asset_type_id, system_name=TREASURY):
+    existing = {
+        acc.shard for acc in db.query(Account.shard)
+        .filter(Account.owner_type == OwnerType.SYSTEM, Account.system_name == system_name, Account.asset_type_id == asset_type_id)
+        .all()
+    }
+    created = 0
+    for shard in range(TREASURY_SHARDS):
+        if shard in existing:
+            continue
+        created += 1
+        account = Account(owner_type=OwnerType.SYSTEM, system_name=system_name, asset_type_id=asset_type_id, shard=shard)
+        db.add(account)
+        db.flush()
+        db.add(Balance(account_id=account.id, balance=0))
+    db.commit()
+    return created
+
+def even_out_shards(db, asset_type_id):
+    balances = lock_treasury_balances(db, asset_type_id)
+    target = sum(b.balance for b in balances) // len(balances)
+
+    donors = [b for b in balances if b.balance > target]
+    for receiver in (b for b in balances if b.balance < target):
+        for donor in donors:
+            amount = min(donor.balance - target, target - receiver.balance)
+            if amount > 0:
+                move_between_shards(db, asset_type_id, donor, receiver, amount)
+            if receiver.balance >= target:
+                break
+    db.commit()
+
+def main():
+    print(f"Provisioning {TREASURY_SHARDS} treasury and revenue shard(s) per asset...")
+    db = SessionLocal()
+    try:
+        asset_type_ids = [
+            row.asset_type_id for row in db.query(Account.asset_type_id)
+            .filter(Account.owner_type == OwnerType.SYSTEM, Account.system_name == TREASURY, Account.shard == 0)
+            .all()
+        ]
+        for asset_type_id in asset_type_ids:
+            # Only spread funds when new shards appear, so restarts don't keep
+            # writing rebalance transactions to the ledger.
+            if provision_shards(db, asset_type_id):
+                even_out_shards(db, asset_type_id)
+                print(f"Asset {asset_type_id}: new shards provisioned and balanced.")
+
+        # REVENUE only ever receives transfer fees, so its shards start empty.
+        revenue_asset_type_ids = [
+            row.asset_type_id for row in db.query(Account.asset_type_id)
+            .filter(Account.owner_type == OwnerType.SYSTEM, Account.system_name == REVENUE, Account.shard == 0)
+            .all()
+        ]
+        for asset_type_id in revenue_asset_type_ids:
+            if provision_shards(db, asset_type_id, REVENUE):
+                print(f"Asset {asset_type_id}: new revenue shards provisioned.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
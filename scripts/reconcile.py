@@ -0,0 +1,270 @@
+"""Reconcile account balances against the ledger, in parallel and incrementally.
+
+reconciliation_totals holds each account's entry total up to the watermark,
+the highest ledger_entries.id covered by the last finished run, so a run
+only reads the entries added since. A run:
+
+1. Fences the new watermark: briefly takes a SHARE lock on ledger_entries,
+   which waits out postings still inserting entries, and reads the id
+   sequence. Every id up to the fence is then committed or gone for good.
+2. Splits the ids between the old and new watermark into slices and sums
+   them per account into reconciliation_staging across a process pool, one
+   connection per worker. The same pass sums each transaction's entries;
+   slices report the transactions that don't net to zero within them, and
+   transactions whose entries straddle two slices cancel out when the
+   partial sums are combined.
+3. Splits the account id space into ranges and, again in parallel, compares
+   every balance with its previous total plus the staged sums plus any
+   entries committed after the fence (read in the same statement as the
+   balance, so both come from one snapshot).
+4. In one transaction, folds the staged sums into reconciliation_totals and
+   records the run with its report.
+
+The first run starts from ledger_archive_totals for months archived before
+it. Run it at least once after a month closes and before archiving that
+month, so that no entry is archived before it has been counted.
+
+Funds put in outside the ledger (seeded balances, treasury float) show up as
+drift; `--accept-drift` records the current drift of every account as known,
+and later runs only report changes from it.
+
+The JSON report goes to stdout or `--report`; the exit status is 1 when it
+lists unbalanced transactions or drift that wasn't accepted.
+
+    DATABASE_URL=postgresql://... python scripts/reconcile.py --workers 8 --report drift.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db import DATABASE_URL
+
+# Any value will do as long as nothing else takes it.
+RECONCILE_LOCK_KEY = 0x7265636F6E
+
+FENCE_SQL = """
+    SELECT COALESCE(pg_sequence_last_value(pg_get_serial_sequence('ledger_entries', 'id')), 0)
+"""
+
+SUM_SLICE_SQL = """
+    WITH slice AS MATERIALIZED (
+        SELECT transaction_id, account_id, amount FROM ledger_entries WHERE id > %(lo)s AND id <= %(hi)s
+    ),
+    staged AS (
+        INSERT INTO reconciliation_staging (run_id, account_id, amount)
+        SELECT %(run_id)s, account_id, SUM(amount) FROM slice GROUP BY account_id
+    )
+    SELECT transaction_id::text, SUM(amount) FROM slice GROUP BY transaction_id HAVING SUM(amount) <> 0
+    UNION ALL
+    SELECT NULL, COUNT(*) FROM slice
+"""
+
+CHECK_ACCOUNTS_SQL = """
+    WITH checked AS (
+        SELECT b.account_id, b.balance,
+               COALESCE(t.entry_total, 0) + COALESCE(s.amount, 0) + COALESCE(a.amount, 0)
+                   + COALESCE(late.amount, 0) + COALESCE(t.accepted_drift, 0) AS expected
+        FROM balances b
+        LEFT JOIN reconciliation_totals t ON t.account_id = b.account_id
+        LEFT JOIN (
+            SELECT account_id, SUM(amount) AS amount FROM reconciliation_staging
+            WHERE run_id = %(run_id)s AND account_id BETWEEN %(lo)s AND %(hi)s GROUP BY account_id
+        ) s ON s.account_id = b.account_id
+        LEFT JOIN (
+            SELECT account_id, SUM(amount) AS amount FROM ledger_archive_totals
+            WHERE %(first_run)s AND account_id BETWEEN %(lo)s AND %(hi)s GROUP BY account_id
+        ) a ON a.account_id = b.account_id
+        LEFT JOIN (
+            SELECT account_id, SUM(amount) AS amount FROM ledger_entries
+            WHERE id > %(fence)s AND account_id BETWEEN %(lo)s AND %(hi)s GROUP BY account_id
+        ) late ON late.account_id = b.account_id
+        WHERE b.account_id BETWEEN %(lo)s AND %(hi)s
+    )
+    SELECT COUNT(*),
+           COALESCE(json_agg(json_build_object(
+               'accountId', account_id, 'balance', balance, 'expected', expected, 'drift', balance - expected
+           ) ORDER BY account_id) FILTER (WHERE balance <> expected), '[]')
+    FROM checked
+"""
+
+APPLY_TOTALS_SQL = """
+    INSERT INTO reconciliation_totals (account_id, entry_total)
+    SELECT account_id, SUM(amount) FROM (
+        SELECT account_id, amount FROM reconciliation_staging WHERE run_id = %(run_id)s
+        UNION ALL
+        SELECT account_id, amount FROM ledger_archive_totals WHERE %(first_run)s
+    ) new_entries
+    GROUP BY account_id
+    ON CONFLICT (account_id) DO UPDATE SET entry_total = reconciliation_totals.entry_total + EXCLUDED.entry_total
+"""
+
+ACCEPT_DRIFT_SQL = """
+    INSERT INTO reconciliation_totals (account_id, accepted_drift)
+    SELECT account_id, drift FROM unnest(%(account_ids)s::integer[], %(drifts)s::bigint[]) AS d(account_id, drift)
+    ON CONFLICT (account_id) DO UPDATE SET accepted_drift = reconciliation_totals.accepted_drift + EXCLUDED.accepted_drift
+"""
+
+_engine = None
+
+def _connect_worker():
+    global _engine
+    _engine = create_engine(DATABASE_URL, poolclass=NullPool)
+
+def _run_in_worker(sql, params):
+    raw = _engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        raw.commit()
+        return rows
+    finally:
+        raw.close()
+
+def sum_slice(run_id: int, lo: int, hi: int):
+    """Stage per-account sums for ids (lo, hi]; returns (entries read, {transaction: partial sum})."""
+    entries, partials = 0, {}
+    for transaction_id, total in _run_in_worker(SUM_SLICE_SQL, {"run_id": run_id, "lo": lo, "hi": hi}):
+        if transaction_id is None:
+            entries = int(total)
+        else:
+            partials[transaction_id] = int(total)
+    return entries, partials
+
+def check_accounts(run_id: int, lo: int, hi: int, fence: int, first_run: bool):
+    """Returns (accounts checked, drifted accounts) for account ids [lo, hi]."""
+    rows = _run_in_worker(CHECK_ACCOUNTS_SQL, {
+        "run_id": run_id, "lo": lo, "hi": hi, "fence": fence, "first_run": first_run,
+    })
+    return rows[0][0], rows[0][1]
+
+def split(lo: int, hi: int, parts: int):
+    """[(start, end)] covering lo..hi inclusive in at most `parts` contiguous ranges."""
+    if hi < lo:
+        return []
+    step = max(1, -(-(hi - lo + 1) // parts))
+    return [(start, min(start + step - 1, hi)) for start in range(lo, hi + 1, step)]
+
+def fence(raw, lock_timeout: str) -> int:
+    cursor = raw.cursor()
+    cursor.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+    cursor.execute("LOCK TABLE ledger_entries IN SHARE MODE")
+    cursor.execute(FENCE_SQL)
+    value = cursor.fetchone()[0]
+    raw.commit()
+    return value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--slices", type=int, default=0, help="work items per phase; defaults to 4 per worker")
+    parser.add_argument("--report", help="write the JSON report here instead of stdout")
+    parser.add_argument("--accept-drift", action="store_true", help="record the drift found as known")
+    parser.add_argument("--max-listed", type=int, default=1000, help="drifted accounts listed in the report")
+    parser.add_argument("--lock-timeout", default="5s", help="how long the fence may wait for postings")
+    args = parser.parse_args()
+    slices = args.slices or args.workers * 4
+
+    started = time.monotonic()
+    engine = create_engine(DATABASE_URL, poolclass=NullPool)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (RECONCILE_LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            sys.exit("Another reconcile is running")
+        raw.commit()
+
+        # Leftovers of runs that died before finishing.
+        cursor.execute("DELETE FROM reconciliation_staging")
+        cursor.execute("DELETE FROM reconciliation_runs WHERE finished_at IS NULL")
+        cursor.execute("SELECT COALESCE(MAX(to_entry_id), 0), COUNT(*) = 0 FROM reconciliation_runs")
+        watermark, first_run = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MIN(account_id), 1), COALESCE(MAX(account_id), 0) FROM balances")
+        first_account, last_account = cursor.fetchone()
+        raw.commit()
+
+        new_watermark = max(watermark, fence(raw, args.lock_timeout))
+        cursor.execute(
+            "INSERT INTO reconciliation_runs (from_entry_id, to_entry_id) VALUES (%s, %s) RETURNING id",
+            (watermark, new_watermark),
+        )
+        run_id = cursor.fetchone()[0]
+        raw.commit()
+
+        entries = 0
+        partials = {}
+        checked = 0
+        drifted = []
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_connect_worker) as pool:
+            id_slices = split(watermark + 1, new_watermark, slices)
+            for slice_entries, slice_partials in pool.map(
+                sum_slice, [run_id] * len(id_slices), [lo - 1 for lo, _ in id_slices], [hi for _, hi in id_slices],
+            ):
+                entries += slice_entries
+                for transaction_id, total in slice_partials.items():
+                    partials[transaction_id] = partials.get(transaction_id, 0) + total
+
+            account_ranges = split(first_account, last_account, slices)
+            count = len(account_ranges)
+            for range_checked, range_drifted in pool.map(
+                check_accounts, [run_id] * count, [lo for lo, _ in account_ranges], [hi for _, hi in account_ranges],
+                [new_watermark] * count, [first_run] * count,
+            ):
+                checked += range_checked
+                drifted.extend(range_drifted)
+
+        unbalanced = sorted(
+            ({"transactionId": transaction_id, "sum": total} for transaction_id, total in partials.items() if total),
+            key=lambda item: item["transactionId"],
+        )
+        report = {
+            "runId": run_id,
+            "fromEntryId": watermark,
+            "toEntryId": new_watermark,
+            "entriesScanned": entries,
+            "accountsChecked": checked,
+            "driftedAccounts": len(drifted),
+            "totalDrift": sum(item["drift"] for item in drifted),
+            "drift": drifted[:args.max_listed],
+            "unbalancedTransactions": unbalanced,
+            "driftAccepted": bool(args.accept_drift and drifted),
+            "ok": not drifted and not unbalanced,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+        cursor.execute(APPLY_TOTALS_SQL, {"run_id": run_id, "first_run": first_run})
+        if args.accept_drift and drifted:
+            cursor.execute(ACCEPT_DRIFT_SQL, {
+                "account_ids": [item["accountId"] for item in drifted],
+                "drifts": [item["drift"] for item in drifted],
+            })
+        cursor.execute("DELETE FROM reconciliation_staging WHERE run_id = %s", (run_id,))
+        cursor.execute(
+            "UPDATE reconciliation_runs SET finished_at = NOW(), report = %s WHERE id = %s",
+            (json.dumps(report), run_id),
+        )
+        raw.commit()
+    finally:
+        raw.close()
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if report["unbalancedTransactions"] or (report["driftedAccounts"] and not report["driftAccepted"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Bulk-load a benchmark population with COPY.
+
+Creates `--users` users named bench_<id>, one account per user per asset and
+an opening balance posted as a real TOPUP from the user's treasury shard, so
+the ledger stays balanced and every user balance equals its entry sum. Each
+treasury shard is topped up with `--treasury-float` per user (minted outside
+the ledger, like the treasury in 02_seed.sql).
+
+    DATABASE_URL=postgresql://... python scripts/seed_population.py --users 1000000 --assets GOLD,DIAMOND
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import TREASURY_SHARDS
+from app.db import DATABASE_URL
+from app.services.ids import uuid7
+from app.services.treasury import TREASURY
+
+def copy_rows(cursor, table: str, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+def ensure_assets(cursor, codes):
+    asset_ids = {}
+    for code in codes:
+        cursor.execute(
+            "INSERT INTO asset_types (code, name) VALUES (%s, %s) ON CONFLICT (code) DO NOTHING",
+            (code, code.title()),
+        )
+        cursor.execute("SELECT id FROM asset_types WHERE code = %s", (code,))
+        asset_ids[code] = cursor.fetchone()[0]
+    return asset_ids
+
+def ensure_treasury_shards(cursor, asset_type_id: int):
+    """{shard: account_id} for the asset, creating shard 0 .. TREASURY_SHARDS-1 as needed."""
+    for shard in range(TREASURY_SHARDS):
+        cursor.execute(
+            "SELECT id FROM accounts "
+            "WHERE owner_type = 'SYSTEM' AND system_name = %s AND asset_type_id = %s AND shard = %s",
+            (TREASURY, asset_type_id, shard),
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                "INSERT INTO accounts (owner_type, system_name, asset_type_id, shard) "
+                "VALUES ('SYSTEM', %s, %s, %s) RETURNING id",
+                (TREASURY, asset_type_id, shard),
+            )
+            cursor.execute("INSERT INTO balances (account_id, balance) VALUES (%s, 0)", (cursor.fetchone()[0],))
+    cursor.execute(
+        "SELECT shard, id FROM accounts WHERE owner_type = 'SYSTEM' AND system_name = %s AND asset_type_id = %s",
+        (TREASURY, asset_type_id),
+    )
+    return dict(cursor.fetchall())
+
+def reserve_ids(cursor, table: str, count: int) -> int:
+    # Take a block of ids past the current maximum and move the sequence past it.
+    cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    first_id = cursor.fetchone()[0] + 1
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), %s)", (first_id + count - 1,))
+    return first_id
+
+def seed_chunk(cursor, user_ids, first_account_id, assets, treasuries, opening_balance):
+    users, accounts, balances, transactions, keys, entries = [], [], [], [], [], []
+    account_id = first_account_id
+    for user_id in user_ids:
+        users.append((user_id, f"bench_{user_id}"))
+        for code, asset_type_id in assets.items():
+            accounts.append((account_id, "USER", user_id, asset_type_id))
+            balances.append((account_id, opening_balance))
+            if opening_balance:
+                treasury_id = treasuries[asset_type_id][user_id % TREASURY_SHARDS]
+                transaction_id = uuid7()
+                key = f"seed:{user_id}:{code}"
+                transactions.append((transaction_id, "TOPUP", key, asset_type_id, opening_balance, treasury_id, account_id))
+                keys.append((key, transaction_id))
+                entries.append((transaction_id, treasury_id, -opening_balance))
+                entries.append((transaction_id, account_id, opening_balance))
+            account_id += 1
+
+    # Foreign key checks run as cached plans. One planned while the referenced
+    # table was still tiny seq scans it, which makes the next COPY quadratic,
+    # so drop them once the referenced rows are in.
+    copy_rows(cursor, "users", ("id", "username"), users)
+    cursor.execute("DISCARD PLANS")
+    copy_rows(cursor, "accounts", ("id", "owner_type", "user_id", "asset_type_id"), accounts)
+    cursor.execute("DISCARD PLANS")
+    copy_rows(cursor, "balances", ("account_id", "balance"), balances)
+    if transactions:
+        copy_rows(cursor, "ledger_transactions", (
+            "id", "type", "idempotency_key", "asset_type_id", "amount", "from_account_id", "to_account_id",
+        ), transactions)
+        copy_rows(cursor, "idempotency_keys", ("idempotency_key", "transaction_id"), keys)
+        cursor.execute("DISCARD PLANS")
+        # All entries of a transaction go in the same COPY, which the
+        # statement-level integrity trigger requires. Every row of the chunk
+        # shares the database transaction's NOW(), so entries land in the
+        # same ledger partition as their transaction.
+        copy_rows(cursor, "ledger_entries", ("transaction_id", "account_id", "amount"), entries)
+
+def seed(users: int, asset_codes=("GOLD",), opening_balance: int = 1000, treasury_float: int = 1000,
+         chunk_size: int = 50000):
+    engine = create_engine(DATABASE_URL)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        codes = [code.strip().upper() for code in asset_codes if code.strip()]
+        assets = ensure_assets(cursor, codes)
+        treasuries = {asset_type_id: ensure_treasury_shards(cursor, asset_type_id) for asset_type_id in assets.values()}
+        first_user_id = reserve_ids(cursor, "users", users)
+        first_account_id = reserve_ids(cursor, "accounts", users * len(assets))
+        raw.commit()
+        print(f"Seeding users {first_user_id}..{first_user_id + users - 1} with {', '.join(codes)}")
+
+        start = time.perf_counter()
+        for offset in range(0, users, chunk_size):
+            count = min(chunk_size, users - offset)
+            user_ids = range(first_user_id + offset, first_user_id + offset + count)
+            seed_chunk(cursor, user_ids, first_account_id + offset * len(assets), assets, treasuries, opening_balance)
+            raw.commit()
+            done = offset + count
+            print(f"  {done} users ({done / (time.perf_counter() - start):.0f}/s)")
+
+        # The shards paid the openings out through the ledger without their
+        # balance rows being touched, so minting the openings back plus the
+        # float comes down to adding each shard's share of the float.
+        for shards in treasuries.values():
+            for account_id in shards.values():
+                cursor.execute("UPDATE balances SET balance = balance + %s WHERE account_id = %s",
+                               (treasury_float * users // len(shards), account_id))
+        raw.commit()
+
+        cursor.execute("ANALYZE users, accounts, balances, ledger_transactions, ledger_entries")
+        raw.commit()
+        print(f"Done in {time.perf_counter() - start:.1f}s")
+    finally:
+        raw.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--assets", default="GOLD", help="comma-separated asset codes")
+    parser.add_argument("--opening-balance", type=int, default=1000)
+    parser.add_argument("--treasury-float", type=int, default=1000, help="treasury funds per user per asset")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="users per COPY round")
+    args = parser.parse_args()
+    seed(args.users, args.assets.split(","), args.opening_balance, args.treasury_float, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
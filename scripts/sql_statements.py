@@ -0,0 +1,86 @@
+"""Splitting SQL scripts into statements, for scripts/migrate.py.
+
+Standard library only, so tests/test_migrate.py runs without the app's
+dependencies.
+"""
+import re
+
+DOLLAR_QUOTE = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)?\$")
+
+class MigrationError(Exception):
+    pass
+
+def split_statements(sql: str):
+    """[(line, statement)] for each statement in a SQL script.
+
+    Splits on semicolons outside string literals, quoted identifiers,
+    dollar-quoted bodies ($$ ... $$, $fn$ ... $fn$) and comments, so plpgsql
+    functions and DO blocks stay whole. Comment-only fragments are dropped.
+    """
+    statements = []
+    n = len(sql)
+    code_start = None
+    i = 0
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+            continue
+        if sql.startswith("/*", i):
+            depth = 1
+            i += 2
+            while i < n and depth:
+                if sql.startswith("/*", i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith("*/", i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+            continue
+        if c.isspace():
+            i += 1
+            continue
+        if c == ";":
+            if code_start is not None:
+                statements.append((sql.count("\n", 0, code_start) + 1, sql[code_start:i].strip()))
+            code_start = None
+            i += 1
+            continue
+
+        if code_start is None:
+            code_start = i
+        if c in "'\"":
+            # E'...' strings take backslash escapes; a doubled quote is a
+            # quote in both kinds.
+            backslashes = c == "'" and i > 0 and sql[i - 1] in "eE" and (
+                i < 2 or not (sql[i - 2].isalnum() or sql[i - 2] == "_")
+            )
+            i += 1
+            while i < n:
+                if backslashes and sql[i] == "\\":
+                    i += 2
+                elif sql[i] == c:
+                    if sql.startswith(c * 2, i):
+                        i += 2
+                    else:
+                        break
+                else:
+                    i += 1
+            i += 1
+            continue
+        if c == "$" and not (i > 0 and (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+            match = DOLLAR_QUOTE.match(sql, i)
+            if match:
+                end = sql.find(match.group(0), match.end())
+                if end == -1:
+                    raise MigrationError(f"Unterminated dollar quote {match.group(0)} at line {sql.count(chr(10), 0, i) + 1}")
+                i = end + len(match.group(0))
+                continue
+        i += 1
+
+    if code_start is not None:
+        statements.append((sql.count("\n", 0, code_start) + 1, sql[code_start:].strip()))
+    return statements
@@ -0,0 +1,332 @@
+"""Capacity benchmark: run a traffic scenario against a running API and verify the ledger.
+
+Unlike tests/locustfile.py, which hammers users 1 and 2, this draws users from
+a seeded population (scripts/seed_population.py) with a tunable Zipf skew,
+read/write mix and share of retried (duplicate) writes. Results go to a JSON
+file that can be compared across commits:
+
+    python scripts/seed_population.py --users 1000000 --assets GOLD,DIAMOND
+    uvicorn app.main:app --port 8000 &
+    python tests/benchmarks/harness.py --scenario hot-users --duration 60 --concurrency 64
+    python tests/benchmarks/harness.py --compare results/hot-users-abc123.json results/hot-users-def456.json
+
+After the run it checks that every ledger transaction nets to zero and that
+no balance moved away from its entry sum (relative to a snapshot taken before
+the run, since the seeded treasury float isn't backed by entries).
+"""
+import argparse
+import collections
+import http.client
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.db import DATABASE_URL
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+SCENARIOS = {
+    # zipf: skew exponent over users (0 = uniform), reads: share of GETs,
+    # history: share of GETs that are history pages, spend: share of writes
+    # that are spends, duplicates: share of writes that retry an earlier key.
+    "uniform": {"zipf": 0.0, "reads": 0.5, "history": 0.25, "spend": 0.6, "duplicates": 0.0},
+    "hot-users": {"zipf": 1.1, "reads": 0.5, "history": 0.25, "spend": 0.6, "duplicates": 0.0},
+    "read-heavy": {"zipf": 0.8, "reads": 0.9, "history": 0.2, "spend": 0.6, "duplicates": 0.0},
+    "retry-storm": {"zipf": 0.8, "reads": 0.3, "history": 0.1, "spend": 0.6, "duplicates": 0.3},
+}
+
+class ZipfUsers:
+    """Draws user ids from [first, last] with P(rank k) ~ 1/k^s, lowest ids hottest.
+
+    Uses the inverse CDF of the continuous power law, so it needs no tables
+    and works the same for 10k or 10M users.
+    """
+
+    def __init__(self, first: int, last: int, s: float):
+        self.first = first
+        self.n = last - first + 1
+        self.s = s
+
+    def sample(self, rng: random.Random) -> int:
+        u = rng.random()
+        if self.s == 0:
+            rank = int(u * self.n)
+        elif abs(self.s - 1.0) < 1e-9:
+            rank = int(math.exp(u * math.log(self.n + 1))) - 1
+        else:
+            a = 1.0 - self.s
+            rank = int(((math.pow(self.n + 1, a) - 1) * u + 1) ** (1 / a)) - 1
+        return self.first + min(max(rank, 0), self.n - 1)
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = collections.Counter()
+        self.deadlocks = 0
+        self.serialization_failures = 0
+        self.transport_errors = 0
+        self.duplicate_mismatches = 0
+
+    def summary(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2) if ordered else None
+
+        return {
+            "requests": len(ordered),
+            "throughput_rps": round(len(ordered) / elapsed, 1),
+            "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+            "statuses": dict(self.statuses),
+            "deadlocks": self.deadlocks,
+            "serialization_failures": self.serialization_failures,
+            "transport_errors": self.transport_errors,
+            "duplicate_mismatches": self.duplicate_mismatches,
+        }
+
+class Client:
+    """One keep-alive HTTP connection per worker thread."""
+
+    def __init__(self, base_url: str):
+        parsed = urlparse(base_url)
+        self._host, self._port = parsed.hostname, parsed.port or 80
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body=None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self._host, self._port, timeout=60)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+
+def posting_counts(client: Client, metric: str) -> dict:
+    """A ledger_posting_*_total counter from the API's /metrics, summed by reason."""
+    try:
+        status, body = client.request("GET", "/metrics")
+    except (http.client.HTTPException, OSError):
+        return {}
+    counts = collections.Counter()
+    for line in body.decode().splitlines():
+        if line.startswith(metric + "{"):
+            reason = line.split('reason="', 1)[1].split('"', 1)[0]
+            counts[reason] += float(line.rsplit(" ", 1)[1])
+    return counts
+
+def run_scenario(args, params, first_user: int, last_user: int):
+    client = Client(args.base_url)
+    users = ZipfUsers(first_user, last_user, params["zipf"])
+    assets = [code.strip().upper() for code in args.assets.split(",")]
+    stats = collections.defaultdict(EndpointStats)
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def record(name, elapsed, status, body, expected_id=None):
+        with lock:
+            endpoint = stats[name]
+            endpoint.latencies.append(elapsed)
+            endpoint.statuses[str(status)] += 1
+            if status >= 500:
+                # Raw database errors, or a 503 once the server ran out of retries.
+                if b"deadlock" in body:
+                    endpoint.deadlocks += 1
+                elif b"serializ" in body:
+                    endpoint.serialization_failures += 1
+            if expected_id is not None and status == 200 and json.loads(body)["transactionId"] != expected_id:
+                endpoint.duplicate_mismatches += 1
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        completed = collections.deque(maxlen=100)
+        while time.monotonic() < deadline:
+            user_id = users.sample(rng)
+            if rng.random() < params["reads"]:
+                if rng.random() < params["history"]:
+                    name, method, path, body = "history", "GET", f"/v1/users/{user_id}/transactions", None
+                else:
+                    name, method, path, body = "balances", "GET", f"/v1/users/{user_id}/balances", None
+                expected_id = None
+            elif completed and rng.random() < params["duplicates"]:
+                name, path, body, expected_id = rng.choice(completed)
+                name, method = name + " (retry)", "POST"
+            else:
+                if rng.random() < params["spend"]:
+                    name, path, amount = "spend", "/v1/spend", rng.randint(1, 10)
+                else:
+                    name, path, amount = "topup", "/v1/topup", rng.randint(10, 50)
+                method, expected_id = "POST", None
+                body = {"userId": user_id, "assetCode": rng.choice(assets), "amount": amount,
+                        "idempotencyKey": uuid.uuid4().hex}
+
+            start = time.perf_counter()
+            try:
+                status, response = client.request(method, path, body)
+            except (http.client.HTTPException, OSError):
+                with lock:
+                    stats[name].transport_errors += 1
+                continue
+            record(name, time.perf_counter() - start, status, response, expected_id)
+            if method == "POST" and expected_id is None and status == 200:
+                completed.append((name, path, body, json.loads(response)["transactionId"]))
+
+    failures_before = posting_counts(client, "ledger_posting_failures_total")
+    retries_before = posting_counts(client, "ledger_posting_retries_total")
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(worker, args.seed + i) for i in range(args.concurrency)]:
+            future.result()
+    elapsed = time.monotonic() - start
+    failures_after = posting_counts(client, "ledger_posting_failures_total")
+    retries_after = posting_counts(client, "ledger_posting_retries_total")
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {name: endpoint.summary(elapsed) for name, endpoint in sorted(stats.items())},
+        "server_posting_failures": {
+            reason: failures_after[reason] - failures_before.get(reason, 0) for reason in failures_after
+        },
+        "server_posting_retries": {
+            reason: retries_after[reason] - retries_before.get(reason, 0) for reason in retries_after
+        },
+    }
+
+def user_range(engine):
+    with engine.connect() as conn:
+        first, last = conn.execute(text(
+            "SELECT MIN(id), MAX(id) FROM users WHERE username LIKE 'bench\\_%'"
+        )).one()
+        if first is None:
+            first, last = conn.execute(text("SELECT MIN(id), MAX(id) FROM users")).one()
+    return first, last
+
+def snapshot_drift(engine):
+    # Balance minus entry sum per account. Seeded treasury funds make this
+    # non-zero for some accounts; what matters is that the run doesn't change it.
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_balance_drift"))
+        conn.execute(text("""
+            CREATE UNLOGGED TABLE bench_balance_drift AS
+            SELECT b.account_id, b.balance - COALESCE(e.total, 0) AS drift
+            FROM balances b
+            LEFT JOIN (SELECT account_id, SUM(amount) AS total FROM ledger_entries GROUP BY account_id) e
+                ON e.account_id = b.account_id
+        """))
+
+def verify_ledger(engine) -> dict:
+    with engine.begin() as conn:
+        unbalanced = conn.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT transaction_id FROM ledger_entries GROUP BY transaction_id HAVING SUM(amount) != 0
+            ) t
+        """)).scalar_one()
+        entry_total = conn.execute(text("SELECT COALESCE(SUM(amount), 0) FROM ledger_entries")).scalar_one()
+        drifted = conn.execute(text("""
+            SELECT COUNT(*)
+            FROM balances b
+            LEFT JOIN (SELECT account_id, SUM(amount) AS total FROM ledger_entries GROUP BY account_id) e
+                ON e.account_id = b.account_id
+            LEFT JOIN bench_balance_drift d ON d.account_id = b.account_id
+            WHERE b.balance - COALESCE(e.total, 0) != COALESCE(d.drift, 0)
+        """)).scalar_one()
+        conn.execute(text("DROP TABLE IF EXISTS bench_balance_drift"))
+    return {
+        "unbalanced_transactions": unbalanced,
+        "entry_total": int(entry_total),
+        "balances_off_entry_sums": drifted,
+        "ok": unbalanced == 0 and entry_total == 0 and drifted == 0,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']} ({new['scenario']})")
+    print(f"{'endpoint':<18} {'rps':>16} {'p50 ms':>18} {'p99 ms':>18}")
+    for name in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        a, b = old["endpoints"].get(name, {}), new["endpoints"].get(name, {})
+        cols = [f"{a.get(key)} -> {b.get(key)}" for key in ("throughput_rps", "p50_ms", "p99_ms")]
+        print(f"{name:<18} {cols[0]:>16} {cols[1]:>18} {cols[2]:>18}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="uniform")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--assets", default="GOLD")
+    parser.add_argument("--zipf", type=float, help="override the scenario's skew")
+    parser.add_argument("--reads", type=float, help="override the scenario's read share")
+    parser.add_argument("--duplicates", type=float, help="override the scenario's retry share")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: results/<scenario>-<commit>.json)")
+    parser.add_argument("--no-verify", action="store_true", help="skip the ledger checks (slow on big populations)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    params = dict(SCENARIOS[args.scenario])
+    for key in ("zipf", "reads", "duplicates"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    engine = create_engine(DATABASE_URL)
+    first_user, last_user = user_range(engine)
+    if not args.no_verify:
+        snapshot_drift(engine)
+
+    print(f"Scenario {args.scenario} {params} over users {first_user}..{last_user}, "
+          f"{args.concurrency} workers for {args.duration:.0f}s")
+    result = run_scenario(args, params, first_user, last_user)
+    result.update({
+        "commit": git_commit(), "scenario": args.scenario, "params": params,
+        "users": [first_user, last_user], "concurrency": args.concurrency,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+    if not args.no_verify:
+        result["verification"] = verify_ledger(engine)
+
+    for name, endpoint in result["endpoints"].items():
+        print(f"  {name:<18} {endpoint['requests']:>7} req {endpoint['throughput_rps']:>8} rps  "
+              f"p50 {endpoint['p50_ms']}ms  p95 {endpoint['p95_ms']}ms  p99 {endpoint['p99_ms']}ms  "
+              f"deadlocks {endpoint['deadlocks']}  mismatched retries {endpoint['duplicate_mismatches']}")
+    if "verification" in result:
+        print(f"  ledger check: {result['verification']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.scenario}-{result['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {output}")
+    if "verification" in result and not result["verification"]["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
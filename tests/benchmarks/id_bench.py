@@ -0,0 +1,112 @@
+"""Insert throughput and index size: random uuid4 vs time-ordered uuid7 ids.
+
+Builds a throwaway schema per scheme with a ledger_transactions-like table
+(uuid primary key) and a ledger_entries-like table indexed on
+transaction_id, then loads `--rows` transactions (two entries each) in
+COPY batches, committing after each. Prints the insert rate per tenth of the
+load, which shows the slowdown once random ids make the indexes outgrow
+shared_buffers, and the final index sizes.
+
+    DATABASE_URL=postgresql://... python tests/benchmarks/id_bench.py --rows 10000000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import uuid
+
+from sqlalchemy import create_engine
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.db import DATABASE_URL
+from app.services.ids import uuid7
+
+TABLES_SQL = """
+    DROP SCHEMA IF EXISTS {schema} CASCADE;
+    CREATE SCHEMA {schema};
+    CREATE TABLE {schema}.ledger_transactions (id UUID PRIMARY KEY, amount BIGINT NOT NULL);
+    CREATE TABLE {schema}.ledger_entries (
+        id BIGSERIAL PRIMARY KEY,
+        transaction_id UUID NOT NULL,
+        amount BIGINT NOT NULL
+    );
+    CREATE INDEX idx_entries_transaction_id ON {schema}.ledger_entries(transaction_id);
+"""
+
+SIZES_SQL = """
+    SELECT pg_relation_size('{schema}.ledger_transactions_pkey'),
+           pg_relation_size('{schema}.idx_entries_transaction_id'),
+           pg_total_relation_size('{schema}.ledger_transactions') + pg_total_relation_size('{schema}.ledger_entries')
+"""
+
+SCHEMES = [("bench_ids_uuid4", uuid.uuid4), ("bench_ids_uuid7", uuid7)]
+
+def copy_batch(cursor, schema, ids):
+    transactions, entries = io.StringIO(), io.StringIO()
+    for transaction_id in ids:
+        transactions.write(f"{transaction_id}\t1\n")
+        entries.write(f"{transaction_id}\t-1\n{transaction_id}\t1\n")
+    transactions.seek(0)
+    entries.seek(0)
+    cursor.copy_expert(f"COPY {schema}.ledger_transactions (id, amount) FROM STDIN", transactions)
+    cursor.copy_expert(f"COPY {schema}.ledger_entries (transaction_id, amount) FROM STDIN", entries)
+
+def run(engine, schema, new_id, rows, batch):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(TABLES_SQL.format(schema=schema))
+
+    raw = engine.raw_connection()
+    rates = []
+    try:
+        cursor = raw.cursor()
+        step = max(rows // 10, batch)
+        done, step_done, step_time = 0, 0, 0.0
+        while done < rows:
+            count = min(batch, rows - done)
+            ids = [new_id() for _ in range(count)]
+            start = time.perf_counter()
+            copy_batch(cursor, schema, ids)
+            raw.commit()
+            step_time += time.perf_counter() - start
+            done += count
+            step_done += count
+            if step_done >= step or done == rows:
+                rates.append(step_done / step_time)
+                step_done, step_time = 0, 0.0
+        cursor.execute(SIZES_SQL.format(schema=schema))
+        sizes = cursor.fetchone()
+        raw.commit()
+    finally:
+        raw.close()
+    return rates, sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000, help="transactions per scheme")
+    parser.add_argument("--batch", type=int, default=10_000, help="transactions per COPY + commit")
+    parser.add_argument("--keep", action="store_true", help="keep the bench schemas for inspection")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    results = {}
+    try:
+        for schema, new_id in SCHEMES:
+            print(f"Loading {args.rows} transactions into {schema}...")
+            results[schema] = run(engine, schema, new_id, args.rows, args.batch)
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                for schema, _ in SCHEMES:
+                    conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+    print(f"\n{'loaded':>8}  " + "  ".join(f"{schema[10:]:>12}" for schema, _ in SCHEMES) + "   (transactions/s in each tenth)")
+    for i in range(len(results[SCHEMES[0][0]][0])):
+        loaded = f"{(i + 1) * 10}%"
+        print(f"{loaded:>8}  " + "  ".join(f"{results[schema][0][i]:>12.0f}" for schema, _ in SCHEMES))
+    mb = 1024 * 1024
+    for label, column in (("pkey MB", 0), ("entries idx MB", 1), ("total MB", 2)):
+        print(f"{label:>14}  " + "  ".join(f"{results[schema][1][column] / mb:>12.1f}" for schema, _ in SCHEMES))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Commit cost of the ledger integrity check vs. entries per transaction.
+
+Builds two throwaway schemas with minimal ledger tables: one with the old
+deferred FOR EACH ROW trigger (a SUM over the transaction per inserted row)
+and one with the statement-level transition-table trigger from 01_schema.sql.
+Each posting inserts N balanced entries in one statement and commits.
+
+    DATABASE_URL=postgresql://... python tests/benchmarks/integrity_bench.py --entries 2 10 100 1000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.db import DATABASE_URL
+
+TABLES_SQL = """
+    DROP SCHEMA IF EXISTS {schema} CASCADE;
+    CREATE SCHEMA {schema};
+    CREATE TABLE {schema}.ledger_transactions (id UUID PRIMARY KEY);
+    CREATE TABLE {schema}.ledger_entries (
+        id BIGSERIAL PRIMARY KEY,
+        transaction_id UUID NOT NULL REFERENCES {schema}.ledger_transactions(id),
+        account_id INTEGER NOT NULL,
+        amount BIGINT NOT NULL
+    );
+    CREATE INDEX ON {schema}.ledger_entries(transaction_id);
+"""
+
+ROW_TRIGGER_SQL = """
+    CREATE FUNCTION row_check() RETURNS TRIGGER AS $$
+    DECLARE
+        total_amount BIGINT;
+    BEGIN
+        SELECT SUM(amount) INTO total_amount FROM ledger_entries WHERE transaction_id = NEW.transaction_id;
+        IF COALESCE(total_amount, 0) != 0 THEN
+            RAISE EXCEPTION 'unbalanced';
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE CONSTRAINT TRIGGER ensure_ledger_balance
+    AFTER INSERT OR UPDATE ON ledger_entries
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW
+    EXECUTE FUNCTION row_check();
+"""
+
+STATEMENT_TRIGGER_SQL = """
+    CREATE FUNCTION statement_check() RETURNS TRIGGER AS $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM new_entries GROUP BY transaction_id HAVING SUM(amount) != 0) THEN
+            RAISE EXCEPTION 'unbalanced';
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER ensure_ledger_balance_insert
+    AFTER INSERT ON ledger_entries
+    REFERENCING NEW TABLE AS new_entries
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION statement_check();
+"""
+
+INSERT_SQL = text("""
+    WITH tx AS (INSERT INTO ledger_transactions (id) VALUES (:id) RETURNING id)
+    INSERT INTO ledger_entries (transaction_id, account_id, amount)
+    SELECT tx.id, g, CASE WHEN g % 2 = 0 THEN 1 ELSE -1 END
+    FROM tx, generate_series(1, :entries) AS g
+""")
+
+def setup(engine, schema, trigger_sql):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(TABLES_SQL.format(schema=schema))
+        conn.exec_driver_sql(f"SET LOCAL search_path TO {schema}")
+        conn.exec_driver_sql(trigger_sql)
+
+def run(engine, schema, entries, postings):
+    timings = []
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"SET search_path TO {schema}")
+        conn.commit()
+        for _ in range(postings):
+            start = time.perf_counter()
+            conn.execute(INSERT_SQL, {"id": uuid.uuid4(), "entries": entries})
+            conn.commit()
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[2, 10, 100, 1000])
+    parser.add_argument("--postings", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    variants = [("bench_row_trigger", ROW_TRIGGER_SQL), ("bench_statement_trigger", STATEMENT_TRIGGER_SQL)]
+    # Entries are +1/-1 pairs, so an odd count would never balance.
+    sizes = [n + n % 2 for n in args.entries]
+
+    print(f"{'entries/tx':>10}  {'row trigger':>12}  {'statement trigger':>18}   (median ms per insert + commit)")
+    try:
+        for entries in sizes:
+            medians = []
+            for schema, trigger_sql in variants:
+                setup(engine, schema, trigger_sql)
+                medians.append(run(engine, schema, entries, args.postings))
+            print(f"{entries:>10}  {medians[0]:>12.2f}  {medians[1]:>18.2f}")
+    finally:
+        with engine.begin() as conn:
+            for schema, _ in variants:
+                conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+if __name__ == "__main__":
+    main()
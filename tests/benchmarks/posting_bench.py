@@ -0,0 +1,125 @@
+"""Compare the ORM posting path the endpoints used to run with the ledger service.
+
+Reports SQL statements per request (COMMIT included) and latency percentiles
+for each path. Run it against a scratch database seeded with 01_schema.sql and
+02_seed.sql:
+
+    DATABASE_URL=postgresql://... python tests/benchmarks/posting_bench.py --requests 2000 --concurrency 16
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.db import SessionLocal, engine
+from app.models import Account, AssetType, Balance, LedgerEntry, LedgerTransaction, TransactionType
+from app.services import ledger
+from app.services.refdata import warm_reference_data
+from app.services.treasury import treasury_account_id
+
+USER_IDS = [1, 2]
+ASSET_CODE = "GOLD"
+
+_counter = threading.local()
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _counter.statements = getattr(_counter, "statements", 0) + 1
+
+@event.listens_for(engine, "commit")
+def _count_commit(conn):
+    _counter.statements = getattr(_counter, "statements", 0) + 1
+
+def legacy_post(db, tx_type, user_id, amount, idempotency_key):
+    # The per-endpoint ORM flow from before the ledger service, kept here as the baseline.
+    scoped_key = f"user_{user_id}:{idempotency_key}"
+    existing_tx = db.query(LedgerTransaction).filter(LedgerTransaction.idempotency_key == scoped_key).first()
+    if existing_tx:
+        return str(existing_tx.id)
+
+    asset = db.query(AssetType).filter(AssetType.code == ASSET_CODE).first()
+    user_account = db.query(Account).filter(Account.user_id == user_id, Account.asset_type_id == asset.id).first()
+    treasury_id = treasury_account_id(asset.id, user_id)
+
+    account_ids = sorted([user_account.id, treasury_id])
+    balances = db.query(Balance).filter(Balance.account_id.in_(account_ids)).order_by(Balance.account_id).with_for_update().all()
+    balance_map = {b.account_id: b for b in balances}
+    user_balance = balance_map[user_account.id]
+    treasury_balance = balance_map[treasury_id]
+
+    if tx_type == TransactionType.TOPUP:
+        source_id, target_id = treasury_id, user_account.id
+        user_balance.balance += amount
+        treasury_balance.balance -= amount
+    else:
+        if user_balance.balance < amount:
+            db.rollback()
+            raise ledger.InsufficientFunds("Insufficient funds")
+        source_id, target_id = user_account.id, treasury_id
+        user_balance.balance -= amount
+        treasury_balance.balance += amount
+
+    transaction_id = uuid.uuid4()
+    new_tx = LedgerTransaction(
+        id=transaction_id, type=tx_type, idempotency_key=scoped_key,
+        asset_type_id=asset.id, amount=amount, from_account_id=source_id, to_account_id=target_id
+    )
+    entries = [LedgerEntry(account_id=source_id, amount=-amount), LedgerEntry(account_id=target_id, amount=amount)]
+    entries.sort(key=lambda e: e.account_id)
+    new_tx.entries.extend(entries)
+    db.add(new_tx)
+    db.commit()
+    return str(transaction_id)
+
+def service_post(db, tx_type, user_id, amount, idempotency_key):
+    transaction_id, _ = ledger.post_user_transaction(db, tx_type, user_id, ASSET_CODE, amount, idempotency_key)
+    return transaction_id
+
+def run_one(post):
+    # Alternate topups and spends so balances stay roughly stable across runs.
+    tx_type = random.choice([TransactionType.TOPUP, TransactionType.SPEND])
+    db = SessionLocal()
+    _counter.statements = 0
+    start = time.perf_counter()
+    try:
+        post(db, tx_type, random.choice(USER_IDS), 1, uuid.uuid4().hex)
+    except ledger.InsufficientFunds:
+        pass
+    finally:
+        db.close()
+    return time.perf_counter() - start, _counter.statements
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def bench(name, post, requests, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: run_one(post), range(requests)))
+    latencies = [r[0] * 1000 for r in results]
+    statements = [r[1] for r in results]
+    print(
+        f"{name:<8} statements/request={sum(statements) / len(statements):5.2f}  "
+        f"p50={percentile(latencies, 50):7.2f}ms  p95={percentile(latencies, 95):7.2f}ms  "
+        f"p99={percentile(latencies, 99):7.2f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    warm_reference_data()
+
+    bench("legacy", legacy_post, args.requests, args.concurrency)
+    bench("service", service_post, args.requests, args.concurrency)
+
+if __name__ == "__main__":
+    main()
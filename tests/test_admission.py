@@ -0,0 +1,41 @@
+"""admit_posting against a stand-in endpoint, no database needed:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.schemas.transaction_schemas import BonusRequest
+from app.services import admission as admission_module
+from app.services.admission import AdmissionControl, admit_posting
+
+@pytest.fixture
+def client(monkeypatch):
+    # One posting per user per second, with a burst of two.
+    monkeypatch.setattr(admission_module, "admission", AdmissionControl(1, 2, 0, 0, 0, 0, 100))
+    app = FastAPI()
+
+    @app.post("/v1/bonus", dependencies=[Depends(admit_posting("userId"))])
+    def bonus(request: BonusRequest):
+        return {"userId": request.userId}
+
+    return TestClient(app)
+
+def bonus(client, user_id):
+    body = {"userId": user_id, "assetCode": "GOLD", "amount": 1, "idempotencyKey": "k"}
+    return client.post("/v1/bonus", json=body).status_code
+
+@pytest.mark.parametrize("user_id", [1, "1", " 1 ", 1.0])
+def test_user_rate_limit_applies_however_the_id_is_written(client, user_id):
+    assert [bonus(client, user_id) for _ in range(4)] == [200, 200, 429, 429]
+
+def test_quoted_and_plain_ids_share_a_bucket(client):
+    assert [bonus(client, 1), bonus(client, "1"), bonus(client, 1), bonus(client, 2)] == [200, 200, 429, 200]
+
+def test_unparseable_id_is_a_validation_error(client):
+    assert bonus(client, "one") == 422
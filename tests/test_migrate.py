@@ -0,0 +1,69 @@
+"""split_statements (scripts/sql_statements.py), which scripts/migrate.py runs
+on every container start before the API serves requests. Standard library
+only, so this needs nothing but pytest:
+
+    python -m pytest tests/test_migrate.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from sql_statements import MigrationError, split_statements
+
+def statements(sql):
+    return [statement for _, statement in split_statements(sql)]
+
+def test_splits_on_semicolons_and_records_lines():
+    sql = "CREATE TABLE a (id int);\n\nCREATE TABLE b (id int);\n"
+    assert split_statements(sql) == [(1, "CREATE TABLE a (id int)"), (3, "CREATE TABLE b (id int)")]
+
+def test_dollar_quoted_function_body_stays_whole():
+    sql = (
+        "CREATE FUNCTION f() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        "    PERFORM 1;\n"
+        "    RETURN NEW;\n"
+        "END;\n"
+        "$$ LANGUAGE plpgsql;\n"
+        "SELECT 1;\n"
+    )
+    assert statements(sql) == [sql[:sql.index(";\nSELECT 1")], "SELECT 1"]
+
+def test_tagged_dollar_quote_ignores_inner_plain_dollar_quotes():
+    sql = "DO $fn$ BEGIN EXECUTE $$ SELECT 1; $$; END $fn$;\nSELECT 2;"
+    assert statements(sql) == ["DO $fn$ BEGIN EXECUTE $$ SELECT 1; $$; END $fn$", "SELECT 2"]
+
+def test_positional_parameters_are_not_dollar_quotes():
+    sql = "PREPARE p AS SELECT $1 + $2;\nSELECT 3;"
+    assert statements(sql) == ["PREPARE p AS SELECT $1 + $2", "SELECT 3"]
+
+def test_semicolons_in_comments_are_ignored():
+    sql = (
+        "-- drop it; then recreate;\n"
+        "SELECT 1; /* a; /* nested; */ still a comment; */\n"
+        "SELECT 2 -- trailing;\n"
+        ";\n"
+        "-- only a comment;\n"
+    )
+    assert statements(sql) == ["SELECT 1", "SELECT 2 -- trailing;"]
+
+def test_semicolons_in_string_literals_and_identifiers():
+    sql = "SELECT 'it''s; fine', E'back\\'slash;', \"odd;name\" FROM t;\nSELECT 4;"
+    assert statements(sql) == ["SELECT 'it''s; fine', E'back\\'slash;', \"odd;name\" FROM t", "SELECT 4"]
+
+def test_trailing_statement_without_semicolon():
+    assert split_statements("SELECT 1;\nSELECT 2\n") == [(1, "SELECT 1"), (2, "SELECT 2")]
+
+def test_unterminated_dollar_quote_names_the_line():
+    with pytest.raises(MigrationError, match="line 2"):
+        split_statements("SELECT 1;\nDO $$ BEGIN PERFORM 1;\n")
+
+@pytest.mark.parametrize("directory", ["init", "migrations"])
+def test_shipped_scripts_split(directory):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", directory)
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".sql"):
+            with open(os.path.join(path, name)) as f:
+                assert split_statements(f.read()), name